@@ -1,5 +1,8 @@
 
-from typing import Dict, List, Tuple, Optional
+import hashlib
+from typing import Dict, List, Sequence, Tuple, Optional
+
+import numpy as np
 
 # Standard genetic code mapping AA -> codons (for 20 AAs + stop; STOP not used for scoring)
 AA_TO_CODONS = {
@@ -31,6 +34,86 @@ for aa, codons in AA_TO_CODONS.items():
     for c in codons:
         CODON_TO_AA[c] = aa
 
+# Integer codon encoding: index = 16*b0 + 4*b1 + b2 with A=0, C=1, G=2, T=3.
+NUCLEOTIDES = "ACGT"
+CODONS: List[str] = [a + b + c for a in NUCLEOTIDES for b in NUCLEOTIDES for c in NUCLEOTIDES]
+CODON_INDEX: Dict[str, int] = {c: i for i, c in enumerate(CODONS)}
+
+_NT_LOOKUP = np.full(256, 255, dtype=np.uint8)
+for _i, _b in enumerate(NUCLEOTIDES):
+    _NT_LOOKUP[ord(_b)] = _i
+    _NT_LOOKUP[ord(_b.lower())] = _i
+_NT_LOOKUP[ord("U")] = _NT_LOOKUP[ord("u")] = 3
+
+# Synonymous families over the 20 sense amino acids, in AA_TO_CODONS order.
+# CODON_FAMILY[j] is the family of CODONS[j] (-1 for stops); FAMILY_CODONS[f] lists the codon
+# indices of family f in AA_TO_CODONS order, padded with -1.
+SENSE_AAS: List[str] = [aa for aa in AA_TO_CODONS if aa != "*"]
+CODON_FAMILY = np.full(64, -1, dtype=np.int64)
+FAMILY_CODONS = np.full((len(SENSE_AAS), max(len(c) for c in AA_TO_CODONS.values())), -1, dtype=np.int64)
+for _f, _aa in enumerate(SENSE_AAS):
+    for _k, _c in enumerate(AA_TO_CODONS[_aa]):
+        CODON_FAMILY[CODON_INDEX[_c]] = _f
+        FAMILY_CODONS[_f, _k] = CODON_INDEX[_c]
+FAMILY_MASK = CODON_FAMILY[None, :] == np.arange(len(SENSE_AAS))[:, None]
+
+_AA_LOOKUP = np.full(256, -1, dtype=np.int64)
+for _f, _aa in enumerate(SENSE_AAS):
+    _AA_LOOKUP[ord(_aa)] = _AA_LOOKUP[ord(_aa.lower())] = _f
+
+def encode_protein(aa_seq: str) -> np.ndarray:
+    """Family index (into SENSE_AAS) per residue; stops and unknown residues are -1."""
+    return _AA_LOOKUP[np.frombuffer(aa_seq.strip().encode("ascii", errors="replace"), dtype=np.uint8)]
+
+def encode_nucleotides(seqs: Sequence[str]) -> np.ndarray:
+    """
+    Encode N equal-length sequences into an (N, len) uint8 matrix (A=0, C=1, G=2, T/U=3).
+    Any other character is encoded as 255.
+    """
+    if not seqs:
+        return np.zeros((0, 0), dtype=np.uint8)
+    n = len(seqs[0])
+    if any(len(s) != n for s in seqs):
+        raise ValueError("encode_nucleotides expects equal-length sequences.")
+    buf = "".join(seqs).encode("ascii", errors="replace")
+    return _NT_LOOKUP[np.frombuffer(buf, dtype=np.uint8)].reshape(len(seqs), n)
+
+def encode_codon_matrix(seqs: Sequence[str]) -> np.ndarray:
+    """
+    Encode N equal-length CDS strings into an (N, L) int16 matrix of codon indices into CODONS.
+    Trailing partial codons are dropped; codons containing non-ACGT characters are encoded as -1.
+    """
+    nt = encode_nucleotides(seqs)
+    L = nt.shape[1] // 3
+    trip = nt[:, :3 * L].reshape(nt.shape[0], L, 3).astype(np.int16)
+    idx = trip[:, :, 0] * 16 + trip[:, :, 1] * 4 + trip[:, :, 2]
+    idx[(trip > 3).any(axis=2)] = -1
+    return idx
+
+def decode_codon_matrix(idx: np.ndarray) -> List[str]:
+    """Inverse of encode_codon_matrix for matrices without invalid (-1) entries."""
+    table = np.array(CODONS)
+    return ["".join(row) for row in table[np.asarray(idx)]]
+
+def pack_2bit(dna: str) -> bytes:
+    """Pack an ACGT/U sequence at 2 bits per base (A=0, C=1, G=2, T=3; last byte zero-padded)."""
+    codes = _NT_LOOKUP[np.frombuffer(dna.encode("ascii", errors="replace"), dtype=np.uint8)]
+    if (codes > 3).any():
+        raise ValueError("pack_2bit expects a sequence of A/C/G/T/U only.")
+    pad = (-len(codes)) % 4
+    if pad:
+        codes = np.concatenate([codes, np.zeros(pad, dtype=np.uint8)])
+    q = codes.reshape(-1, 4)
+    return (q[:, 0] << 6 | q[:, 1] << 4 | q[:, 2] << 2 | q[:, 3]).astype(np.uint8).tobytes()
+
+def sequence_key(dna: str) -> bytes:
+    """16-byte digest of the 2-bit packed sequence and its length (case and U/T insensitive)."""
+    try:
+        body = pack_2bit(dna)
+    except ValueError:
+        body = b"raw:" + dna.upper().encode("utf-8")
+    return hashlib.blake2b(len(dna).to_bytes(8, "little") + body, digest_size=16).digest()
+
 def chunk_codons(dna: str) -> List[str]:
     dna = dna.upper().replace("U", "T")
     n = (len(dna) // 3) * 3
@@ -65,7 +148,9 @@ def sample_codon_for_aa(
     usage: Dict[str, float],
     temperature: float = 1.0,
     exclude_codons: Optional[List[str]] = None,
+    rng: Optional[np.random.Generator] = None,
 ) -> str:
+    """Sample a synonymous codon by tempered usage; draws from `rng` if given, else the global `random` module."""
     codons = AA_TO_CODONS.get(amino_acid, [])
     if not codons:
         return "NNN"
@@ -81,7 +166,7 @@ def sample_codon_for_aa(
     exps = [math.exp(x - mx) for x in logs]
     s = sum(exps)
     probs = [e/s for e in exps]
-    r = random.random()
+    r = rng.random() if rng is not None else random.random()
     cum = 0.0
     for c,p in zip(candidates, probs):
         cum += p
@@ -95,37 +180,29 @@ def constrained_decode(
     motifs_forbidden: Optional[List[str]] = None,
     max_attempts_per_pos: int = 5,
     temperature: float = 1.0,
-) -> str:
+    max_backtrack: int = 4,
+    return_result: bool = False,
+    rng: Optional[np.random.Generator] = None,
+):
     """
-    Greedy left-to-right decoding with per-step resampling to avoid forbidden motifs.
+    Left-to-right decoding that only samples codons which do not complete a forbidden motif.
+    The motif automaton state is tracked incrementally (O(1) check per codon); dead ends are
+    resolved by backtracking up to `max_backtrack` positions. A forbidden motif is emitted only
+    when no legal continuation exists within that window; pass return_result=True to get a
+    decoding.DecodeResult reporting such violations instead of the bare DNA string.
     Does not append terminal STOP; starts with ATG for 'M' if first AA.
+    max_attempts_per_pos is kept for compatibility; sampling is restricted to legal codons directly.
+    Pass a NumPy Generator as `rng` for an independent, reproducible stream (default: global `random`).
     """
-    import random
-    dna = []
-    aa_seq = protein_aa.strip().upper()
-    for i, aa in enumerate(aa_seq):
-        attempts = 0
-        chosen = None
-        while attempts < max_attempts_per_pos:
-            attempts += 1
-            if i == 0 and aa == "M":
-                cand = "ATG"
-            else:
-                cand = sample_codon_for_aa(aa, usage, temperature=temperature)
-            trial = "".join(dna) + cand
-            if not motifs_forbidden:
-                chosen = cand; break
-            bad = False
-            for m in motifs_forbidden:
-                mm = m.upper().replace("U","T")
-                if mm in trial:
-                    bad = True; break
-            if not bad:
-                chosen = cand; break
-        if chosen is None:
-            chosen = sample_codon_for_aa(aa, usage, temperature=temperature)
-        dna.append(chosen)
-    return "".join(dna)
+    from .decoding import automaton_decode
+    from .motifs import compile_motifs
+
+    def propose(i: int, aa: str, allowed: List[str]) -> Tuple[str, float]:
+        exclude = [c for c in AA_TO_CODONS.get(aa, []) if c not in allowed]
+        return sample_codon_for_aa(aa, usage, temperature=temperature, exclude_codons=exclude, rng=rng), 0.0
+
+    res = automaton_decode(protein_aa, propose, compile_motifs(motifs_forbidden), max_backtrack=max_backtrack)
+    return res if return_result else res.dna
 
 def relative_adaptiveness_from_usage(usage: Dict[str, float]) -> Dict[str, float]:
     """
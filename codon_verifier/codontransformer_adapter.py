@@ -13,17 +13,23 @@ Design goals:
         method: str = "transformer",
         temperature: float = 1.0,
         top_k: int = 50,
-        beam_size: int = 0) -> list[str]
+        beam_size: int = 0,
+        motifs_forbidden: list[str] | None = None) -> list[str]
 
 This module does not impose any scoring/ranking; it only generates candidates.
 Constraint filtering and downstream scoring should be handled by caller.
 """
 
+from dataclasses import dataclass
+from functools import lru_cache
 from typing import List, Dict, Optional
-import math
 import random
 
-from .codon_utils import AA_TO_CODONS
+import numpy as np
+
+from .codon_utils import AA_TO_CODONS, CODONS, CODON_INDEX
+from .context import ScoringContext
+from .decoding import beam_decode, viterbi_decode
 from .hosts import tables
 
 
@@ -50,58 +56,93 @@ def _host_usage(host: str) -> Dict[str, float]:
     raise KeyError(f"Host '{host}' is not registered in codontransformer_adapter")
 
 
-def _hfc_sequence(aa: str, usage: Dict[str, float]) -> str:
-    # High-frequency choice per amino acid family
-    aa = aa.strip().upper()
-    out: List[str] = []
-    for i, a in enumerate(aa):
-        if i == 0 and a == "M":
-            out.append("ATG"); continue
-        codons = AA_TO_CODONS.get(a, [])
-        if not codons:
-            continue
-        best = max(codons, key=lambda c: usage.get(c, 0.0))
-        out.append(best)
-    return "".join(out)
-
-
-def _bfc_sequence(aa: str, usage: Dict[str, float]) -> str:
-    # Sample codons proportionally to usage within each family (background freq)
-    aa = aa.strip().upper()
-    out: List[str] = []
-    for i, a in enumerate(aa):
-        if i == 0 and a == "M":
-            out.append("ATG"); continue
-        codons = AA_TO_CODONS.get(a, [])
-        if not codons:
-            continue
-        fam = [c for c in codons if c in usage]
-        if not fam:
-            fam = list(codons)
-        total = sum(max(1e-9, usage.get(c, 1e-9)) for c in fam)
-        r = random.random(); cum = 0.0
-        chosen = fam[-1]
-        for c in fam:
-            p = max(1e-9, usage.get(c, 1e-9))/total if total > 0 else 1.0/len(fam)
-            cum += p
-            if r <= cum:
-                chosen = c; break
-        out.append(chosen)
-    return "".join(out)
-
-
-def _urc_sequence(aa: str) -> str:
-    # Uniform random per family
-    aa = aa.strip().upper()
-    out: List[str] = []
-    for i, a in enumerate(aa):
-        if i == 0 and a == "M":
-            out.append("ATG"); continue
-        codons = AA_TO_CODONS.get(a, [])
-        if not codons:
-            continue
-        out.append(random.choice(codons))
-    return "".join(out)
+# Residue families for the baseline samplers, in AA_TO_CODONS order (20 sense families plus "*").
+_FAMILY_AAS: List[str] = list(AA_TO_CODONS)
+_FAMILY_LOOKUP = np.full(256, -1, dtype=np.int64)
+_FAMILY_CODON_IDX = np.zeros((len(_FAMILY_AAS), max(len(c) for c in AA_TO_CODONS.values())), dtype=np.int64)
+for _f, _a in enumerate(_FAMILY_AAS):
+    _FAMILY_LOOKUP[ord(_a)] = _f
+    for _k, _c in enumerate(AA_TO_CODONS[_a]):
+        _FAMILY_CODON_IDX[_f, _k] = CODON_INDEX[_c]
+_CODON_BYTES = np.array(CODONS, dtype="S3")
+
+
+@dataclass(frozen=True)
+class FamilyTables:
+    """
+    Residue-family sampling tables for one usage table (rows follow AA_TO_CODONS order, columns the
+    family's codons, padded): cumulative BFC and URC probabilities, and the HFC codon index per family.
+    """
+    bfc_cum: np.ndarray
+    urc_cum: np.ndarray
+    hfc: np.ndarray
+
+
+def family_tables(usage: Dict[str, float]) -> FamilyTables:
+    n_fam, width = _FAMILY_CODON_IDX.shape
+    bfc = np.zeros((n_fam, width))
+    urc = np.zeros((n_fam, width))
+    hfc = np.zeros(n_fam, dtype=np.int64)
+    for f, a in enumerate(_FAMILY_AAS):
+        codons = AA_TO_CODONS[a]
+        # BFC samples among the family codons present in the usage table (all of them if none is)
+        fam = [c for c in codons if c in usage] or list(codons)
+        w = np.array([max(1e-9, usage.get(c, 1e-9)) if c in fam else 0.0 for c in codons])
+        bfc[f, :len(codons)] = np.cumsum(w / w.sum())
+        urc[f, :len(codons)] = np.arange(1, len(codons) + 1) / len(codons)
+        # cumulative rows end at exactly 1 so a draw in (0, 1] never lands on padding
+        bfc[f, len(codons) - 1:] = urc[f, len(codons) - 1:] = 1.0
+        hfc[f] = int(np.argmax([usage.get(c, 0.0) for c in codons]))
+    return FamilyTables(bfc, urc, hfc)
+
+
+@lru_cache(maxsize=None)
+def _host_tables(host_key: str) -> FamilyTables:
+    return family_tables(_host_usage(host_key))
+
+
+@lru_cache(maxsize=None)
+def _host_context(host_key: str) -> ScoringContext:
+    # usage only: no host ships a codon-pair (CPB) table
+    return ScoringContext(_host_usage(host_key))
+
+
+def _residue_families(aa: str) -> np.ndarray:
+    # residues outside AA_TO_CODONS are skipped, as in the per-residue samplers
+    fam = _FAMILY_LOOKUP[np.frombuffer(aa.strip().upper().encode("ascii", errors="replace"), dtype=np.uint8)]
+    return fam[fam >= 0]
+
+
+def _decode_rows(idx: np.ndarray) -> List[str]:
+    if idx.shape[1] == 0:
+        return [""] * idx.shape[0]
+    rows = np.ascontiguousarray(_CODON_BYTES[idx]).view(f"S{3 * idx.shape[1]}").ravel()
+    return [r.decode("ascii") for r in rows.tolist()]
+
+
+def sample_codon_matrix(
+    aa: str, cum: np.ndarray, n: int, rng: Optional[np.random.Generator] = None,
+) -> np.ndarray:
+    """
+    Draw an (n, L) matrix of codon indices (into codon_utils.CODONS) for protein `aa` from a
+    FamilyTables cumulative table, with one uniform draw per cell and one searchsorted per family.
+    Without `rng` a Generator is seeded from the global `random` module.
+    """
+    if rng is None:
+        rng = np.random.default_rng(random.getrandbits(64))
+    fam = _residue_families(aa)
+    u = 1.0 - rng.random((max(0, n), fam.size))
+    k = np.empty(u.shape, dtype=np.int64)
+    for f in np.unique(fam):
+        cols = fam == f
+        k[:, cols] = np.searchsorted(cum[f], u[:, cols])
+    return _FAMILY_CODON_IDX[fam, k]
+
+
+@lru_cache(maxsize=1024)
+def _hfc_for_host(aa: str, host_key: str) -> str:
+    fam = _residue_families(aa)
+    return _decode_rows(_FAMILY_CODON_IDX[fam, _host_tables(host_key).hfc[fam]][None, :])[0]
 
 
 def generate_sequences(
@@ -113,6 +154,8 @@ def generate_sequences(
     top_k: int = 50,
     beam_size: int = 0,
     seed: Optional[int] = None,
+    motifs_forbidden: Optional[List[str]] = None,
+    rng: Optional[np.random.Generator] = None,
 ) -> List[str]:
     """
     Generate N DNA candidates for a protein AA sequence using the requested method.
@@ -122,12 +165,25 @@ def generate_sequences(
       - "HFC": highest-frequency choice per family
       - "BFC": sample by background frequency
       - "URC": uniform random choice
+      - "DP": exact max log-CAI sequence avoiding motifs_forbidden (k-best Viterbi;
+        returns up to N distinct sequences, best first)
+      - "BEAM": beam search over usage log-probabilities, CAI and GC with motif avoidance
+        (beam width max(beam_size, N); returns the N best, best first)
+
+    DP and BEAM use the cached per-host usage context, which has no codon-pair table, so their
+    objectives carry no CPB term here (call decoding.viterbi_decode / beam_decode with a context
+    holding a CPB table for that).
+
+    HFC is deterministic and memoized per (aa, host). BFC/URC draw the whole (n x L) codon matrix at
+    once from per-host cumulative tables, using `rng` (a NumPy Generator) when given, otherwise a
+    Generator seeded from the global `random` module, which `seed` re-seeds.
     """
     if seed is not None:
         random.seed(seed)
 
     method_up = method.strip().upper()
-    usage = _host_usage(host)
+    host_key = host.strip().lower()
+    ctx = _host_context(host_key)
 
     if method_up == "TRANSFORMER":
         if not _HAS_CT:
@@ -141,17 +197,21 @@ def generate_sequences(
         # return list(sequences)
         raise NotImplementedError("Wire CodonTransformer API here (predict_dna_sequence).")
 
-    out: List[str] = []
-    for _ in range(max(1, n)):
-        if method_up == "HFC":
-            out.append(_hfc_sequence(aa, usage))
-        elif method_up == "BFC":
-            out.append(_bfc_sequence(aa, usage))
-        elif method_up == "URC":
-            out.append(_urc_sequence(aa))
-        else:
-            # default fallback: BFC with temperature-like diversity via Dirichlet noise
-            out.append(_bfc_sequence(aa, usage))
-    return out
-
-
+    if method_up == "DP":
+        results = viterbi_decode(aa, context=ctx, motifs=motifs_forbidden, k=max(1, n))
+        return [r.dna for r in results]
+
+    if method_up == "BEAM":
+        results = beam_decode(
+            aa, context=ctx, motifs=motifs_forbidden,
+            beam_width=max(beam_size, n, 1), n=max(1, n), temperature=temperature,
+        )
+        return [r.dna for r in results]
+
+    n = max(1, n)
+    if method_up == "HFC":
+        return [_hfc_for_host(aa, host_key)] * n
+    if method_up == "URC":
+        return _decode_rows(sample_codon_matrix(aa, _host_tables(host_key).urc_cum, n, rng))
+    # "BFC", and the default fallback for unknown methods
+    return _decode_rows(sample_codon_matrix(aa, _host_tables(host_key).bfc_cum, n, rng))
@@ -0,0 +1,159 @@
+"""
+Precompiled per-host scoring tables.
+
+A ScoringContext is built once per host (or per usage/tRNA/CPB combination) and
+holds every usage-derived table that the metric functions would otherwise
+rebuild on each call: relative adaptiveness (CAI w), tAI-normalised tRNA
+weights, their logs as dicts and 64-entry arrays, rare-codon thresholds and a
+dense codon-pair table. Metrics, rules_score, combine_reward and the surrogate
+featurizer all accept `context=`.
+"""
+from __future__ import annotations
+
+import math
+from collections import defaultdict
+from functools import cached_property, lru_cache
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+import numpy as np
+
+from .codon_utils import AA_TO_CODONS, CODON_TO_AA, CODONS, CODON_INDEX, relative_adaptiveness_from_usage
+from .hosts.tables import get_host_tables
+from .motifs import MotifScanner, compile_motifs
+
+
+def _trna_relative(trna_w: Dict[str, float]) -> Dict[str, float]:
+    """tAI weights normalised by the family maximum (same convention as metrics.tai)."""
+    fam_max = defaultdict(float)
+    for aa, codons in AA_TO_CODONS.items():
+        for c in codons:
+            fam_max[aa] = max(fam_max[aa], trna_w.get(c, 0.0))
+    rel = {}
+    for c, aa in CODON_TO_AA.items():
+        denom = fam_max[aa] if fam_max[aa] > 0 else 1.0
+        rel[c] = trna_w.get(c, 0.0) / denom
+    return rel
+
+
+class ScoringContext:
+    """
+    Usage-derived lookup tables for one host, computed once and shared across calls.
+    - w / log_w_map: CAI relative adaptiveness and log(max(1e-9, w)) per codon
+    - trna_rel / log_trna_map: family-normalised tRNA weights (None without a tRNA table)
+    - log_w / log_trna / pair_tables: the same as arrays indexed like codon_utils.CODONS
+    - rare_codons(quantile): codons at or below the per-family rare threshold
+    - scanner: compiled forbidden-motif automaton for `motifs` (both strands, IUPAC)
+    """
+
+    def __init__(
+        self,
+        usage: Dict[str, float],
+        trna_w: Optional[Dict[str, float]] = None,
+        cpb: Optional[Dict[str, float]] = None,
+        motifs: Optional[List[str]] = None,
+        host: Optional[str] = None,
+    ):
+        self.host = host
+        self.usage = usage
+        self.trna_w = trna_w
+        self.cpb = cpb
+        self.motifs: Tuple[str, ...] = tuple(motifs or ())
+        self.w = relative_adaptiveness_from_usage(usage)
+        self.log_w_map = {c: math.log(max(1e-9, self.w.get(c, 1e-3))) for c in CODONS}
+        self.trna_rel = _trna_relative(trna_w) if trna_w is not None else None
+        self.log_trna_map = (
+            {c: math.log(max(1e-9, v)) for c, v in self.trna_rel.items()}
+            if self.trna_rel is not None else None
+        )
+        self._rare: Dict[float, FrozenSet[str]] = {}
+
+    @classmethod
+    def for_host(
+        cls,
+        host: str,
+        cpb: Optional[Dict[str, float]] = None,
+        motifs: Optional[List[str]] = None,
+    ) -> "ScoringContext":
+        """Build a context from hosts.tables.HOST_TABLES (raises ValueError for unknown hosts)."""
+        usage, trna_w = get_host_tables(host)
+        return cls(usage, trna_w, cpb=cpb, motifs=motifs, host=host)
+
+    def rare_codons(self, quantile: float = 0.2) -> FrozenSet[str]:
+        """Sense codons whose w is at or below the `quantile` order statistic of their family."""
+        if quantile not in self._rare:
+            rare = set()
+            for aa, cods in AA_TO_CODONS.items():
+                vals = sorted(self.w[c] for c in cods if c in self.w)
+                if not vals or aa == "*":
+                    continue
+                thr = vals[max(0, min(len(vals)-1, int(quantile*len(vals))))]
+                rare.update(c for c in cods if self.w.get(c, 0.0) <= thr)
+            self._rare[quantile] = frozenset(rare)
+        return self._rare[quantile]
+
+    @property
+    def scanner(self) -> MotifScanner:
+        return compile_motifs(self.motifs)
+
+    def rare_mask(self, quantile: float = 0.2) -> np.ndarray:
+        rare = self.rare_codons(quantile)
+        return np.array([c in rare for c in CODONS])
+
+    @cached_property
+    def log_w(self) -> np.ndarray:
+        return np.array([self.log_w_map[c] for c in CODONS])
+
+    @cached_property
+    def log_trna(self) -> Optional[np.ndarray]:
+        if self.log_trna_map is None:
+            return None
+        return np.array([self.log_trna_map[c] for c in CODONS])
+
+    @cached_property
+    def pair_tables(self) -> Tuple[np.ndarray, np.ndarray]:
+        """(values, present-mask) over flattened codon pairs a*64+b for the CPB table."""
+        pair_val = np.zeros(64*64)
+        pair_mask = np.zeros(64*64, dtype=bool)
+        for key, v in (self.cpb or {}).items():
+            a, _, b = key.partition("-")
+            if a in CODON_INDEX and b in CODON_INDEX:
+                k = CODON_INDEX[a]*64 + CODON_INDEX[b]
+                pair_val[k] = v
+                pair_mask[k] = True
+        return pair_val, pair_mask
+
+
+@lru_cache(maxsize=32)
+def _cached_host_context(host: str, motifs: Tuple[str, ...]) -> ScoringContext:
+    return ScoringContext.for_host(host, motifs=list(motifs))
+
+
+def get_scoring_context(host: str, motifs: Optional[List[str]] = None) -> ScoringContext:
+    """Process-wide cached context for a host in HOST_TABLES (without CPB)."""
+    return _cached_host_context(host, tuple(motifs or ()))
+
+
+def resolve_context(
+    context: Optional[ScoringContext],
+    usage: Optional[Dict[str, float]] = None,
+    trna_w: Optional[Dict[str, float]] = None,
+    cpb: Optional[Dict[str, float]] = None,
+) -> ScoringContext:
+    """
+    Return `context` when the explicitly passed tables are absent or are the ones it was built from;
+    otherwise build a fresh context with the explicit tables taking precedence.
+    """
+    if context is not None:
+        if (usage is None or usage is context.usage) and (trna_w is None or trna_w is context.trna_w) \
+                and (cpb is None or cpb is context.cpb):
+            return context
+        return ScoringContext(
+            usage if usage is not None else context.usage,
+            trna_w if trna_w is not None else context.trna_w,
+            cpb=cpb if cpb is not None else context.cpb,
+            motifs=list(context.motifs),
+            host=context.host,
+        )
+    if usage is None:
+        raise ValueError("A codon usage table or a ScoringContext is required.")
+    return ScoringContext(usage, trna_w, cpb=cpb)
@@ -0,0 +1,323 @@
+"""
+Constraint-aware codon decoders built on the compiled motif automaton.
+
+Decoders track the Aho-Corasick state of the emitted prefix, so checking
+whether a candidate codon completes a forbidden motif is a table lookup
+(motifs.MotifScanner.codon_table) instead of a rescan of the whole prefix.
+"""
+from __future__ import annotations
+
+import heapq
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from .codon_utils import AA_TO_CODONS, CODON_INDEX, CODONS, FAMILY_MASK
+from .context import ScoringContext, resolve_context
+from .motifs import MotifScanner, compile_motifs
+
+# propose(position, amino_acid, allowed_codons) -> (codon, logp)
+Proposer = Callable[[int, str, List[str]], Tuple[str, float]]
+
+
+@dataclass
+class DecodeResult:
+    """Outcome of a constrained decode; violations > 0 means no motif-free sequence was found."""
+    dna: str
+    logp: float = 0.0
+    score: float = 0.0
+    violations: int = 0
+    backtracks: int = 0
+    forced_positions: List[int] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return self.violations == 0
+
+
+def automaton_decode(
+    aa_seq: str,
+    propose: Proposer,
+    scanner: MotifScanner,
+    max_backtrack: int = 4,
+    fixed_start: bool = True,
+) -> DecodeResult:
+    """
+    Left-to-right decoding with O(1) motif checks per codon and bounded backtracking.
+
+    At each position only codons that do not complete a forbidden motif from the current automaton
+    state are offered to `propose`. When none is legal the decoder rewinds up to `max_backtrack`
+    positions behind the furthest position reached, excluding the codons already tried. If that
+    window is exhausted, the codon completing the fewest hits is emitted and counted as a violation,
+    and the decoder never rewinds past it again.
+    """
+    aa_seq = aa_seq.strip().upper()
+    n = len(aa_seq)
+    nxt, hits = scanner.codon_lists
+    codons: List[str] = []
+    logps: List[float] = []
+    states: List[int] = [0]
+    excluded: List[Set[str]] = [set() for _ in range(n)]
+    result = DecodeResult(dna="")
+    frontier = 0
+    floor = 0
+    i = 0
+    while i < n:
+        aa = aa_seq[i]
+        family = ["ATG"] if (fixed_start and i == 0 and aa == "M") else AA_TO_CODONS.get(aa, [])
+        state = states[i]
+        if not family:
+            # unknown residue: delegate to the proposer and feed its codon through the automaton
+            codon, lp = propose(i, aa, [])
+            new_state, n_hits = scanner.advance(state, codon)
+            result.violations += n_hits
+            codons.append(codon); logps.append(lp); states.append(new_state)
+            i += 1
+            frontier = max(frontier, i)
+            continue
+        row = hits[state]
+        legal = [c for c in family if c not in excluded[i] and row[CODON_INDEX[c]] == 0]
+        if legal:
+            if fixed_start and i == 0 and aa == "M":
+                codon, lp = "ATG", 0.0
+            else:
+                codon, lp = propose(i, aa, legal)
+        elif i > floor and i > frontier - max_backtrack:
+            # dead end: rewind one position and forbid the codon that led here
+            excluded[i].clear()
+            i -= 1
+            excluded[i].add(codons.pop())
+            logps.pop(); states.pop()
+            result.backtracks += 1
+            continue
+        else:
+            fewest = min(row[CODON_INDEX[c]] for c in family)
+            least_bad = [c for c in family if row[CODON_INDEX[c]] == fewest]
+            codon, lp = propose(i, aa, least_bad)
+            if fewest:
+                result.violations += fewest
+                result.forced_positions.append(i)
+            floor = i + 1
+        codons.append(codon); logps.append(lp)
+        states.append(nxt[state][CODON_INDEX[codon]])
+        i += 1
+        frontier = max(frontier, i)
+    result.dna = "".join(codons)
+    result.logp = sum(logps)
+    return result
+
+
+# Per-hit penalty that makes motif avoidance take strict priority over the DP objective
+_HIT_PENALTY = 1e6
+
+
+def viterbi_decode(
+    aa_seq: str,
+    usage: Optional[Dict[str, float]] = None,
+    cpb: Optional[Dict[str, float]] = None,
+    motifs: Optional[List[str]] = None,
+    context: Optional[ScoringContext] = None,
+    k: int = 1,
+    w_cpb: float = 1.0,
+    fixed_start: bool = True,
+) -> List[DecodeResult]:
+    """
+    Exact codon optimisation by dynamic programming over positions.
+
+    Maximises  sum_i log w(c_i) + w_cpb * sum_i cpb(c_{i-1}, c_i)  (log-CAI numerator plus codon-pair
+    bias) subject to motif avoidance. States are (previous codon, motif-automaton state), so the run
+    time is linear in protein length. Returns the k best sequences (k-best Viterbi), best first.
+    If every path contains a forbidden motif, the paths with the fewest hits are returned and
+    `violations` reports the count.
+    """
+    aa_seq = aa_seq.strip().upper()
+    ctx = resolve_context(context, usage, cpb=cpb)
+    scanner = compile_motifs(motifs if motifs is not None else list(ctx.motifs))
+    nxt, hits = scanner.codon_lists
+    log_w = ctx.log_w.tolist()
+    pair_val = ctx.pair_tables[0].tolist() if ctx.cpb is not None and w_cpb else None
+    k = max(1, k)
+
+    # layer entries: key (codon, automaton state) -> list of (score, prev key, prev rank) sorted desc
+    Key = Tuple[int, int]
+    layers: List[Dict[Key, List[Tuple[float, Optional[Key], int]]]] = []
+    frontier: Dict[Key, List[Tuple[float, Optional[Key], int]]] = {(-1, 0): [(0.0, None, 0)]}
+    for i, aa in enumerate(aa_seq):
+        family = ["ATG"] if (fixed_start and i == 0 and aa == "M") else AA_TO_CODONS.get(aa)
+        if not family:
+            raise ValueError(f"Cannot decode residue {aa!r} at position {i}.")
+        cand: Dict[Key, List[Tuple[float, Optional[Key], int]]] = {}
+        for key, entries in frontier.items():
+            prev, st = key
+            for c in family:
+                j = CODON_INDEX[c]
+                gain = log_w[j] - _HIT_PENALTY * hits[st][j]
+                if pair_val is not None and prev >= 0:
+                    gain += w_cpb * pair_val[prev*64 + j]
+                lst = cand.setdefault((j, nxt[st][j]), [])
+                for rank, (score, _, _) in enumerate(entries):
+                    lst.append((score + gain, key, rank))
+        frontier = {key: heapq.nlargest(k, lst, key=lambda e: e[0]) for key, lst in cand.items()}
+        layers.append(frontier)
+
+    if not layers:
+        return [DecodeResult(dna="")]
+    finals = heapq.nlargest(
+        k, ((e[0], key, rank) for key, lst in frontier.items() for rank, e in enumerate(lst)),
+        key=lambda e: e[0],
+    )
+    out: List[DecodeResult] = []
+    for score, key, rank in finals:
+        codons: List[str] = []
+        for layer in reversed(layers):
+            _, prev_key, prev_rank = layer[key][rank]
+            codons.append(CODONS[key[0]])
+            key, rank = prev_key, prev_rank
+        codons.reverse()
+        n_hits = scanner.count("".join(codons)) if scanner else 0
+        out.append(DecodeResult(
+            dna="".join(codons),
+            score=score + _HIT_PENALTY * n_hits,
+            violations=n_hits,
+        ))
+    return out
+
+
+_CODON_GC = np.array([sum(b in "GC" for b in c) for c in CODONS], dtype=np.int64)
+_STOP = np.array([CODON_INDEX[c] for c in AA_TO_CODONS["*"]], dtype=np.int64)
+# sense families plus the stop family
+_LOGP_MASK = np.vstack([FAMILY_MASK, np.isin(np.arange(len(CODONS)), _STOP)[None, :]])
+
+
+def _usage_log_probs(usage: Dict[str, float], temperature: float = 1.0) -> np.ndarray:
+    """log p(codon | amino acid) from a usage table, normalised within each synonymous (or stop) family."""
+    logu = np.log(np.array([max(1e-9, usage.get(c, 1e-9)) for c in CODONS])) / max(1e-6, temperature)
+    z = np.where(_LOGP_MASK, logu[None, :], -np.inf)
+    z = z - z.max(axis=1, keepdims=True)
+    z = z - np.log(np.exp(z).sum(axis=1, keepdims=True))
+    return np.where(_LOGP_MASK, z, 0.0).sum(axis=0)
+
+
+def _gc_term(gc: np.ndarray, gc_target: Tuple[float, float]) -> np.ndarray:
+    lo, hi = gc_target
+    excess = np.where(gc < lo, (lo - gc)/lo, (gc - hi)/(1.0-hi))
+    return np.clip(1.0 - np.maximum(0.0, excess), 0.0, 1.0)
+
+
+def beam_decode(
+    aa_seq: str,
+    policy=None,
+    host: Optional[str] = None,
+    usage: Optional[Dict[str, float]] = None,
+    cpb: Optional[Dict[str, float]] = None,
+    motifs: Optional[List[str]] = None,
+    context: Optional[ScoringContext] = None,
+    beam_width: int = 32,
+    n: int = 1,
+    temperature: float = 1.0,
+    w_logp: float = 1.0,
+    w_cai: float = 1.0,
+    w_cpb: float = 1.0,
+    w_gc: float = 1.0,
+    gc_target: Tuple[float, float] = (0.35, 0.65),
+    fixed_start: bool = True,
+) -> List[DecodeResult]:
+    """
+    Beam search over codon positions with batched expansions.
+
+    Maximises  J = w_logp * sum_i log p(c_i) + w_cai * mean_i log w(c_i) + w_cpb * mean cpb(c_{i-1}, c_i)
+    + w_gc * gc_term(GC), where p is the policy's per-family codon distribution for `host` (the
+    usage distribution without a policy), w the CAI relative adaptiveness, the CPB mean runs over
+    pairs in the table (as in metrics.codon_pair_bias_score) and gc_term is the rules_score GC term.
+    A "*" residue is decoded from the stop family, with p from the usage table and, as in metrics.cai,
+    no CAI contribution (the log w mean runs over sense codons).
+    Each step expands all beams by the codons of the next residue as one (beams, family) array and
+    keeps the beam_width best by a partial score: the terms above on the prefix (GC as the fraction
+    so far) plus an optimistic bound on the remaining log p and log w terms. The motif-automaton
+    state of each beam rules out codons completing a forbidden motif; such codons survive only when
+    nothing else does and are reported in `violations`. Returns the n best complete sequences, best
+    first, with `score` = J and `logp` the policy log-probability.
+    """
+    aa_seq = aa_seq.strip().upper()
+    ctx = resolve_context(context, usage, cpb=cpb)
+    scanner = compile_motifs(motifs if motifs is not None else list(ctx.motifs))
+    nxt_tab, hit_tab = scanner.codon_table
+    if policy is not None:
+        with np.errstate(divide="ignore"):
+            logp_tab = np.log(policy.codon_probs(host or policy.hosts[0], temperature))
+        # the policy has no stop-codon logits: stops follow the usage table
+        logp_tab[_STOP] = _usage_log_probs(ctx.usage, temperature)[_STOP]
+    else:
+        logp_tab = _usage_log_probs(ctx.usage, temperature)
+    # stop codons take no part in CAI (as in metrics.cai)
+    log_w = ctx.log_w.copy()
+    log_w[_STOP] = 0.0
+    pair_val, pair_mask = ctx.pair_tables if (ctx.cpb is not None and w_cpb) else (None, None)
+    L = len(aa_seq)
+    if L == 0:
+        return [DecodeResult(dna="")]
+    families: List[np.ndarray] = []
+    for i, aa in enumerate(aa_seq):
+        family = ["ATG"] if (fixed_start and i == 0 and aa == "M") else AA_TO_CODONS.get(aa)
+        if not family:
+            raise ValueError(f"Cannot decode residue {aa!r} at position {i}.")
+        families.append(np.array([CODON_INDEX[c] for c in family], dtype=np.int64))
+    # the CAI mean runs over sense codons only
+    n_sense = max(1, sum(aa != "*" for aa in aa_seq))
+    # optimistic per-position gain of the additive terms, summed over the remaining suffix
+    best = np.array([w_logp*logp_tab[f].max() + w_cai*log_w[f].max()/n_sense for f in families])
+    suffix = np.concatenate([np.cumsum(best[::-1])[::-1], [0.0]])
+
+    W = max(1, beam_width)
+    logp = np.zeros(1); cai_sum = np.zeros(1); cpb_sum = np.zeros(1)
+    gc = np.zeros(1, dtype=np.int64); cpb_n = np.zeros(1, dtype=np.int64); viol = np.zeros(1, dtype=np.int64)
+    state = np.zeros(1, dtype=np.int64); prev = np.full(1, -1, dtype=np.int64)
+    parents: List[np.ndarray] = []
+    chosen: List[np.ndarray] = []
+    partial = np.zeros(1)
+    for i, fam in enumerate(families):
+        F = fam.size
+        lp = logp[:, None] + logp_tab[fam][None, :]
+        cs = cai_sum[:, None] + log_w[fam][None, :]
+        g = gc[:, None] + _CODON_GC[fam][None, :]
+        v = viol[:, None] + hit_tab[state][:, fam]
+        if pair_val is not None and i > 0:
+            pairs = prev[:, None]*64 + fam[None, :]
+            ps = cpb_sum[:, None] + pair_val[pairs]
+            pn = cpb_n[:, None] + pair_mask[pairs]
+        else:
+            ps = np.repeat(cpb_sum[:, None], F, axis=1)
+            pn = np.repeat(cpb_n[:, None], F, axis=1)
+        score = (
+            w_logp*lp + w_cai*cs/n_sense + w_gc*_gc_term(g / (3.0*(i+1)), gc_target)
+            + (w_cpb*ps/np.maximum(1, pn) if pair_val is not None else 0.0)
+        )
+        partial = score + suffix[i+1] - _HIT_PENALTY*v
+        keep = np.argsort(-partial.ravel(), kind="stable")[:W]
+        b, f = np.divmod(keep, F)
+        logp, cai_sum, gc, viol = lp[b, f], cs[b, f], g[b, f], v[b, f]
+        cpb_sum, cpb_n = ps[b, f], pn[b, f]
+        state = nxt_tab[state[b], fam[f]].astype(np.int64)
+        prev = fam[f]
+        partial = partial[b, f]
+        parents.append(b)
+        chosen.append(prev)
+
+    top = np.arange(min(max(1, n), len(prev)))
+    idx = top.copy()
+    codon_idx = np.empty((top.size, L), dtype=np.int64)
+    for layer in range(L-1, -1, -1):
+        codon_idx[:, layer] = chosen[layer][idx]
+        idx = parents[layer][idx]
+    table = np.array(CODONS)
+    return [
+        DecodeResult(
+            dna="".join(table[codon_idx[r]]),
+            logp=float(logp[r]),
+            score=float(partial[r] + _HIT_PENALTY*viol[r]),
+            violations=int(viol[r]),
+        )
+        for r in top
+    ]
+
@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+"""
+On-disk cache of featurized training datasets.
+
+A cache entry holds one or more named parts (the whole dataset, or one part per host), each stored as
+memory-mappable .npy files (X as surrogate.TRAINING_FEATURE_DTYPE, y, hosts) plus the feature keys in
+manifest.json. Entries are keyed by dataset_key(): the SHA-256 of every input file, the DataConfig
+filters, any further record selection (target hosts, sample caps, training mode) and
+surrogate.FEATURIZER_VERSION, so editing the data, changing a filter or bumping the featurizer version
+selects a new entry and stale ones are never read. Loaded X matrices are memory-mapped read-only.
+"""
+
+import dataclasses
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .surrogate import FEATURIZER_VERSION, TRAINING_FEATURE_DTYPE
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FEATURE_CACHE_DIR = os.environ.get("CODON_VERIFIER_FEATURE_CACHE", os.path.join("data", "cache", "features"))
+
+_MANIFEST = "manifest.json"
+
+
+@dataclass
+class FeatureSet:
+    """Featurized records: X (N, D) with columns feature_keys, targets y and the host of every row."""
+    X: np.ndarray
+    y: np.ndarray
+    hosts: np.ndarray
+    feature_keys: List[str]
+
+
+@lru_cache(maxsize=256)
+def _file_digest(path: str, size: int, mtime_ns: int) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def file_digest(path: str) -> str:
+    """SHA-256 of a file's content (memoized per path, size and modification time within a process)."""
+    st = os.stat(path)
+    return _file_digest(os.path.abspath(path), st.st_size, st.st_mtime_ns)
+
+
+def dataset_key(data_paths: Sequence[str], data_config: Any = None, **selection: Any) -> str:
+    """
+    Cache key of the dataset built from `data_paths` under `data_config` (a DataConfig or None) and any
+    further selection arguments (e.g. target_hosts=..., max_samples=..., mode=...).
+    """
+    payload = {
+        "featurizer_version": FEATURIZER_VERSION,
+        "files": [file_digest(p) for p in data_paths],
+        "data_config": dataclasses.asdict(data_config) if dataclasses.is_dataclass(data_config) else data_config,
+        "selection": selection,
+    }
+    blob = json.dumps(payload, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(blob).hexdigest()[:32]
+
+
+class FeatureCache:
+    """Directory of featurized datasets addressed by dataset_key()."""
+
+    def __init__(self, cache_dir: Optional[str] = None):
+        self.cache_dir = cache_dir or DEFAULT_FEATURE_CACHE_DIR
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    def load(self, key: str) -> Optional[Dict[str, FeatureSet]]:
+        """The named parts of entry `key` (X memory-mapped), or None if there is no complete entry."""
+        entry = self.path(key)
+        try:
+            with open(os.path.join(entry, _MANIFEST), "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if manifest.get("featurizer_version") != FEATURIZER_VERSION:
+            return None
+        parts = {}
+        for i, (name, keys) in enumerate(manifest["parts"]):
+            parts[name] = FeatureSet(
+                X=np.load(os.path.join(entry, f"part{i}.X.npy"), mmap_mode="r"),
+                y=np.load(os.path.join(entry, f"part{i}.y.npy")),
+                hosts=np.load(os.path.join(entry, f"part{i}.hosts.npy")),
+                feature_keys=list(keys),
+            )
+        logger.info(f"Loaded cached features {key} ({', '.join(f'{n}: {p.X.shape}' for n, p in parts.items())})")
+        return parts
+
+    def save(self, key: str, parts: Dict[str, FeatureSet], info: Optional[dict] = None) -> bool:
+        """
+        Store the parts as entry `key`. The entry is written to a temporary directory and renamed into
+        place, so readers never see a partial entry. Failures are logged, not raised; returns success.
+        """
+        tmp = None
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp = tempfile.mkdtemp(prefix=f".{key}.", dir=self.cache_dir)
+            manifest = {"featurizer_version": FEATURIZER_VERSION, "parts": [], "info": info or {}}
+            for i, (name, part) in enumerate(parts.items()):
+                np.save(os.path.join(tmp, f"part{i}.X.npy"), np.asarray(part.X, dtype=TRAINING_FEATURE_DTYPE))
+                np.save(os.path.join(tmp, f"part{i}.y.npy"), np.asarray(part.y, dtype=float))
+                np.save(os.path.join(tmp, f"part{i}.hosts.npy"), np.asarray(part.hosts, dtype=str))
+                manifest["parts"].append([name, list(part.feature_keys)])
+            with open(os.path.join(tmp, _MANIFEST), "w", encoding="utf-8") as f:
+                json.dump(manifest, f, indent=2, default=str)
+            if os.path.isdir(self.path(key)):
+                shutil.rmtree(tmp)
+            else:
+                os.replace(tmp, self.path(key))
+            tmp = None
+            logger.info(f"Cached features as {key} in {self.cache_dir}")
+            return True
+        except OSError as e:
+            logger.warning(f"Could not write feature cache entry {key}: {e}")
+            return False
+        finally:
+            if tmp is not None:
+                shutil.rmtree(tmp, ignore_errors=True)
@@ -0,0 +1,321 @@
+"""
+Island-model genetic algorithm for optimizing the CDS of one protein.
+
+Each island evolves a population of codon-index rows (synonymous mutation, two-point crossover at
+codon boundaries, tournament selection with elitism) scored through the batched, cached reward path
+of grpo_train.RolloutWorker (pipeline.score_candidates; forbidden motifs score -inf). Islands run
+for `migration_interval` generations per epoch, in a process pool with --workers > 1, and then send
+their best `migrants` to the next island on a ring. The search stops at a generation, evaluation or
+wall-clock budget.
+
+Island state (population, fitness and RNG state) travels with every epoch task, so for a fixed seed
+and an evaluation or generation budget the result does not depend on the number of workers.
+"""
+from __future__ import annotations
+
+import argparse, json, time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .codon_utils import FAMILY_CODONS, decode_codon_matrix, encode_protein
+from .grpo_train import RolloutConfig, RolloutWorker, surrogate_version
+from .hosts.tables import E_COLI_USAGE
+from .policy import HostConditionalCodonPolicy
+
+
+@dataclass
+class GAConfig:
+    """Search and scoring settings shared by all islands."""
+    host: str = "E_coli"
+    motifs: List[str] = field(default_factory=list)
+    islands: int = 4
+    population: int = 64               # individuals per island
+    elite: int = 2                     # best individuals copied unchanged each generation
+    tournament: int = 3
+    crossover_rate: float = 0.9
+    mutation_rate: Optional[float] = None   # per codon; default 1/L
+    migration_interval: int = 10       # generations per epoch
+    migrants: int = 2
+    init_temperature: float = 1.0      # temperature of the usage-policy initial population
+    w_sur: float = 1.0
+    w_rules: float = 1.0
+    lambda_unc: float = 1.0
+    surrogate: Optional[str] = None
+    reward_cache: int = 100_000
+    seed: int = 0
+
+    def scoring(self) -> RolloutConfig:
+        return RolloutConfig(
+            host=self.host, motifs=list(self.motifs), w_sur=self.w_sur, w_rules=self.w_rules,
+            lambda_unc=self.lambda_unc, seed=self.seed, reward_cache=self.reward_cache,
+            surrogate=self.surrogate,
+        )
+
+
+@dataclass
+class IslandState:
+    index: int
+    pop: np.ndarray          # (P, L) codon indices
+    fit: np.ndarray          # (P,) rewards
+    rng_state: Dict[str, Any]
+    generations: int = 0
+    evaluations: int = 0
+
+
+@dataclass
+class GAResult:
+    best_dna: str
+    best_reward: float
+    top: List[Tuple[str, float]]
+    generations: int
+    evaluations: int
+    seconds: float
+    history: List[Dict[str, Any]]
+
+
+_SCORER: Optional[RolloutWorker] = None
+# scoring config (and surrogate file version) _SCORER was built for
+_SCORER_KEY: Optional[Tuple[RolloutConfig, Optional[str]]] = None
+
+
+def _init_worker(cfg: GAConfig) -> None:
+    """Build the process-local scorer for cfg, reusing it (and its reward cache) while cfg's scoring is unchanged."""
+    global _SCORER, _SCORER_KEY
+    scoring = cfg.scoring()
+    key = (scoring, surrogate_version(scoring.surrogate))
+    if _SCORER is None or key != _SCORER_KEY:
+        _SCORER, _SCORER_KEY = RolloutWorker(scoring), key
+
+
+def _evaluate(pop: np.ndarray, aa: str) -> np.ndarray:
+    return np.asarray(_SCORER.rewards(decode_codon_matrix(pop), aa), dtype=float)
+
+
+def _tournament(fit: np.ndarray, n: int, size: int, rng: np.random.Generator) -> np.ndarray:
+    cand = rng.integers(len(fit), size=(n, size))
+    return cand[np.arange(n), np.argmax(fit[cand], axis=1)]
+
+
+def _offspring(
+    pop: np.ndarray, fit: np.ndarray, n: int, choices: np.ndarray, n_choices: np.ndarray,
+    cfg: GAConfig, rng: np.random.Generator,
+) -> np.ndarray:
+    """n children by tournament selection, two-point crossover and synonymous mutation."""
+    L = pop.shape[1]
+    a = pop[_tournament(fit, n, cfg.tournament, rng)]
+    b = pop[_tournament(fit, n, cfg.tournament, rng)]
+    cuts = np.sort(rng.integers(0, L + 1, size=(n, 2)), axis=1)
+    cols = np.arange(L)
+    swap = (cols >= cuts[:, :1]) & (cols < cuts[:, 1:]) & (rng.random((n, 1)) < cfg.crossover_rate)
+    child = np.where(swap, b, a)
+    rate = cfg.mutation_rate if cfg.mutation_rate is not None else 1.0 / max(1, L)
+    mut = (rng.random((n, L)) < rate) & (n_choices > 1)
+    r, c = np.nonzero(mut)
+    child[r, c] = choices[c, (rng.random(r.size) * n_choices[c]).astype(np.int64)]
+    return child
+
+
+def _evolve_epoch(
+    state: IslandState, aa: str, cfg: GAConfig, generations: int,
+    max_evals: Optional[int], deadline: Optional[float],
+) -> IslandState:
+    """Run up to `generations` generations on one island within its evaluation allowance and deadline."""
+    _init_worker(cfg)
+    rng = np.random.default_rng()
+    rng.bit_generator.state = state.rng_state
+    choices = FAMILY_CODONS[encode_protein(aa)]
+    n_choices = (choices >= 0).sum(axis=1)
+    pop, fit = state.pop, state.fit
+    P = len(pop)
+    n_child = P - min(cfg.elite, P)
+    used = 0
+    for _ in range(generations):
+        if max_evals is not None and used + n_child > max_evals:
+            break
+        if deadline is not None and time.time() >= deadline:
+            break
+        children = _offspring(pop, fit, n_child, choices, n_choices, cfg, rng)
+        child_fit = _evaluate(children, aa)
+        used += n_child
+        elite = np.argsort(-fit, kind="stable")[:P - n_child]
+        pop = np.vstack([pop[elite], children])
+        fit = np.concatenate([fit[elite], child_fit])
+        state.generations += 1
+    state.pop, state.fit = pop, fit
+    state.evaluations += used
+    state.rng_state = rng.bit_generator.state
+    return state
+
+
+def _init_island(index: int, aa: str, cfg: GAConfig) -> IslandState:
+    _init_worker(cfg)
+    rng = np.random.default_rng(np.random.SeedSequence(cfg.seed, spawn_key=(index,)))
+    policy = HostConditionalCodonPolicy([cfg.host], init_usage=E_COLI_USAGE)
+    _, _, pop = policy.sample_group(
+        aa, cfg.host, cfg.population, motifs_forbidden=cfg.motifs or None,
+        temperature=cfg.init_temperature, rng=rng, return_indices=True,
+    )
+    pop = np.asarray(pop, dtype=np.int16)
+    fit = _evaluate(pop, aa)
+    return IslandState(index, pop, fit, rng.bit_generator.state, evaluations=len(pop))
+
+
+def _migrate(states: List[IslandState], k: int) -> None:
+    """Ring migration: the best k of island i replace the worst k of island i+1."""
+    if len(states) < 2 or k <= 0:
+        return
+    best = []
+    for s in states:
+        top = np.argsort(-s.fit, kind="stable")[:k]
+        best.append((s.pop[top].copy(), s.fit[top].copy()))
+    for i, s in enumerate(states):
+        pop, fit = best[i - 1]
+        worst = np.argsort(s.fit, kind="stable")[:len(fit)]
+        s.pop[worst], s.fit[worst] = pop, fit
+
+
+def run_ga(
+    aa: str,
+    cfg: Optional[GAConfig] = None,
+    max_generations: Optional[int] = None,
+    max_evals: Optional[int] = None,
+    time_limit: Optional[float] = None,
+    workers: int = 1,
+    top: int = 10,
+    log=None,
+) -> GAResult:
+    """
+    Optimize the CDS of `aa` until any budget is exhausted: generations per island, total reward
+    evaluations over all islands (initial populations included) or wall-clock seconds.
+    `log`, if given, is called with a dict after every epoch.
+    """
+    cfg = cfg or GAConfig()
+    aa = aa.strip().upper()
+    fam = encode_protein(aa)
+    if fam.size == 0 or (fam < 0).any():
+        raise ValueError("run_ga needs a non-empty protein of the 20 standard amino acids.")
+    if max_generations is None and max_evals is None and time_limit is None:
+        raise ValueError("run_ga needs at least one of max_generations, max_evals or time_limit.")
+    t0 = time.time()
+    deadline = t0 + time_limit if time_limit is not None else None
+    pool = (
+        ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(cfg,))
+        if workers > 1 else None
+    )
+
+    def run_all(fn, *per_island):
+        return list(pool.map(fn, *per_island) if pool is not None else map(fn, *per_island))
+
+    history: List[Dict[str, Any]] = []
+    try:
+        n = cfg.islands
+        states = run_all(_init_island, range(n), [aa] * n, [cfg] * n)
+        while True:
+            gens = min(s.generations for s in states)
+            evals = sum(s.evaluations for s in states)
+            step = cfg.migration_interval
+            if max_generations is not None:
+                step = min(step, max_generations - gens)
+            allowance = None
+            if max_evals is not None:
+                allowance = (max_evals - evals) // n
+            if step <= 0 or (allowance is not None and allowance < cfg.population - min(cfg.elite, cfg.population)):
+                break
+            if deadline is not None and time.time() >= deadline:
+                break
+            states = run_all(
+                _evolve_epoch, states, [aa] * n, [cfg] * n, [step] * n, [allowance] * n, [deadline] * n,
+            )
+            if min(s.generations for s in states) == gens:
+                break
+            _migrate(states, cfg.migrants)
+            rec = {
+                "generations": min(s.generations for s in states),
+                "evaluations": sum(s.evaluations for s in states),
+                "best_reward": max(float(s.fit.max()) for s in states),
+                "island_best": [float(s.fit.max()) for s in states],
+                "seconds": time.time() - t0,
+            }
+            history.append(rec)
+            if log is not None:
+                log(rec)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    pop = np.vstack([s.pop for s in states])
+    fit = np.concatenate([s.fit for s in states])
+    order = np.argsort(-fit, kind="stable")
+    ranked: List[Tuple[str, float]] = []
+    seen = set()
+    for i, dna in zip(order, decode_codon_matrix(pop[order])):
+        if dna not in seen:
+            seen.add(dna)
+            ranked.append((dna, float(fit[i])))
+        if len(ranked) >= top:
+            break
+    return GAResult(
+        best_dna=ranked[0][0],
+        best_reward=ranked[0][1],
+        top=ranked,
+        generations=min(s.generations for s in states),
+        evaluations=sum(s.evaluations for s in states),
+        seconds=time.time() - t0,
+        history=history,
+    )
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Island-model GA over synonymous codon choices for one protein")
+    ap.add_argument("--aa", required=True, help="Protein amino-acid sequence")
+    ap.add_argument("--host", default="E_coli", help="Host key (demo: E_coli)")
+    ap.add_argument("--motif", action="append", default=["GAATTC","GGATCC"], help="Forbidden motifs")
+    ap.add_argument("--islands", type=int, default=4)
+    ap.add_argument("--population", type=int, default=64, help="Individuals per island")
+    ap.add_argument("--elite", type=int, default=2)
+    ap.add_argument("--tournament", type=int, default=3)
+    ap.add_argument("--crossover_rate", type=float, default=0.9)
+    ap.add_argument("--mutation_rate", type=float, default=None, help="Per-codon mutation rate (default 1/L)")
+    ap.add_argument("--migration_interval", type=int, default=10, help="Generations between migrations")
+    ap.add_argument("--migrants", type=int, default=2)
+    ap.add_argument("--generations", type=int, default=None, help="Generation budget per island")
+    ap.add_argument("--max_evals", type=int, default=None, help="Total reward-evaluation budget")
+    ap.add_argument("--time_limit", type=float, default=None, help="Wall-clock budget in seconds")
+    ap.add_argument("--workers", type=int, default=1, help="Island worker processes (1 = in-process)")
+    ap.add_argument("--w_rules", type=float, default=1.0)
+    ap.add_argument("--w_sur", type=float, default=1.0)
+    ap.add_argument("--lambda_unc", type=float, default=1.0)
+    ap.add_argument("--surrogate", default=None, help="Trained SurrogateModel (.pkl) supplying mu/sigma")
+    ap.add_argument("--reward_cache", type=int, default=100_000, help="Reward LRU entries per worker (0 = off)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--top", type=int, default=10, help="Number of distinct best sequences to print")
+    args = ap.parse_args()
+
+    cfg = GAConfig(
+        host=args.host, motifs=list(args.motif) if args.motif else [], islands=args.islands,
+        population=args.population, elite=args.elite, tournament=args.tournament,
+        crossover_rate=args.crossover_rate, mutation_rate=args.mutation_rate,
+        migration_interval=args.migration_interval, migrants=args.migrants,
+        w_sur=args.w_sur, w_rules=args.w_rules, lambda_unc=args.lambda_unc,
+        surrogate=args.surrogate, reward_cache=args.reward_cache, seed=args.seed,
+    )
+    max_generations = args.generations
+    if max_generations is None and args.max_evals is None and args.time_limit is None:
+        max_generations = 100
+    res = run_ga(
+        args.aa, cfg, max_generations=max_generations, max_evals=args.max_evals,
+        time_limit=args.time_limit, workers=args.workers, top=args.top,
+        log=lambda rec: print(json.dumps(rec)),
+    )
+    print(json.dumps({
+        "best_reward": res.best_reward, "best_dna": res.best_dna,
+        "generations": res.generations, "evaluations": res.evaluations, "seconds": res.seconds,
+        "top": [{"dna": d, "reward": r} for d, r in res.top],
+    }))
+
+
+if __name__ == "__main__":
+    main()
@@ -8,13 +8,16 @@ Small-data: also load a surrogate .pkl to supply (mu, sigma).
 """
 
 import argparse, json
-from typing import List
+from itertools import islice
+from typing import List, Tuple
 
-from .generator import generate_candidates
+from .generator import iter_candidates
 from .hosts.tables import E_COLI_USAGE, E_COLI_TRNA
+from .context import ScoringContext
 from .lm_features import combined_lm_features
-from .reward import combine_reward
-from .surrogate import load_and_predict
+from .pipeline import score_candidates
+from .ranking import StreamingRanker
+from .surrogate import get_surrogate
 
 
 def main():
@@ -23,61 +26,63 @@ def main():
     ap.add_argument("--host", default="E_coli", help="Host name")
     ap.add_argument("--n", type=int, default=100, help="Number of candidates to return")
     ap.add_argument("--source", choices=["ct","policy","heuristic"], default="heuristic")
-    ap.add_argument("--method", default="transformer", help="ct method: transformer|HFC|BFC|URC")
+    ap.add_argument("--method", default="transformer", help="ct method: transformer|HFC|BFC|URC|DP|BEAM")
     ap.add_argument("--temperature", type=float, default=1.0)
     ap.add_argument("--topk", type=int, default=50)
     ap.add_argument("--beams", type=int, default=0)
     ap.add_argument("--forbid", nargs="*", default=["GAATTC","GGATCC"], help="Forbidden motifs")
     ap.add_argument("--surrogate", default=None, help="Path to surrogate .pkl (small-data mode)")
     ap.add_argument("--top", type=int, default=50, help="Top-K to print after scoring")
+    ap.add_argument("--seed", type=int, default=None, help="Seed for reproducible generation")
+    ap.add_argument("--workers", type=int, default=1, help="Generation worker processes (output does not depend on this)")
+    ap.add_argument("--dedup", choices=["exact","bloom","none"], default="exact", help="Candidate deduplication (bloom: fixed memory)")
+    ap.add_argument("--batch", type=int, default=4096, help="Candidates scored per batch")
+    ap.add_argument("--spill", default=None, help="Write every scored record to this .jsonl/.csv file")
+    ap.add_argument("--pareto", nargs="*", default=None, help="Also keep a Pareto archive over these objectives, e.g. cai:max surrogate_sigma:min")
     args = ap.parse_args()
 
     # For demo purposes we use the E. coli tables. Extend to your hosts as needed.
     usage, trna = E_COLI_USAGE, E_COLI_TRNA
+    ctx = ScoringContext(usage, trna, motifs=args.forbid, host=args.host)
 
-    cands = generate_candidates(
+    stream = iter_candidates(
         aa=args.aa, host=args.host, n=args.n, source=args.source,
         motifs_forbidden=args.forbid, temperature=args.temperature,
         top_k=args.topk, beam_size=args.beams, method=args.method,
+        dedup=args.dedup, seed=args.seed, workers=args.workers,
     )
 
-    results = []
-    # Small-data? get mu/sigma via surrogate
-    musig = None
-    if args.surrogate:
-        preds = load_and_predict(args.surrogate, cands, usage, trna_w=trna, extra=None)
-        musig = [(p["mu"], p["sigma"]) for p in preds]
+    # Small-data? the surrogate supplies (mu, sigma); features and rule terms share one metric pass
+    model = get_surrogate(args.surrogate) if args.surrogate else None
+    objectives = dict(_parse_objective(o) for o in args.pareto) if args.pareto else None
+    # only the best --top (and the Pareto archive) stay in memory; --spill streams every record
+    with StreamingRanker(args.top, key="reward", objectives=objectives, spill_path=args.spill) as ranker:
+        while True:
+            cands = list(islice(stream, args.batch))
+            if not cands:
+                break
+            lm_feats = [combined_lm_features(dna, aa=args.aa, host=args.host) for dna in cands]
+            scored = score_candidates(
+                cands, ctx, lm_features=lm_feats, surrogate=model,
+                w_surrogate=1.0, w_rules=1.0, lambda_uncertainty=1.0,
+            )
+            for dna, res in zip(cands, scored):
+                ranker.add({
+                    "dna": dna,
+                    "reward": res.get("reward", 0.0),
+                    **{k: v for k, v in res.items() if k != "lm_features" and k != "extra_features"}
+                })
 
-    for i, dna in enumerate(cands):
-        lm_feats = combined_lm_features(dna, aa=args.aa, host=args.host)
-        mu = sigma = None
-        if musig is not None:
-            mu, sigma = musig[i]
-        res = combine_reward(
-            dna=dna,
-            usage=usage,
-            surrogate_mu=mu,
-            surrogate_sigma=sigma,
-            trna_w=trna,
-            cpb=None,
-            motifs=args.forbid,
-            lm_features=lm_feats,
-            extra_features=dict(lm_feats),
-            w_surrogate=1.0,
-            w_rules=1.0,
-            lambda_uncertainty=1.0,
-        )
-        results.append({
-            "dna": dna,
-            "reward": res.get("reward", 0.0),
-            **{k: v for k, v in res.items() if k != "lm_features" and k != "extra_features"}
-        })
+    if objectives:
+        print(json.dumps({"top": ranker.top(), "pareto": ranker.front()}, indent=2))
+    else:
+        print(json.dumps(ranker.top(), indent=2))
 
-    results.sort(key=lambda x: x["reward"], reverse=True)
-    print(json.dumps(results[:args.top], indent=2))
+
+def _parse_objective(spec: str) -> Tuple[str, str]:
+    key, _, direction = spec.partition(":")
+    return key, (direction or "max")
 
 
 if __name__ == "__main__":
     main()
-
-
@@ -10,11 +10,25 @@ Sources supported:
 
 This module only handles generation and constraint filtering. Scoring is done
 via reward.combine_reward or other downstream components.
+
+iter_candidates() streams constraint-passing candidates as they are produced,
+sizes each draw from the running acceptance rate and deduplicates on 2-bit
+packed sequence digests (or a Bloom filter for very large runs), so memory
+does not grow with the number of candidates yielded. Draws come in chunks with
+independent seeded NumPy streams, so `workers=` parallelizes generation without
+changing the output for a given seed.
 """
 
-from typing import List, Optional, Dict, Tuple
+import math
+import random
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Iterator, List, Optional, Dict, Tuple
+
+import numpy as np
 
-from .codon_utils import constrained_decode, validate_cds, aa_from_dna
+from .codon_utils import constrained_decode, validate_cds, aa_from_dna, sequence_key
+from .motifs import compile_motifs
 from .hosts import tables
 from .policy import HostConditionalCodonPolicy
 from . import codontransformer_adapter as ct_adapter
@@ -26,76 +40,276 @@ def _filter_constraints(dna: str, aa: str, motifs_forbidden: Optional[List[str]]
         return False
     if aa_from_dna(dna) != aa.strip().upper():
         return False
-    if motifs_forbidden:
-        s = dna.upper()
-        for m in motifs_forbidden:
-            mm = m.upper().replace("U","T")
-            if mm in s:
-                return False
+    if motifs_forbidden and compile_motifs(motifs_forbidden).has_match(dna):
+        return False
     return True
 
 
-def generate_candidates(
+@dataclass
+class GenerationStats:
+    """Counters for one iter_candidates run (updated while it yields)."""
+    drawn: int = 0
+    duplicates: int = 0
+    rejected: int = 0
+    accepted: int = 0
+    batches: int = 0
+
+    @property
+    def acceptance_rate(self) -> float:
+        return self.accepted / self.drawn if self.drawn else 1.0
+
+    def draws_needed(self, remaining: int, floor: float = 0.02) -> int:
+        """Draws expected to yield `remaining` more acceptances at the current rate."""
+        return max(1, math.ceil(remaining / max(floor, self.acceptance_rate)))
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            "drawn": self.drawn, "duplicates": self.duplicates, "rejected": self.rejected,
+            "accepted": self.accepted, "batches": self.batches, "acceptance_rate": self.acceptance_rate,
+        }
+
+
+class SeenSet:
+    """Exact deduplication on 16-byte digests of the 2-bit packed sequence (codon_utils.sequence_key)."""
+
+    def __init__(self):
+        self._keys = set()
+
+    def add(self, dna: str) -> bool:
+        """Record `dna`; False if it was already present."""
+        k = sequence_key(dna)
+        if k in self._keys:
+            return False
+        self._keys.add(k)
+        return True
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+
+class BloomFilter:
+    """
+    Fixed-memory approximate deduplication: a bit array sized for `capacity` items at the given
+    false-positive rate, indexed by double hashing of sequence_key. A false positive drops a new
+    sequence as a duplicate; nothing already seen is ever yielded twice.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 1e-3):
+        capacity = max(1, capacity)
+        self.n_bits = max(64, int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.n_hashes = max(1, int(round(self.n_bits / capacity * math.log(2))))
+        self.bits = np.zeros((self.n_bits + 7) // 8, dtype=np.uint8)
+        self.count = 0
+
+    def add(self, dna: str) -> bool:
+        """Record `dna`; False if it was (probably) already present."""
+        h1, h2 = np.frombuffer(sequence_key(dna), dtype="<u8").tolist()
+        new = False
+        for i in range(self.n_hashes):
+            b = (h1 + i * (h2 | 1)) % self.n_bits
+            byte, mask = b >> 3, 1 << (b & 7)
+            if not self.bits[byte] & mask:
+                self.bits[byte] |= mask
+                new = True
+        self.count += new
+        return new
+
+    def __len__(self) -> int:
+        return self.count
+
+
+CHUNK_SIZE = 64
+
+# ct methods whose output does not depend on the random stream (DP: k-best Viterbi, BEAM: beam
+# search, HFC: one fixed sequence); they are solved once for the requested count, not drawn in chunks
+DETERMINISTIC_METHODS = {"DP", "BEAM", "HFC"}
+
+
+class ChunkSource:
+    """
+    Picklable draw source: chunk j yields `chunk_size` raw sequences from its own NumPy Generator,
+    seeded with SeedSequence(seed, spawn_key=(j,)), so chunk contents do not depend on which
+    process draws them or on how many workers run.
+    """
+
+    def __init__(
+        self,
+        aa: str,
+        host: str,
+        source: str,
+        motifs_forbidden: Optional[List[str]],
+        temperature: float,
+        top_k: int,
+        beam_size: int,
+        method: str,
+        seed: int,
+        chunk_size: int = CHUNK_SIZE,
+    ):
+        self.aa, self.host, self.source = aa, host, source
+        self.motifs_forbidden = motifs_forbidden
+        self.temperature, self.top_k, self.beam_size, self.method = temperature, top_k, beam_size, method
+        self.seed, self.chunk_size = seed, chunk_size
+        self.usage = tables.E_COLI_USAGE if host in {"E_coli", "e_coli", "ECOLI"} else tables.E_COLI_USAGE
+        self.policy = HostConditionalCodonPolicy([host], init_usage=self.usage) if source == "policy" else None
+
+    @property
+    def deterministic(self) -> bool:
+        return self.source == "ct" and self.method.strip().upper() in DETERMINISTIC_METHODS
+
+    def solve(self, n: int) -> List[str]:
+        """All results of a deterministic method in one call (n = k-best count / beam width)."""
+        return ct_adapter.generate_sequences(
+            aa=self.aa, host=self.host, n=n, method=self.method,
+            temperature=self.temperature, top_k=self.top_k, beam_size=self.beam_size,
+            motifs_forbidden=self.motifs_forbidden,
+        )
+
+    def draw(self, chunk: int) -> List[str]:
+        rng = np.random.default_rng(np.random.SeedSequence(self.seed, spawn_key=(chunk,)))
+        k = self.chunk_size
+        if self.source == "ct":
+            # Use CodonTransformer adapter (may raise if transformer method unavailable)
+            return ct_adapter.generate_sequences(
+                aa=self.aa, host=self.host, n=k, method=self.method,
+                temperature=self.temperature, top_k=self.top_k, beam_size=self.beam_size,
+                motifs_forbidden=self.motifs_forbidden, rng=rng,
+            )
+        if self.source == "policy":
+            return self.policy.sample_group(
+                self.aa, self.host, k, motifs_forbidden=self.motifs_forbidden,
+                temperature=self.temperature, rng=rng,
+            )[0]
+        # heuristic
+        return [
+            constrained_decode(
+                self.aa, self.usage, motifs_forbidden=self.motifs_forbidden,
+                temperature=self.temperature, rng=rng,
+            )
+            for _ in range(k)
+        ]
+
+
+_SOURCE: Optional[ChunkSource] = None
+
+
+def _init_worker(source: ChunkSource) -> None:
+    global _SOURCE
+    _SOURCE = source
+
+
+def _draw_chunk(chunk: int) -> List[str]:
+    return _SOURCE.draw(chunk)
+
+
+def iter_candidates(
     aa: str,
     host: str,
-    n: int,
+    n: Optional[int] = None,
     source: str = "heuristic",
     motifs_forbidden: Optional[List[str]] = None,
     temperature: float = 1.0,
     top_k: int = 50,
     beam_size: int = 0,
     method: str = "transformer",
-) -> List[str]:
-    """Generate up to N candidates passing constraints, deduplicated."""
-
+    dedup: str = "exact",
+    bloom_error_rate: float = 1e-3,
+    max_batch: int = 4096,
+    max_draws: Optional[int] = None,
+    patience: int = 3,
+    stats: Optional[GenerationStats] = None,
+    seed: Optional[int] = None,
+    workers: int = 1,
+    chunk_size: int = CHUNK_SIZE,
+) -> Iterator[str]:
+    """
+    Yield unique constraint-passing candidates until `n` have been produced (or forever if n is None).
+    - Each draw is sized from the running acceptance rate (pass `stats` to observe it).
+    - dedup: "exact" (set of 16-byte packed-sequence digests), "bloom" (fixed-memory Bloom filter
+      sized for n, or 10^6 when n is None) or "none".
+    - Generation stops early after max_draws raw sequences (default 10*n + 1000), or after
+      `patience` consecutive batches without a new acceptance (e.g. the sequence space is exhausted).
+    - Raw sequences come in chunks of `chunk_size`, each from an independent seeded stream (see
+      ChunkSource); with workers > 1 the chunks of a batch are drawn in a process pool and merged in
+      chunk order, so for a given seed the output is identical for any number of workers.
+      Deterministic ct methods (DETERMINISTIC_METHODS) are solved once for n results instead.
+      seed=None draws a seed from the global `random` module.
+    """
     aa = aa.strip().upper()
-    usage = tables.E_COLI_USAGE if host in {"E_coli", "e_coli", "ECOLI"} else tables.E_COLI_USAGE
+    stats = stats if stats is not None else GenerationStats()
+    if dedup == "bloom":
+        seen = BloomFilter(n or 10**6, bloom_error_rate)
+    elif dedup == "exact":
+        seen = SeenSet()
+    elif dedup == "none":
+        seen = None
+    else:
+        raise ValueError(f"Unknown dedup mode {dedup!r}; expected 'exact', 'bloom' or 'none'.")
+    if max_draws is None and n is not None:
+        max_draws = 10 * n + 1000
+    if seed is None:
+        seed = random.getrandbits(64)
+    src = ChunkSource(aa, host, source, motifs_forbidden, temperature, top_k, beam_size, method, seed, chunk_size)
+    pool = (
+        ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(src,))
+        if workers > 1 and not src.deterministic else None
+    )
 
-    candidates: List[str] = []
-    seen = set()
-
-    if source == "ct":
-        # Use CodonTransformer adapter (may raise if transformer method unavailable)
-        raw = ct_adapter.generate_sequences(
-            aa=aa, host=host, n=max(1, n * 2), method=method,
-            temperature=temperature, top_k=top_k, beam_size=beam_size
-        )
-        for dna in raw:
-            if dna in seen:
-                continue
-            if _filter_constraints(dna, aa, motifs_forbidden):
-                candidates.append(dna)
-                seen.add(dna)
-            if len(candidates) >= n:
-                break
-        return candidates
-
-    if source == "policy":
-        policy = HostConditionalCodonPolicy([host], init_usage=usage)
-        # oversample to compensate for constraint filtering
-        tries = max(1, n * 3)
-        for _ in range(tries):
-            dna, _ = policy.sample_sequence(aa, host, motifs_forbidden=motifs_forbidden, temperature=temperature)
-            if dna in seen:
-                continue
-            if _filter_constraints(dna, aa, motifs_forbidden):
-                candidates.append(dna)
-                seen.add(dna)
-            if len(candidates) >= n:
-                break
-        return candidates
-
-    # heuristic
-    tries = max(1, n * 3)
-    for _ in range(tries):
-        dna = constrained_decode(aa, usage, motifs_forbidden=motifs_forbidden, temperature=temperature)
-        if dna in seen:
-            continue
-        if _filter_constraints(dna, aa, motifs_forbidden):
-            candidates.append(dna)
-            seen.add(dna)
-        if len(candidates) >= n:
-            break
-    return candidates
+    next_chunk = 0
+    idle = 0
+    try:
+        while n is None or stats.accepted < n:
+            if max_draws is not None and stats.drawn >= max_draws:
+                return
+            if src.deterministic:
+                # re-drawing would only repeat the same results: ask for all of them at once
+                raw = src.solve(n if n is not None else max_batch)
+            else:
+                k = stats.draws_needed(n - stats.accepted) if n is not None else max_batch
+                k = min(k, max_batch)
+                if max_draws is not None:
+                    k = min(k, max_draws - stats.drawn)
+                chunks = range(next_chunk, next_chunk + math.ceil(k / chunk_size))
+                next_chunk = chunks.stop
+                parts = pool.map(_draw_chunk, chunks) if pool is not None else map(src.draw, chunks)
+                raw = [dna for part in parts for dna in part][:k]
+            stats.batches += 1
+            before = stats.accepted
+            for dna in raw:
+                stats.drawn += 1
+                if not _filter_constraints(dna, aa, motifs_forbidden):
+                    stats.rejected += 1
+                    continue
+                if seen is not None and not seen.add(dna):
+                    stats.duplicates += 1
+                    continue
+                stats.accepted += 1
+                yield dna
+                if n is not None and stats.accepted >= n:
+                    return
+            idle = idle + 1 if stats.accepted == before else 0
+            if src.deterministic or not raw or idle >= patience:
+                return
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
 
 
+def generate_candidates(
+    aa: str,
+    host: str,
+    n: int,
+    source: str = "heuristic",
+    motifs_forbidden: Optional[List[str]] = None,
+    temperature: float = 1.0,
+    top_k: int = 50,
+    beam_size: int = 0,
+    method: str = "transformer",
+    stats: Optional[GenerationStats] = None,
+    seed: Optional[int] = None,
+    workers: int = 1,
+) -> List[str]:
+    """Generate up to N candidates passing constraints, deduplicated (see iter_candidates)."""
+    return list(iter_candidates(
+        aa, host, n, source=source, motifs_forbidden=motifs_forbidden, temperature=temperature,
+        top_k=top_k, beam_size=beam_size, method=method, stats=stats, seed=seed, workers=workers,
+    ))
@@ -1,100 +1,559 @@
+"""
+GRPO fine-tuning of HostConditionalCodonPolicy.
+
+Trains on a single protein (--aa) or streams proteins from a JSONL/FASTA file
+(--dataset) in shuffled minibatches, with one group per protein per step.
+Rollouts can run on a process pool (--workers); policy, reference policy,
+sampler RNG state and counters are checkpointed to .npz (--checkpoint_dir)
+and a run resumes exactly from the latest checkpoint with --resume.
+"""
 from __future__ import annotations
-import argparse, json, random
-from typing import List
+import argparse, glob, json, math, os, random, time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
 
 from codon_verifier.policy import HostConditionalCodonPolicy
-from codon_verifier.reward import combine_reward
+from codon_verifier.codon_utils import SENSE_AAS, aa_from_dna, decode_codon_matrix
+from codon_verifier.reward import RewardCache, reward_fingerprint
 from codon_verifier.features import assemble_feature_bundle
 from codon_verifier.hosts.tables import E_COLI_USAGE, E_COLI_TRNA
+from codon_verifier.context import ScoringContext
 from codon_verifier.lm_features import combined_lm_features
+from codon_verifier.surrogate import get_surrogate
+from codon_verifier.pipeline import score_candidates
+
+# (codon-index array, logp, reward) per sampled sequence
+Rollout = Tuple[np.ndarray, float, float]
 
 
 def group_relative_advantages(rewards: List[float]) -> List[float]:
-    m = sum(rewards)/len(rewards) if rewards else 0.0
-    std = (sum((r-m)**2 for r in rewards)/len(rewards))**0.5 if rewards else 1.0
+    """
+    Rewards standardised within their group. Mean and std run over the finite rewards only; a
+    non-finite reward (-inf for a hard-constraint violation) gets an advantage one below the
+    lowest finite advantage of the group, so it is penalised without turning the update into NaN.
+    """
+    finite = [r for r in rewards if math.isfinite(r)]
+    m = sum(finite)/len(finite) if finite else 0.0
+    std = (sum((r-m)**2 for r in finite)/len(finite))**0.5 if finite else 1.0
     std = max(1e-6, std)
-    return [(r - m)/std for r in rewards]
+    advs = [(r - m)/std if math.isfinite(r) else None for r in rewards]
+    floor = min((a for a in advs if a is not None), default=0.0) - 1.0
+    return [floor if a is None else a for a in advs]
+
+
+@dataclass
+class RolloutConfig:
+    """Everything a rollout worker needs besides the policy snapshot."""
+    host: str = "E_coli"
+    motifs: List[str] = field(default_factory=list)
+    temperature: float = 1.0
+    w_sur: float = 1.0
+    w_rules: float = 1.0
+    lambda_unc: float = 1.0
+    seed: int = 0
+    reward_cache: int = 100_000     # LRU entries per worker (0 disables caching)
+    surrogate: Optional[str] = None  # SurrogateModel path; mu/sigma are 0 without it
+
+
+def surrogate_version(path: Optional[str]) -> Optional[str]:
+    """Identify a model file by absolute path, size and modification time."""
+    if not path:
+        return None
+    st = os.stat(path)
+    return f"{os.path.abspath(path)}:{st.st_size}:{st.st_mtime_ns}"
+
+
+class RolloutWorker:
+    """
+    Samples a chunk of a group from a policy snapshot and scores it.
+    Each chunk draws from its own SeedSequence(seed, spawn_key=key) stream, with key = (step, chunk)
+    or (step, protein slot, chunk), so a run is reproducible for a fixed number of workers.
+    Rewards are memoized in a per-worker RewardCache keyed by sequence and scoring fingerprint;
+    the surrogate (if any) is loaded once per worker and called once per group on the cache misses.
+    """
+
+    def __init__(self, cfg: RolloutConfig):
+        self.cfg = cfg
+        self.ctx = ScoringContext(E_COLI_USAGE, E_COLI_TRNA, motifs=cfg.motifs, host=cfg.host)
+        self._extra: Dict[str, dict] = {}
+        self.surrogate = get_surrogate(cfg.surrogate) if cfg.surrogate else None
+        self.cache = RewardCache(cfg.reward_cache)
+        self.fingerprint = reward_fingerprint(
+            self.ctx, w_surrogate=cfg.w_sur, w_rules=cfg.w_rules, lambda_uncertainty=cfg.lambda_unc,
+            surrogate_version=surrogate_version(cfg.surrogate),
+        )
+
+    def extra_for(self, aa: str) -> dict:
+        if aa not in self._extra:
+            self._extra[aa] = assemble_feature_bundle(aa).to_dict()
+        return self._extra[aa]
+
+    def reward(self, dna: str, aa: str) -> float:
+        return self.rewards([dna], aa)[0]
+
+    def rewards(self, dnas: List[str], aa: str) -> List[float]:
+        """Rewards for a group of sequences of one protein; only cache misses are scored."""
+        out = [self.cache.get(dna, self.fingerprint) for dna in dnas]
+        pending: Dict[str, List[int]] = {}
+        for i, (dna, r) in enumerate(zip(dnas, out)):
+            if r is None:
+                pending.setdefault(dna, []).append(i)
+        if pending:
+            uniq = list(pending)
+            for dna, r in zip(uniq, self._score(uniq, aa)):
+                self.cache.put(dna, r, self.fingerprint)
+                for i in pending[dna]:
+                    out[i] = r
+        return out
+
+    def _score(self, dnas: List[str], aa: str) -> List[float]:
+        cfg = self.cfg
+        lm_feats = [combined_lm_features(dna, aa=aa, host=cfg.host) for dna in dnas]
+        extras = []
+        for feats in lm_feats:
+            extra_with_lm = dict(self.extra_for(aa))
+            extra_with_lm.update(feats)
+            extras.append(extra_with_lm)
+        # one metric pass feeds both the surrogate rows and the rule terms; one model call per group
+        return [
+            r["reward"]
+            for r in score_candidates(
+                dnas, self.ctx, lm_features=lm_feats, extra_features=extras, surrogate=self.surrogate,
+                w_surrogate=cfg.w_sur, w_rules=cfg.w_rules, lambda_uncertainty=cfg.lambda_unc,
+                enforce_hard_constraints=True,
+            )
+        ]
+
+    def run(
+        self, hosts: List[str], logits: np.ndarray, aa: str, n: int, key: Tuple[int, ...],
+    ) -> Tuple[List[Rollout], Tuple[int, int]]:
+        """Rollout records plus the (cache hits, cache misses) incurred by this call."""
+        hits, misses = self.cache.hits, self.cache.misses
+        policy = HostConditionalCodonPolicy.from_logits(hosts, logits)
+        rng = np.random.default_rng(np.random.SeedSequence(self.cfg.seed, spawn_key=key))
+        dnas, logps, idx = policy.sample_group(
+            aa, self.cfg.host, n, motifs_forbidden=self.cfg.motifs, temperature=self.cfg.temperature,
+            rng=rng, return_indices=True,
+        )
+        rewards = self.rewards(dnas, aa)
+        records = [(idx[i].astype(np.uint8), float(logps[i]), rewards[i]) for i in range(n)]
+        return records, (self.cache.hits - hits, self.cache.misses - misses)
+
+
+_WORKER: Optional[RolloutWorker] = None
+
+
+def _init_worker(cfg: RolloutConfig) -> None:
+    global _WORKER
+    _WORKER = RolloutWorker(cfg)
+
+
+def _run_chunk(
+    hosts: List[str], logits: np.ndarray, aa: str, n: int, key: Tuple[int, ...],
+) -> Tuple[List[Rollout], Tuple[int, int]]:
+    return _WORKER.run(hosts, logits, aa, n, key)
+
+
+class RolloutRunner:
+    """
+    Runs one GRPO group per call, either in-process (workers <= 1) or on a process pool.
+    The learner's current logits are broadcast with every request; workers send back compact
+    (codon-index, logp, reward) records in group order. cache_hits / cache_misses accumulate the
+    workers' reward-cache counters.
+    """
+
+    def __init__(self, cfg: RolloutConfig, workers: int = 1):
+        self.cfg = cfg
+        self.workers = max(1, workers)
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._local = RolloutWorker(cfg) if self.workers == 1 else None
+        self._pool = (
+            ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker, initargs=(cfg,))
+            if self.workers > 1 else None
+        )
+
+    def rollout(self, policy: HostConditionalCodonPolicy, aa: str, n: int, step: int) -> List[Rollout]:
+        if self._pool is None:
+            return self._collect(self._local.run(policy.hosts, policy.logits, aa, n, (step, 0)))
+        futures = [
+            self._pool.submit(_run_chunk, policy.hosts, policy.logits, aa, size, (step, chunk))
+            for chunk, size in enumerate(self._chunk_sizes(n))
+        ]
+        return [r for fut in futures for r in self._collect(fut.result())]
+
+    def rollout_many(self, policy: HostConditionalCodonPolicy, aas: List[str], n: int, step: int) -> List[List[Rollout]]:
+        """One group of n per protein; all chunks of all proteins are in flight at once."""
+        if self._pool is None:
+            return [
+                self._collect(self._local.run(policy.hosts, policy.logits, aa, n, (step, b, 0)))
+                for b, aa in enumerate(aas)
+            ]
+        futures = [
+            [
+                self._pool.submit(_run_chunk, policy.hosts, policy.logits, aa, size, (step, b, chunk))
+                for chunk, size in enumerate(self._chunk_sizes(n))
+            ]
+            for b, aa in enumerate(aas)
+        ]
+        return [[r for fut in group for r in self._collect(fut.result())] for group in futures]
+
+    def _collect(self, result: Tuple[List[Rollout], Tuple[int, int]]) -> List[Rollout]:
+        records, (hits, misses) = result
+        self.cache_hits += hits
+        self.cache_misses += misses
+        return records
+
+    def _chunk_sizes(self, n: int) -> List[int]:
+        return [len(c) for c in np.array_split(np.arange(n), min(n, self.workers)) if len(c)]
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown()
+
+    def __enter__(self) -> "RolloutRunner":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+########################
+# Protein datasets
+########################
+
+_FASTA_SUFFIXES = (".fa", ".fasta", ".faa", ".fas")
+
+
+def _clean_protein(aa: str) -> Optional[str]:
+    aa = "".join(aa.split()).upper().rstrip("*")
+    if not aa or any(r not in SENSE_AAS for r in aa):
+        return None
+    return aa
+
+
+class ProteinDataset:
+    """
+    Random-access proteins from a JSONL or FASTA file.
+    Only byte offsets of valid records are kept in memory; records are re-read on access.
+    JSONL records provide `protein_aa` (or `aa`), falling back to translating `sequence`.
+    Proteins with stops or non-standard residues are skipped at indexing time.
+    """
+
+    def __init__(self, path: Optional[str] = None, sequences: Optional[List[str]] = None):
+        self.path = path
+        self.offsets: List[int] = []
+        self.skipped = 0
+        self._seqs: Optional[List[Tuple[str, str]]] = None
+        self._fh = None
+        if sequences is not None:
+            self._seqs = []
+            for i, seq in enumerate(sequences):
+                aa = _clean_protein(seq)
+                if aa is None:
+                    raise ValueError(f"Invalid protein sequence at index {i}.")
+                self._seqs.append((f"seq{i}", aa))
+        elif path is not None:
+            self.fasta = path.lower().endswith(_FASTA_SUFFIXES)
+            self._index()
+        else:
+            raise ValueError("ProteinDataset needs a path or sequences.")
+
+    def _index(self) -> None:
+        with open(self.path, "rb") as fh:
+            if self.fasta:
+                start, parts = None, []
+                pos = 0
+                for line in fh:
+                    if line.startswith(b">"):
+                        if start is not None:
+                            self._add(start, b"".join(parts).decode("ascii", errors="replace"))
+                        start, parts = pos, []
+                    elif start is not None:
+                        parts.append(line.strip())
+                    pos += len(line)
+                if start is not None:
+                    self._add(start, b"".join(parts).decode("ascii", errors="replace"))
+            else:
+                pos = 0
+                for line in fh:
+                    if line.strip():
+                        try:
+                            self._add(pos, self._jsonl_protein(json.loads(line)))
+                        except (json.JSONDecodeError, UnicodeDecodeError):
+                            self.skipped += 1
+                    pos += len(line)
+
+    def _add(self, offset: int, aa: Optional[str]) -> None:
+        if aa is not None and _clean_protein(aa) is not None:
+            self.offsets.append(offset)
+        else:
+            self.skipped += 1
+
+    @staticmethod
+    def _jsonl_protein(rec: Dict[str, Any]) -> Optional[str]:
+        aa = rec.get("protein_aa") or rec.get("aa")
+        if not aa and rec.get("sequence"):
+            aa = aa_from_dna(rec["sequence"])
+        return aa
+
+    def __len__(self) -> int:
+        return len(self._seqs) if self._seqs is not None else len(self.offsets)
+
+    def __getitem__(self, i: int) -> Tuple[str, str]:
+        """(record id, protein sequence)"""
+        if self._seqs is not None:
+            return self._seqs[i]
+        if self._fh is None:
+            self._fh = open(self.path, "rb")
+        self._fh.seek(self.offsets[i])
+        if not self.fasta:
+            rec = json.loads(self._fh.readline())
+            rid = rec.get("id") or rec.get("protein_id") or f"rec{i}"
+            return str(rid), _clean_protein(self._jsonl_protein(rec))
+        header = self._fh.readline()[1:].decode("utf-8", errors="replace").strip()
+        parts = []
+        for line in self._fh:
+            if line.startswith(b">"):
+                break
+            parts.append(line.strip())
+        return (header.split() or [f"rec{i}"])[0], _clean_protein(b"".join(parts).decode("ascii"))
+
+
+class MinibatchSampler:
+    """
+    Shuffled minibatches of dataset indices, epoch by epoch (without replacement within an epoch).
+    state()/from_state() capture the permutation, position and generator state for exact resume.
+    """
+
+    def __init__(self, n: int, batch_size: int, seed: int = 0):
+        if n <= 0:
+            raise ValueError("Cannot sample minibatches from an empty dataset.")
+        self.n = n
+        self.batch_size = max(1, batch_size)
+        self.rng = np.random.default_rng(seed)
+        self.epoch = 0
+        self.pos = 0
+        self.perm = self.rng.permutation(n)
+
+    def next_batch(self) -> List[int]:
+        out: List[int] = []
+        while len(out) < min(self.batch_size, self.n):
+            if self.pos >= self.n:
+                self.epoch += 1
+                self.pos = 0
+                self.perm = self.rng.permutation(self.n)
+            take = min(self.batch_size - len(out), self.n - self.pos)
+            out.extend(int(i) for i in self.perm[self.pos:self.pos + take])
+            self.pos += take
+        return out
+
+    def state(self) -> Dict[str, Any]:
+        return {
+            "n": self.n, "batch_size": self.batch_size, "epoch": self.epoch, "pos": self.pos,
+            "perm": self.perm.tolist(), "rng": self.rng.bit_generator.state,
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> "MinibatchSampler":
+        s = cls(state["n"], state["batch_size"])
+        s.epoch, s.pos = state["epoch"], state["pos"]
+        s.perm = np.array(state["perm"], dtype=np.int64)
+        s.rng.bit_generator.state = state["rng"]
+        return s
+
+
+########################
+# Checkpoints
+########################
+
+def save_checkpoint(
+    ckpt_dir: str,
+    step: int,
+    policy: HostConditionalCodonPolicy,
+    ref_policy: HostConditionalCodonPolicy,
+    sampler: MinibatchSampler,
+    counters: Dict[str, Any],
+    keep: int = 3,
+) -> str:
+    """Write step_XXXXXXXX.npz atomically and prune all but the newest `keep` checkpoints."""
+    os.makedirs(ckpt_dir, exist_ok=True)
+    path = os.path.join(ckpt_dir, f"step_{step:08d}.npz")
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as fh:
+        np.savez_compressed(
+            fh,
+            logits=policy.logits,
+            ref_logits=ref_policy.logits,
+            hosts=np.array(policy.hosts),
+            step=np.int64(step),
+            sampler=np.array(json.dumps(sampler.state())),
+            counters=np.array(json.dumps(counters)),
+        )
+    os.replace(tmp, path)
+    for old in sorted(glob.glob(os.path.join(ckpt_dir, "step_*.npz")))[:-max(1, keep)]:
+        os.remove(old)
+    return path
+
+
+def load_checkpoint(path: str) -> Dict[str, Any]:
+    with np.load(path, allow_pickle=False) as z:
+        hosts = [str(h) for h in z["hosts"]]
+        return {
+            "step": int(z["step"]),
+            "policy": HostConditionalCodonPolicy.from_logits(hosts, z["logits"]),
+            "ref_policy": HostConditionalCodonPolicy.from_logits(hosts, z["ref_logits"]),
+            "sampler": MinibatchSampler.from_state(json.loads(str(z["sampler"]))),
+            "counters": json.loads(str(z["counters"])),
+        }
+
+
+def latest_checkpoint(ckpt_dir: str) -> Optional[str]:
+    paths = sorted(glob.glob(os.path.join(ckpt_dir, "step_*.npz")))
+    return paths[-1] if paths else None
 
 
 def main():
     ap = argparse.ArgumentParser()
-    ap.add_argument("--aa", required=True, help="Protein amino-acid sequence")
+    src = ap.add_mutually_exclusive_group(required=True)
+    src.add_argument("--aa", help="Protein amino-acid sequence")
+    src.add_argument("--dataset", help="JSONL (protein_aa / aa / sequence) or FASTA file of proteins")
     ap.add_argument("--host", default="E_coli", help="Host key (demo: E_coli)")
-    ap.add_argument("--groups", type=int, default=8, help="Group size per GRPO step")
-    ap.add_argument("--steps", type=int, default=50, help="Number of training steps")
+    ap.add_argument("--groups", type=int, default=8, help="Group size per protein per GRPO step")
+    ap.add_argument("--batch_proteins", type=int, default=4, help="Proteins per step (--dataset)")
+    ap.add_argument("--steps", type=int, default=50, help="Total number of training steps")
     ap.add_argument("--temperature", type=float, default=1.0, help="Sampling temperature")
     ap.add_argument("--motif", action="append", default=["GAATTC","GGATCC"], help="Forbidden motifs")
     ap.add_argument("--w_rules", type=float, default=1.0)
     ap.add_argument("--w_sur", type=float, default=1.0)
     ap.add_argument("--lambda_unc", type=float, default=1.0)
+    ap.add_argument("--surrogate", default=None, help="Trained SurrogateModel (.pkl) supplying mu/sigma")
+    ap.add_argument("--lr", type=float, default=0.05)
+    ap.add_argument("--beta_ref", type=float, default=0.01)
+    ap.add_argument("--ref_refresh", type=int, default=10, help="Refresh the reference policy every N steps")
+    ap.add_argument("--workers", type=int, default=1, help="Rollout worker processes (1 = in-process)")
+    ap.add_argument("--seed", type=int, default=0, help="Base seed for minibatches and sampling streams")
+    ap.add_argument("--reward_cache", type=int, default=100_000, help="Reward LRU entries per worker (0 = off)")
+    ap.add_argument("--checkpoint_dir", default=None, help="Directory for step_XXXXXXXX.npz checkpoints")
+    ap.add_argument("--checkpoint_every", type=int, default=50)
+    ap.add_argument("--keep_checkpoints", type=int, default=3)
+    ap.add_argument("--resume", action="store_true", help="Resume from the latest checkpoint in --checkpoint_dir")
+    ap.add_argument("--metrics_log", default=None, help="Append per-step metrics as JSONL to this file")
     args = ap.parse_args()
 
-    # Initialize policy and reference
-    policy = HostConditionalCodonPolicy([args.host], init_usage=E_COLI_USAGE)
-    ref_policy = policy.clone()
-
-    aa = args.aa
-    motifs = list(args.motif) if args.motif else []
-    usage, trna = E_COLI_USAGE, E_COLI_TRNA
-    fb = assemble_feature_bundle(aa)
-    extra = fb.to_dict()
-
-    for step in range(args.steps):
-        # Sample a group of candidates
-        samples = []
-        for _ in range(args.groups):
-            dna, logp = policy.sample_sequence(aa, args.host, motifs_forbidden=motifs, temperature=args.temperature)
-            # Note: surrogate model not wired here; using placeholder mu/sigma
-            lm_feats = combined_lm_features(dna, aa=aa, host=args.host)
-            extra_with_lm = dict(extra)
-            extra_with_lm.update(lm_feats)
-            res = combine_reward(
-                dna=dna,
-                usage=usage,
-                surrogate_mu=0.0,
-                surrogate_sigma=0.0,
-                trna_w=trna,
-                cpb=None,
-                motifs=motifs,
-                lm_features=lm_feats,
-                extra_features=extra_with_lm,
-                w_surrogate=args.w_sur,
-                w_rules=args.w_rules,
-                lambda_uncertainty=args.lambda_unc,
-                enforce_hard_constraints=True,
-            )
-            samples.append((dna, logp, res["reward"]))
-
-        advs = group_relative_advantages([r for _,_,r in samples])
-        # Prepare chosen codon lists per sample
-        chosen_lists: List[List[str]] = []
-        for dna, _, _ in samples:
-            chosen_lists.append([dna[i:i+3] for i in range(0, len(dna), 3)])
-
-        # Update policy
-        policy.update_from_samples(
-            host=args.host,
-            aa_seqs=[aa]*len(samples),
-            chosen_codons=chosen_lists,
-            advantages=advs,
-            ref_policy=ref_policy,
-            lr=0.05,
-            beta_ref=0.01,
-        )
+    random.seed(args.seed)
+    if args.aa:
+        dataset = ProteinDataset(sequences=[args.aa])
+        batch_proteins = 1
+    else:
+        dataset = ProteinDataset(args.dataset)
+        batch_proteins = args.batch_proteins
+        if dataset.skipped:
+            print(json.dumps({"dataset": args.dataset, "proteins": len(dataset), "skipped": dataset.skipped}))
 
-        if (step+1) % 10 == 0:
-            # Refresh reference policy periodically
-            ref_policy = policy.clone()
+    ckpt = latest_checkpoint(args.checkpoint_dir) if (args.resume and args.checkpoint_dir) else None
+    if ckpt:
+        state = load_checkpoint(ckpt)
+        policy, ref_policy, sampler = state["policy"], state["ref_policy"], state["sampler"]
+        counters = state["counters"]
+        start = state["step"]
+        if sampler.n != len(dataset):
+            raise ValueError(f"Checkpoint {ckpt} was written for a dataset of {sampler.n} proteins, not {len(dataset)}.")
+    else:
+        # Initialize policy and reference
+        policy = HostConditionalCodonPolicy([args.host], init_usage=E_COLI_USAGE)
+        ref_policy = policy.clone()
+        sampler = MinibatchSampler(len(dataset), batch_proteins, seed=args.seed)
+        counters = {"samples": 0, "nucleotides": 0, "proteins": 0}
+        start = 0
 
-        best = max(samples, key=lambda x: x[2])
-        print(json.dumps({
-            "step": step+1,
-            "best_reward": best[2],
-            "best_dna": best[0],
-            "mean_reward": sum(r for _,_,r in samples)/len(samples)
-        }))
+    cfg = RolloutConfig(
+        host=args.host,
+        motifs=list(args.motif) if args.motif else [],
+        temperature=args.temperature,
+        w_sur=args.w_sur,
+        w_rules=args.w_rules,
+        lambda_unc=args.lambda_unc,
+        seed=args.seed,
+        reward_cache=args.reward_cache,
+        surrogate=args.surrogate,
+    )
 
-if __name__ == "__main__":
-    main()
+    metrics_fh = open(args.metrics_log, "a", encoding="utf-8") if args.metrics_log else None
+    try:
+        with RolloutRunner(cfg, workers=args.workers) as runner:
+            for step in range(start, args.steps):
+                t0 = time.time()
+                hits0, misses0 = runner.cache_hits, runner.cache_misses
+                batch = [dataset[i] for i in sampler.next_batch()]
+                aas = [aa for _, aa in batch]
+                # Sample and score one group per protein (groups are interleaved across workers)
+                if len(aas) == 1:
+                    groups = [runner.rollout(policy, aas[0], args.groups, step)]
+                else:
+                    groups = runner.rollout_many(policy, aas, args.groups, step)
+                t_rollout = time.time() - t0
+
+                # Group-relative advantages per protein, then one update over all samples
+                aa_seqs, chosen, advs, rewards = [], [], [], []
+                for aa, samples in zip(aas, groups):
+                    group_rewards = [r for _, _, r in samples]
+                    aa_seqs.extend([aa]*len(samples))
+                    chosen.extend(idx for idx, _, _ in samples)
+                    advs.extend(group_relative_advantages(group_rewards))
+                    rewards.extend(group_rewards)
+                policy.update_from_samples(
+                    host=args.host,
+                    aa_seqs=aa_seqs,
+                    chosen_codons=chosen,
+                    advantages=advs,
+                    ref_policy=ref_policy,
+                    lr=args.lr,
+                    beta_ref=args.beta_ref,
+                )
+
+                if (step+1) % args.ref_refresh == 0:
+                    # Refresh reference policy periodically
+                    ref_policy = policy.clone()
 
+                elapsed = time.time() - t0
+                n_nt = sum(3*len(aa) for aa in aa_seqs)
+                counters["samples"] += len(rewards)
+                counters["nucleotides"] += n_nt
+                counters["proteins"] += len(aas)
+                best = int(np.argmax(rewards))
+                record = {
+                    "step": step+1,
+                    "epoch": sampler.epoch,
+                    "proteins": [rid for rid, _ in batch],
+                    "best_reward": rewards[best],
+                    "best_dna": decode_codon_matrix(chosen[best][None, :])[0],
+                    "mean_reward": sum(rewards)/len(rewards),
+                    "seconds": round(elapsed, 4),
+                    "rollout_seconds": round(t_rollout, 4),
+                    "samples_per_sec": round(len(rewards)/max(elapsed, 1e-9), 2),
+                    "nt_per_sec": round(n_nt/max(elapsed, 1e-9), 1),
+                    "total_samples": counters["samples"],
+                    "cache_hits": runner.cache_hits - hits0,
+                    "cache_misses": runner.cache_misses - misses0,
+                    "cache_hit_rate": round((runner.cache_hits - hits0)/max(1, len(rewards)), 4),
+                }
+                print(json.dumps(record))
+                if metrics_fh is not None:
+                    metrics_fh.write(json.dumps(record) + "\n")
+                    metrics_fh.flush()
 
+                if args.checkpoint_dir and ((step+1) % args.checkpoint_every == 0 or step+1 == args.steps):
+                    save_checkpoint(
+                        args.checkpoint_dir, step+1, policy, ref_policy, sampler, counters, keep=args.keep_checkpoints,
+                    )
+    finally:
+        if metrics_fh is not None:
+            metrics_fh.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,423 @@
+"""
+Incremental delta-scoring for single-codon substitutions.
+
+IncrementalScorer keeps running state for every rules_score term of one CDS
+(log-w sums for CAI/tAI, GC and window-GC counts, CPB pair sums, rare-codon
+and homopolymer run totals, motif hits, identity to diversity references) and
+updates it locally when one codon changes. A substitution or its undo costs
+O(window) instead of a full rules_score call, which makes hill-climbing and
+annealing over long genes cheap. terms() returns the same keys as rules_score.
+
+mutational_scan() uses the same state to score every synonymous single-codon
+alternative of a lead sequence and returns dense (positions x alternatives)
+delta matrices per rule term, optionally with batched surrogate predictions.
+"""
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from .codon_utils import AA_TO_CODONS, CODON_TO_AA, chunk_codons, validate_cds
+from .context import ScoringContext, resolve_context
+from .metrics import (
+    DEFAULT_RULE_WEIGHTS, dG_threshold_term, extra_feature_terms, five_prime_dG_vienna,
+    five_prime_structure_proxy, gc_target_term, lm_feature_terms, weighted_rule_total,
+)
+from .motifs import compile_motifs
+
+# struct5 proxy and ΔG only read the first 48 nt (codons 0..15)
+_FIVE_PRIME_CODONS = 16
+
+
+def _run_total(buf, a: int, b: int, min_len: int) -> int:
+    """Sum of lengths of maximal equal-value runs in buf[a:b] that are at least min_len long."""
+    total = 0
+    i = a
+    while i < b:
+        j = i + 1
+        while j < b and buf[j] == buf[i]:
+            j += 1
+        if j - i >= min_len:
+            total += j - i
+        i = j
+    return total
+
+
+class IncrementalScorer:
+    """
+    Stateful rules_score for one CDS under single-codon edits.
+    - apply(i, codon) replaces codon i and returns the new total; undo() reverts the last apply
+    - delta(i, codon) returns the total change of a substitution without keeping it
+    - terms() / total mirror rules_score for the current sequence
+    Arguments have the same meaning as in metrics.rules_score. Running float sums can be
+    re-derived exactly with resync() after very long edit sequences.
+    """
+
+    def __init__(
+        self,
+        dna: str,
+        usage: Optional[Dict[str, float]] = None,
+        lm_features: Optional[dict] = None,
+        extra_features: Optional[dict] = None,
+        trna_w: Optional[Dict[str, float]] = None,
+        cpb: Optional[Dict[str, float]] = None,
+        motifs: Optional[List[str]] = None,
+        weights: Optional[Dict[str, float]] = None,
+        gc_target: Tuple[float, float] = (0.35, 0.65),
+        window_gc: Tuple[int, float, float] = (50, 0.30, 0.70),
+        rare_quantile: float = 0.2,
+        rare_min_run: int = 3,
+        homopoly_min: int = 6,
+        use_vienna_dG: bool = True,
+        dG_threshold: float = -5.0,
+        dG_range: float = 10.0,
+        diversity_refs: Optional[List[str]] = None,
+        diversity_max_identity: float = 0.98,
+        context: Optional[ScoringContext] = None,
+    ):
+        ok, msg = validate_cds(dna)
+        if not ok:
+            raise ValueError(f"Invalid CDS: {msg}")
+        self.ctx = resolve_context(context, usage, trna_w, cpb)
+        self.weights = weights or DEFAULT_RULE_WEIGHTS
+        self.scanner = compile_motifs(motifs if motifs is not None else list(self.ctx.motifs))
+        self.gc_target = gc_target
+        self.window, self.win_lo, self.win_hi = window_gc
+        self.step = max(10, self.window//5)
+        self.rare_set = self.ctx.rare_codons(rare_quantile)
+        self.rare_min_run = rare_min_run
+        self.homopoly_min = homopoly_min
+        self.use_vienna_dG = use_vienna_dG
+        self.dG_threshold = dG_threshold
+        self.dG_range = dG_range
+        self.diversity_refs = [r.upper().replace("U", "T") for r in diversity_refs or []]
+        self.diversity_max_identity = diversity_max_identity
+        self._fixed_terms = dict(lm_feature_terms(lm_features or {}))
+        self._fixed_terms["feat_struct_term"] = extra_feature_terms(extra_features or {}).get("feat_struct_term", 0.0)
+        self._history: List[Tuple[int, str]] = []
+        self._load(dna.upper().replace("U", "T"))
+
+    # ------------------------------------------------------------------ state
+
+    def _load(self, dna: str) -> None:
+        ctx = self.ctx
+        self._codons: List[str] = chunk_codons(dna)
+        self._nt = bytearray(dna, "ascii")
+        M = len(self._nt)
+        self._sum_logw = sum(ctx.log_w_map[c] for c in self._codons)
+        self._sum_logt = sum(ctx.log_trna_map[c] for c in self._codons) if ctx.log_trna_map is not None else 0.0
+        self._gc = sum(1 for b in self._nt if b in b"GC")
+        self._starts = [i for i in range(0, max(1, M-self.window+1), self.step) if i + self.window <= M]
+        self._wgc = [sum(1 for b in self._nt[s:s+self.window] if b in b"GC") for s in self._starts]
+        self._bad = sum(1 for g in self._wgc if self._out_of_band(g))
+        self._hits = self.scanner.count(dna) if self.scanner else 0
+        self._rare = [c in self.rare_set for c in self._codons]
+        self._rare_len = sum(
+            L for L in (len(r) for r in "".join("R" if f else "." for f in self._rare).split("."))
+            if L >= self.rare_min_run
+        )
+        self._hpoly = _run_total(self._nt, 0, M, self.homopoly_min)
+        self._cpb_sum, self._cpb_n = 0.0, 0
+        cpb = ctx.cpb
+        if cpb is not None:
+            for a, b in zip(self._codons, self._codons[1:]):
+                key = f"{a}-{b}"
+                if key in cpb:
+                    self._cpb_sum += cpb[key]; self._cpb_n += 1
+        self._matches = [
+            sum(1 for q in range(min(M, len(r))) if self._nt[q] == ord(r[q])) for r in self.diversity_refs
+        ]
+        self._refresh_five_prime()
+
+    def _out_of_band(self, count: int) -> bool:
+        g = count / self.window
+        return g < self.win_lo or g > self.win_hi
+
+    def _refresh_five_prime(self) -> None:
+        head = self._nt[:3*_FIVE_PRIME_CODONS].decode("ascii")
+        self._struct5 = five_prime_structure_proxy(head)
+        self._dG = five_prime_dG_vienna(head) if self.use_vienna_dG else None
+
+    def resync(self) -> None:
+        """Recompute all running state from the current sequence."""
+        self._load(self.dna)
+
+    @property
+    def dna(self) -> str:
+        return self._nt.decode("ascii")
+
+    @property
+    def codons(self) -> List[str]:
+        return list(self._codons)
+
+    def __len__(self) -> int:
+        return len(self._codons)
+
+    # ------------------------------------------------------------------ edits
+
+    def _set(self, i: int, codon: str) -> str:
+        old = self._codons[i]
+        if codon == old:
+            return old
+        ctx, nt = self.ctx, self._nt
+        M = len(nt)
+        p = 3*i
+
+        # motif hits: any hit touching [p, p+3) lies inside this window; others cancel out
+        if self.scanner:
+            lo, hi = max(0, p - self.scanner.max_len + 1), min(M, p + 3 + self.scanner.max_len - 1)
+            before = self.scanner.count(nt[lo:hi].decode("ascii"))
+        # homopolymer segment bounds only depend on the unchanged flanks
+        a = p
+        if p > 0:
+            a = p - 1
+            while a > 0 and nt[a-1] == nt[p-1]:
+                a -= 1
+        b = p + 3
+        if b < M:
+            b = p + 4
+            while b < M and nt[b] == nt[p+3]:
+                b += 1
+        hpoly_before = _run_total(nt, a, b, self.homopoly_min)
+
+        # codon-pair bias for the two pairs touching codon i
+        cpb = ctx.cpb
+        if cpb is not None:
+            for j in (i-1, i):
+                if 0 <= j and j + 1 < len(self._codons):
+                    key = f"{self._codons[j]}-{self._codons[j+1]}"
+                    if key in cpb:
+                        self._cpb_sum -= cpb[key]; self._cpb_n -= 1
+
+        # per-nucleotide updates: GC, window GC, diversity matches
+        for k in range(3):
+            q = p + k
+            ob, nb = nt[q], ord(codon[k])
+            if ob == nb:
+                continue
+            d = (nb in b"GC") - (ob in b"GC")
+            if d:
+                self._gc += d
+                first = max(0, -(-(q - self.window + 1) // self.step))
+                last = min(len(self._starts) - 1, q // self.step)
+                for w in range(first, last + 1):
+                    was = self._out_of_band(self._wgc[w])
+                    self._wgc[w] += d
+                    self._bad += self._out_of_band(self._wgc[w]) - was
+            for r_i, ref in enumerate(self.diversity_refs):
+                if q < len(ref):
+                    rb = ord(ref[q])
+                    self._matches[r_i] += (nb == rb) - (ob == rb)
+            nt[q] = nb
+
+        self._codons[i] = codon
+        self._sum_logw += ctx.log_w_map[codon] - ctx.log_w_map[old]
+        if ctx.log_trna_map is not None:
+            self._sum_logt += ctx.log_trna_map[codon] - ctx.log_trna_map[old]
+        if cpb is not None:
+            for j in (i-1, i):
+                if 0 <= j and j + 1 < len(self._codons):
+                    key = f"{self._codons[j]}-{self._codons[j+1]}"
+                    if key in cpb:
+                        self._cpb_sum += cpb[key]; self._cpb_n += 1
+        if self.scanner:
+            self._hits += self.scanner.count(nt[lo:hi].decode("ascii")) - before
+        self._hpoly += _run_total(nt, a, b, self.homopoly_min) - hpoly_before
+
+        # rare-codon runs: only the run(s) adjacent to codon i change
+        f0, f1 = self._rare[i], codon in self.rare_set
+        if f0 != f1:
+            left = 0
+            while i - left - 1 >= 0 and self._rare[i-left-1]:
+                left += 1
+            right = 0
+            while i + right + 1 < len(self._rare) and self._rare[i+right+1]:
+                right += 1
+            m = self.rare_min_run
+            joined = left + 1 + right
+            split = (left if left >= m else 0) + (right if right >= m else 0)
+            joined = joined if joined >= m else 0
+            self._rare_len += (joined - split) if f1 else (split - joined)
+            self._rare[i] = f1
+
+        if i < _FIVE_PRIME_CODONS:
+            self._refresh_five_prime()
+        return old
+
+    def apply(self, i: int, codon: str) -> float:
+        """Replace codon i (must keep a valid CDS) and return the new total."""
+        codon = codon.upper().replace("U", "T")
+        aa = CODON_TO_AA.get(codon)
+        if aa is None or aa == "*":
+            raise ValueError(f"Invalid replacement codon {codon!r}.")
+        if i == 0 and codon != "ATG":
+            raise ValueError("Codon 0 must remain the ATG start codon.")
+        self._history.append((i, self._set(i, codon)))
+        return self.total
+
+    def undo(self) -> None:
+        i, old = self._history.pop()
+        self._set(i, old)
+
+    def delta(self, i: int, codon: str) -> float:
+        """Change in total if codon i were replaced by `codon`; the sequence is left unchanged."""
+        base = self.total
+        new = self.apply(i, codon)
+        self.undo()
+        return new - base
+
+    # ------------------------------------------------------------------ scores
+
+    def terms(self) -> Dict[str, float]:
+        L = len(self._codons)
+        M = len(self._nt)
+        tai = math.exp(self._sum_logt / L) if self.ctx.trna_w is not None else 0.0
+        gc = self._gc / M
+        div_term = 0.0
+        if self.diversity_refs:
+            min_id = min(
+                (m / float(min(M, len(r))) if min(M, len(r)) else 0.0)
+                for m, r in zip(self._matches, self.diversity_refs)
+            )
+            if min_id > self.diversity_max_identity:
+                div_term = -(min_id - self.diversity_max_identity) / max(1e-6, 1.0 - self.diversity_max_identity)
+        fixed = self._fixed_terms
+        out = {
+            "lm_host_term": fixed["lm_host_term"],
+            "lm_cond_term": fixed["lm_cond_term"],
+            "lm_host_geom": fixed["lm_host_geom"],
+            "lm_cond_geom": fixed["lm_cond_geom"],
+            "lm_host_perplexity": fixed["lm_host_perplexity"],
+            "lm_cond_perplexity": fixed["lm_cond_perplexity"],
+            "cai": math.exp(self._sum_logw / L),
+            "tai": tai,
+            "gc": gc,
+            "gc_term": gc_target_term(gc, self.gc_target),
+            "win_gc_term": 1.0 - self._bad/len(self._starts) if self._starts else 1.0,
+            "struct5_proxy": self._struct5,
+            "dG_vienna": self._dG if self._dG is not None else float("nan"),
+            "dG_term": dG_threshold_term(self._dG, self.dG_threshold, self.dG_range),
+            "forbidden_hits": self._hits,
+            "rare_run_len": float(self._rare_len),
+            "homopoly_len": float(self._hpoly),
+            "cpb": (self._cpb_sum / self._cpb_n) if self._cpb_n > 0 else 0.0,
+            "feat_struct_term": fixed["feat_struct_term"],
+            "diversity_term": div_term,
+        }
+        struct_norm = 1.0 / (1.0 + math.exp(-self._struct5/3.0))
+        out["total_rules"] = weighted_rule_total(self.weights, out, struct_norm)
+        return out
+
+    @property
+    def total(self) -> float:
+        return self.terms()["total_rules"]
+
+
+########################
+# Synonymous mutational scan
+########################
+
+# largest synonymous family (Leu/Ser/Arg) has 6 codons -> 5 alternatives
+MAX_ALTERNATIVES = max(len(c) for c in AA_TO_CODONS.values()) - 1
+
+
+@dataclass
+class MutationalScan:
+    """
+    Dense result of mutational_scan for P scanned positions and A = MAX_ALTERNATIVES slots.
+    - alternatives[p, a] is the alternative codon ("" where the family is smaller; mask is False there)
+    - deltas[key][p, a] is term(mutant) - term(lead) for every rules_score key (NaN where masked),
+      plus "reward" (and "surrogate_mu" / "surrogate_sigma" when a surrogate was given)
+    """
+    dna: str
+    positions: np.ndarray
+    alternatives: np.ndarray
+    mask: np.ndarray
+    base: Dict[str, float]
+    deltas: Dict[str, np.ndarray] = field(default_factory=dict)
+
+    def best(self, key: str = "reward", n: int = 10) -> List[Tuple[int, str, float]]:
+        """Top-n (codon position, alternative codon, delta) by the given delta matrix."""
+        vals = np.where(self.mask, self.deltas[key], -np.inf)
+        flat = np.argsort(-vals, axis=None, kind="stable")[:n]
+        out = []
+        for f in flat:
+            p, a = divmod(int(f), vals.shape[1])
+            if self.mask[p, a]:
+                out.append((int(self.positions[p]), str(self.alternatives[p, a]), float(vals[p, a])))
+        return out
+
+
+def mutational_scan(
+    dna: str,
+    context: Optional[ScoringContext] = None,
+    usage: Optional[Dict[str, float]] = None,
+    positions: Optional[Sequence[int]] = None,
+    surrogate: Optional[Union[str, Any]] = None,
+    extra_features: Optional[dict] = None,
+    w_surrogate: float = 1.0,
+    w_rules: float = 1.0,
+    lambda_uncertainty: float = 1.0,
+    **rule_kwargs,
+) -> MutationalScan:
+    """
+    Score every synonymous single-codon alternative of `dna` in one call.
+
+    Rule-term deltas come from one IncrementalScorer (each alternative is a local apply/revert),
+    so the scan costs O(positions x alternatives x window) rather than that many rules_score calls.
+    `surrogate` (a SurrogateModel or a model path) is evaluated once on a batched feature matrix of
+    the lead plus all mutants. The "reward" delta follows combine_reward:
+        w_surrogate * (d_mu - lambda * d_sigma) + w_rules * d_total_rules
+    Hard motif constraints are not applied; use deltas["forbidden_hits"] to mask them.
+    rule_kwargs are forwarded to IncrementalScorer (weights, motifs, trna_w, cpb, ...).
+    The start codon (position 0) is never mutated.
+    """
+    scorer = IncrementalScorer(dna, usage=usage, context=context, extra_features=extra_features, **rule_kwargs)
+    codons = scorer.codons
+    if positions is None:
+        positions = range(1, len(codons))
+    positions = np.array([p for p in positions if 0 < p < len(codons)], dtype=np.int64)
+
+    P, A = len(positions), MAX_ALTERNATIVES
+    alternatives = np.full((P, A), "", dtype="<U3")
+    mask = np.zeros((P, A), dtype=bool)
+    for r, p in enumerate(positions):
+        alts = [c for c in AA_TO_CODONS[CODON_TO_AA[codons[p]]] if c != codons[p]]
+        alternatives[r, :len(alts)] = alts
+        mask[r, :len(alts)] = True
+
+    base = scorer.terms()
+    keys = list(base.keys())
+    deltas = {k: np.full((P, A), np.nan) for k in keys}
+    for r, p in enumerate(positions):
+        for a in range(A):
+            if not mask[r, a]:
+                break
+            old = scorer._set(int(p), str(alternatives[r, a]))
+            t = scorer.terms()
+            scorer._set(int(p), old)
+            for k in keys:
+                deltas[k][r, a] = t[k] - base[k]
+
+    reward = w_rules * deltas["total_rules"]
+    if surrogate is not None:
+        from .surrogate import build_feature_matrix, get_surrogate
+        model = get_surrogate(surrogate) if isinstance(surrogate, str) else surrogate
+        rows, cols = np.nonzero(mask)
+        lead = scorer.dna
+        mutants = [lead[:3*p] + alternatives[r, a] + lead[3*p+3:] for r, a, p in zip(rows, cols, positions[rows])]
+        X, _ = build_feature_matrix([lead] + mutants, extra_features=extra_features, context=scorer.ctx)
+        mu, sigma = model.predict_mu_sigma(X)
+        for key, vals in (("surrogate_mu", mu), ("surrogate_sigma", sigma)):
+            d = np.full((P, A), np.nan)
+            d[rows, cols] = vals[1:] - vals[0]
+            deltas[key] = d
+        base["surrogate_mu"], base["surrogate_sigma"] = float(mu[0]), float(sigma[0])
+        reward = reward + w_surrogate * (deltas["surrogate_mu"] - lambda_uncertainty * deltas["surrogate_sigma"])
+    deltas["reward"] = reward
+    return MutationalScan(
+        dna=scorer.dna, positions=positions, alternatives=alternatives, mask=mask, base=base, deltas=deltas,
+    )
@@ -1,10 +1,18 @@
 
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, List, Tuple, Optional, Sequence, Union
 import math
 from collections import defaultdict
+from functools import lru_cache
 import shutil, subprocess
 
-from .codon_utils import chunk_codons, validate_cds, CODON_TO_AA, AA_TO_CODONS, relative_adaptiveness_from_usage
+import numpy as np
+
+from .codon_utils import (
+    chunk_codons, validate_cds, CODON_TO_AA, AA_TO_CODONS, CODONS, CODON_INDEX,
+    relative_adaptiveness_from_usage, encode_nucleotides, encode_codon_matrix,
+)
+from .context import ScoringContext, resolve_context
+from .motifs import compile_motifs
 
 ########################
 # Core sequence metrics
@@ -64,12 +72,17 @@ def tandem_repeats(seq: str, min_unit: int = 2, max_unit: int = 6, min_repeats:
 # CAI / tAI
 ########################
 
-def cai(dna: str, usage: Dict[str, float]) -> float:
+def cai(dna: str, usage: Optional[Dict[str, float]] = None, context: Optional[ScoringContext] = None) -> float:
     ok, msg = validate_cds(dna)
     if not ok:
         raise ValueError(f"Invalid CDS for CAI: {msg}")
-    w = relative_adaptiveness_from_usage(usage)
     codons = chunk_codons(dna)
+    if context is not None:
+        # an explicitly passed usage table takes precedence over the context's
+        log_w = resolve_context(context, usage).log_w_map
+        logs = [log_w[c] for c in codons if CODON_TO_AA.get(c,"*") != "*"]
+        return math.exp(sum(logs) / len(logs)) if logs else 0.0
+    w = relative_adaptiveness_from_usage(usage)
     logs = []
     for c in codons:
         if CODON_TO_AA.get(c,"*") == "*":
@@ -78,10 +91,16 @@ def cai(dna: str, usage: Dict[str, float]) -> float:
         logs.append(math.log(wi))
     return math.exp(sum(logs) / len(logs)) if logs else 0.0
 
-def tai(dna: str, trna_weights: Dict[str, float]) -> float:
+def tai(dna: str, trna_weights: Optional[Dict[str, float]] = None, context: Optional[ScoringContext] = None) -> float:
     ok, msg = validate_cds(dna)
     if not ok:
         raise ValueError(f"Invalid CDS for tAI: {msg}")
+    if context is not None:
+        context = resolve_context(context, trna_w=trna_weights)
+    if context is not None and context.log_trna_map is not None:
+        log_t = context.log_trna_map
+        logs = [log_t[c] for c in chunk_codons(dna) if CODON_TO_AA.get(c, "*") != "*"]
+        return math.exp(sum(logs)/len(logs)) if logs else 0.0
     fam_max = defaultdict(float)
     for aa, codons in AA_TO_CODONS.items():
         for c in codons:
@@ -103,24 +122,34 @@ def tai(dna: str, trna_weights: Dict[str, float]) -> float:
 # Rare codons / codon-pair
 ########################
 
-def rare_codon_runs(dna: str, usage: Dict[str,float], quantile: float = 0.2, min_run: int = 3) -> List[Tuple[int,int]]:
-    w = relative_adaptiveness_from_usage(usage)
+def rare_codon_runs(
+    dna: str,
+    usage: Optional[Dict[str,float]] = None,
+    quantile: float = 0.2,
+    min_run: int = 3,
+    context: Optional[ScoringContext] = None,
+) -> List[Tuple[int,int]]:
     codons = chunk_codons(dna)
-    fam_w = {}
-    for aa, cods in AA_TO_CODONS.items():
-        vals = [w[c] for c in cods if c in w]
-        if not vals:
-            continue
-        vals_sorted = sorted(vals)
-        idx = max(0, min(len(vals_sorted)-1, int(quantile*len(vals_sorted))))
-        fam_w[aa] = vals_sorted[idx]
-    rare = []
-    for i,c in enumerate(codons):
-        aa = CODON_TO_AA.get(c, None)
-        if aa is None or aa == "*": 
-            rare.append(False); continue
-        thr = fam_w.get(aa, 0.0)
-        rare.append(w.get(c, 0.0) <= thr)
+    if context is not None:
+        rare_set = resolve_context(context, usage).rare_codons(quantile)
+        rare = [c in rare_set for c in codons]
+    else:
+        w = relative_adaptiveness_from_usage(usage)
+        fam_w = {}
+        for aa, cods in AA_TO_CODONS.items():
+            vals = [w[c] for c in cods if c in w]
+            if not vals:
+                continue
+            vals_sorted = sorted(vals)
+            idx = max(0, min(len(vals_sorted)-1, int(quantile*len(vals_sorted))))
+            fam_w[aa] = vals_sorted[idx]
+        rare = []
+        for i,c in enumerate(codons):
+            aa = CODON_TO_AA.get(c, None)
+            if aa is None or aa == "*": 
+                rare.append(False); continue
+            thr = fam_w.get(aa, 0.0)
+            rare.append(w.get(c, 0.0) <= thr)
     runs = []
     i=0
     while i < len(rare):
@@ -136,7 +165,9 @@ def rare_codon_runs(dna: str, usage: Dict[str,float], quantile: float = 0.2, min
             i+=1
     return runs
 
-def codon_pair_bias_score(dna: str, cpb: Optional[Dict[str,float]] = None) -> float:
+def codon_pair_bias_score(dna: str, cpb: Optional[Dict[str,float]] = None, context: Optional[ScoringContext] = None) -> float:
+    if cpb is None and context is not None:
+        cpb = context.cpb
     if cpb is None: 
         return 0.0
     codons = chunk_codons(dna)
@@ -151,19 +182,14 @@ def codon_pair_bias_score(dna: str, cpb: Optional[Dict[str,float]] = None) -> fl
 # Forbidden motifs and diversity
 ########################
 
-def find_forbidden_sites(seq: str, motifs: List[str]) -> List[Tuple[str,int]]:
-    s = seq.upper().replace("U","T")
-    hits = []
-    for m in motifs:
-        mm = m.upper().replace("U","T")
-        start = 0
-        while True:
-            k = s.find(mm, start)
-            if k == -1:
-                break
-            hits.append((mm, k))
-            start = k + 1
-    return hits
+def find_forbidden_sites(seq: str, motifs: List[str], both_strands: bool = True) -> List[Tuple[str,int]]:
+    """
+    All (motif, start) occurrences, overlapping, in one pass of the cached motif automaton.
+    Motifs may use IUPAC codes; with both_strands, reverse-complement hits are reported at their forward start.
+    """
+    if not motifs:
+        return []
+    return compile_motifs(motifs, both_strands=both_strands).find_all(seq)
 
 def sequence_identity(a: str, b: str) -> float:
     """
@@ -268,6 +294,16 @@ def five_prime_structure_proxy(dna: str, window_nt: int = 45) -> float:
 def _rnalfold_available() -> bool:
     return shutil.which("RNAfold") is not None
 
+@lru_cache(maxsize=1)
+def _vienna_backends() -> Tuple[bool, bool]:
+    """(python bindings importable, RNAfold CLI on PATH); probed once per process."""
+    try:
+        import RNA  # type: ignore
+        has_py = True
+    except Exception:
+        has_py = False
+    return has_py, _rnalfold_available()
+
 def five_prime_dG_vienna(dna: str, window_nt: int = 45) -> Optional[float]:
     """
     Compute 5' window minimum free energy ΔG (kcal/mol) using ViennaRNA.
@@ -281,16 +317,18 @@ def five_prime_dG_vienna(dna: str, window_nt: int = 45) -> Optional[float]:
     region = s[3:3+window_nt] if len(s) > 3 else ""
     if not region:
         return None
+    has_py, has_cli = _vienna_backends()
     # Try Python bindings
-    try:
-        import RNA  # type: ignore
-        fc = RNA.fold_compound(region.replace("T","U"))
-        structure, mfe = fc.mfe()
-        return float(mfe)
-    except Exception:
-        pass
+    if has_py:
+        try:
+            import RNA  # type: ignore
+            fc = RNA.fold_compound(region.replace("T","U"))
+            structure, mfe = fc.mfe()
+            return float(mfe)
+        except Exception:
+            pass
     # Try CLI fallback
-    if _rnalfold_available():
+    if has_cli:
         try:
             proc = subprocess.run(
                 ["RNAfold", "--noPS"],
@@ -317,9 +355,41 @@ def five_prime_dG_vienna(dna: str, window_nt: int = 45) -> Optional[float]:
 # Aggregate rule score
 ########################
 
+DEFAULT_RULE_WEIGHTS: Dict[str, float] = {
+    "lm_host": 0.6,
+    "lm_cond": 0.25,
+    "cai": 1.0,
+    "tai": 0.5,
+    "gc": 0.5,
+    "win_gc": 0.5,
+    "struct5": 0.5,
+    "struct5_dG": 0.5,
+    "forbidden": -1.0,
+    "rare_runs": -0.5,
+    "homopoly": -0.3,
+    "cpb": 0.2,
+    "feat_struct": 0.3,
+    "diversity": 0.3,
+}
+
+def gc_target_term(gc: float, gc_target: Tuple[float,float] = (0.35, 0.65)) -> float:
+    """1.0 inside the GC target band, decreasing linearly to 0 towards GC=0 or GC=1."""
+    gc_lo, gc_hi = gc_target
+    term = 1.0 - max(0.0, (gc_lo - gc)/(gc_lo) if gc < gc_lo else ( gc - gc_hi )/(1.0-gc_hi) )
+    return max(0.0, min(1.0, term))
+
+def dG_threshold_term(dG: Optional[float], dG_threshold: float = -5.0, dG_range: float = 10.0) -> float:
+    """ΔG term: reward sequences whose ΔG is above threshold (less structured); 0 when ΔG is unavailable."""
+    if dG is None:
+        return 0.0
+    if dG >= dG_threshold:
+        return 1.0
+    # Linear ramp down over dG_range (kcal/mol)
+    return max(0.0, 1.0 - (dG_threshold - dG)/max(1e-6, dG_range))
+
 def rules_score(
     dna: str,
-    usage: Dict[str,float],
+    usage: Optional[Dict[str,float]] = None,
     lm_features: Optional[dict] = None,
     extra_features: Optional[dict] = None,
     trna_w: Optional[Dict[str,float]] = None,
@@ -336,37 +406,26 @@ def rules_score(
     dG_range: float = 10.0,
     diversity_refs: Optional[List[str]] = None,
     diversity_max_identity: float = 0.98,
+    context: Optional[ScoringContext] = None,
 ) -> Dict[str, float]:
     """
     Combine rule-based metrics into a single total score.
+    With `context`, its precomputed tables (and motif list, if motifs is None) are used;
+    explicitly passed usage/trna_w/cpb tables take precedence.
     """
     if weights is None:
-        weights = {
-            "lm_host": 0.6,
-            "lm_cond": 0.25,
-            "cai": 1.0,
-            "tai": 0.5,
-            "gc": 0.5,
-            "win_gc": 0.5,
-            "struct5": 0.5,
-            "struct5_dG": 0.5,
-            "forbidden": -1.0,
-            "rare_runs": -0.5,
-            "homopoly": -0.3,
-            "cpb": 0.2,
-            "feat_struct": 0.3,
-            "diversity": 0.3,
-        }
+        weights = DEFAULT_RULE_WEIGHTS
     ok, msg = validate_cds(dna)
     if not ok:
         raise ValueError(f"Invalid CDS: {msg}")
+    ctx = resolve_context(context, usage, trna_w, cpb)
+    if motifs is None:
+        motifs = list(ctx.motifs)
 
-    _cai = cai(dna, usage)
-    _tai = tai(dna, trna_w) if trna_w is not None else 0.0
+    _cai = cai(dna, context=ctx)
+    _tai = tai(dna, context=ctx) if ctx.trna_w is not None else 0.0
     _gc = gc_content(dna)
-    gc_lo, gc_hi = gc_target
-    gc_term = 1.0 - max(0.0, (gc_lo - _gc)/(gc_lo) if _gc < gc_lo else ( _gc - gc_hi )/(1.0-gc_hi) )
-    gc_term = max(0.0, min(1.0, gc_term))
+    gc_term = gc_target_term(_gc, gc_target)
 
     win, wlo, whi = window_gc
     win_gcs = sliding_gc(dna, window=win, step=max(10, win//5))
@@ -381,13 +440,13 @@ def rules_score(
     hits = find_forbidden_sites(dna, motifs or [])
     _forbidden = -float(len(hits))
 
-    runs = rare_codon_runs(dna, usage, quantile=rare_quantile, min_run=rare_min_run)
+    runs = rare_codon_runs(dna, quantile=rare_quantile, min_run=rare_min_run, context=ctx)
     _rare = -float(sum(L for _,L in runs))
 
     homos = homopolymers(dna, min_len=homopoly_min)
     _hpoly = -float(sum(L for _,_,L in homos))
 
-    _cpb = codon_pair_bias_score(dna, cpb)
+    _cpb = codon_pair_bias_score(dna, context=ctx)
 
     lm_terms = lm_feature_terms(lm_features or {})
     _extra = extra_feature_terms(extra_features or {})
@@ -401,31 +460,8 @@ def rules_score(
             div_term = - (min_id - diversity_max_identity) / max(1e-6, 1.0 - diversity_max_identity)
 
     struct_norm = 1.0 / (1.0 + math.exp(-_struct5/3.0))
-    # ΔG term: reward sequences whose ΔG is above threshold (less structured)
-    dG_term = 0.0
-    if _dG is not None:
-        if _dG >= dG_threshold:
-            dG_term = 1.0
-        else:
-            # Linear ramp down over dG_range (kcal/mol)
-            dG_term = max(0.0, 1.0 - (dG_threshold - _dG)/max(1e-6, dG_range))
-    total = (
-        weights["lm_host"] * lm_terms["lm_host_term"] +
-        weights["lm_cond"] * lm_terms["lm_cond_term"] +
-        weights["cai"] * _cai +
-        weights["tai"] * _tai +
-        weights["gc"] * gc_term +
-        weights["win_gc"] * _win_gc +
-        weights["struct5"] * struct_norm +
-        weights["struct5_dG"] * dG_term +
-        weights["forbidden"] * (-_forbidden) +
-        weights["rare_runs"] * (-_rare) +
-        weights["homopoly"] * (-_hpoly) +
-        weights["cpb"] * _cpb +
-        weights["feat_struct"] * _extra.get("feat_struct_term", 0.0)
-        + weights["diversity"] * div_term
-    )
-    return {
+    dG_term = dG_threshold_term(_dG, dG_threshold, dG_range)
+    out = {
         "lm_host_term": lm_terms["lm_host_term"],
         "lm_cond_term": lm_terms["lm_cond_term"],
         "lm_host_geom": lm_terms["lm_host_geom"],
@@ -446,5 +482,297 @@ def rules_score(
         "cpb": _cpb,
         "feat_struct_term": _extra.get("feat_struct_term", 0.0),
         "diversity_term": div_term,
-        "total_rules": total,
     }
+    out["total_rules"] = weighted_rule_total(weights, out, struct_norm)
+    return out
+
+def weighted_rule_total(weights: Dict[str,float], terms: Dict, struct_norm):
+    """
+    Weighted sum of rule terms as returned by rules_score (scalars or equal-length arrays).
+    struct_norm is the logistic-normalised struct5_proxy.
+    """
+    return (
+        weights["lm_host"] * terms["lm_host_term"] +
+        weights["lm_cond"] * terms["lm_cond_term"] +
+        weights["cai"] * terms["cai"] +
+        weights["tai"] * terms["tai"] +
+        weights["gc"] * terms["gc_term"] +
+        weights["win_gc"] * terms["win_gc_term"] +
+        weights["struct5"] * struct_norm +
+        weights["struct5_dG"] * terms["dG_term"] +
+        weights["forbidden"] * terms["forbidden_hits"] +
+        weights["rare_runs"] * terms["rare_run_len"] +
+        weights["homopoly"] * terms["homopoly_len"] +
+        weights["cpb"] * terms["cpb"] +
+        weights["feat_struct"] * terms["feat_struct_term"]
+        + weights["diversity"] * terms["diversity_term"]
+    )
+
+########################
+# Batched rule score
+########################
+
+RULE_SCORE_KEYS = (
+    "lm_host_term", "lm_cond_term", "lm_host_geom", "lm_cond_geom",
+    "lm_host_perplexity", "lm_cond_perplexity",
+    "cai", "tai", "gc", "gc_term", "win_gc_term", "struct5_proxy", "dG_vienna", "dG_term",
+    "forbidden_hits", "rare_run_len", "homopoly_len", "cpb", "feat_struct_term",
+    "diversity_term", "total_rules",
+)
+
+# Per-codon GC count, indexed like CODONS
+_CODON_GC = np.array([sum(b in "GC" for b in c) for c in CODONS], dtype=np.int64)
+_STOP_MASK = np.array([CODON_TO_AA[c] == "*" for c in CODONS])
+_START_IDX = CODON_INDEX["ATG"]
+
+def _run_length_totals(mat: np.ndarray, min_len: int, only_true: bool = False) -> np.ndarray:
+    """
+    Sum of lengths of maximal runs of equal values with length >= min_len, per row of an (N, M) matrix.
+    With only_true, only runs of truthy values are counted (mat must be boolean).
+    """
+    N, M = mat.shape
+    if M == 0:
+        return np.zeros(N)
+    starts = np.ones((N, M), dtype=bool)
+    starts[:, 1:] = mat[:, 1:] != mat[:, :-1]
+    rows, cols = np.nonzero(starts)
+    ends = np.empty_like(cols)
+    ends[:-1] = cols[1:]
+    ends[-1] = M
+    ends[np.nonzero(rows[1:] != rows[:-1])[0]] = M
+    lengths = ends - cols
+    keep = lengths >= min_len
+    if only_true:
+        keep &= mat[rows, cols]
+    return np.bincount(rows[keep], weights=lengths[keep], minlength=N)
+
+def _kmer_codes(nt: np.ndarray, k: int) -> np.ndarray:
+    """Base-4 integer code of every k-mer in each row of an (N, M) nucleotide matrix -> (N, M-k+1)."""
+    M = nt.shape[1]
+    codes = np.zeros((nt.shape[0], max(0, M-k+1)), dtype=np.int64)
+    for j in range(k):
+        codes = codes*4 + nt[:, j:M-k+1+j]
+    return codes
+
+def _struct5_proxy_batch(nt: np.ndarray, window_nt: int = 45) -> np.ndarray:
+    """five_prime_structure_proxy for every row: a k-mer scores if its reverse complement occurs in the window."""
+    w = nt[:, 3:3+window_nt].astype(np.int64)
+    score = np.zeros(nt.shape[0])
+    for k in (5, 4, 3):
+        if w.shape[1] < k:
+            continue
+        fwd = _kmer_codes(w, k)
+        rc = _kmer_codes(3 - w[:, ::-1], k)
+        hit = (fwd[:, :, None] == rc[:, None, :]).any(axis=2)
+        score += (6-k) * hit.sum(axis=1)
+    return -score
+
+def _encode_ref(ref: str) -> np.ndarray:
+    return encode_nucleotides([ref])[0] if ref else np.zeros(0, dtype=np.uint8)
+
+def broadcast_per_candidate(obj, n: int) -> list:
+    """Broadcast a shared dict (or None) to n entries; pass per-candidate lists through."""
+    if obj is None or isinstance(obj, dict):
+        return [obj] * n
+    obj = list(obj)
+    if len(obj) != n:
+        raise ValueError(f"Expected {n} per-candidate entries, got {len(obj)}.")
+    return obj
+
+def sequence_metrics_batch(
+    seqs: Sequence[str],
+    usage: Optional[Dict[str,float]] = None,
+    trna_w: Optional[Dict[str,float]] = None,
+    cpb: Optional[Dict[str,float]] = None,
+    motifs: Optional[List[str]] = None,
+    window: int = 50,
+    step: int = 10,
+    rare_quantile: float = 0.2,
+    rare_min_run: int = 3,
+    homopoly_min: int = 6,
+    use_vienna_dG: bool = True,
+    context: Optional[ScoringContext] = None,
+) -> Dict[str, np.ndarray]:
+    """
+    Per-candidate metric record for N equal-length CDS, computed once and shared by rules_score_batch
+    and the surrogate featurizer (surrogate.feature_matrix_from_metrics). Each entry is an array over
+    the N candidates: len_nt, cai, tai, gc, gc_windows (N, W), struct5_proxy, dG_vienna,
+    forbidden_hits, rare_run_len, homopoly_len, cpb and codon_counts (N, 64, indexed like CODONS).
+    "params" records the window/run settings the record was computed with.
+    """
+    ctx = resolve_context(context, usage, trna_w, cpb)
+    if motifs is None:
+        motifs = list(ctx.motifs)
+    seqs = list(seqs)
+    N = len(seqs)
+    params = {
+        "window": window, "step": step, "rare_quantile": rare_quantile, "rare_min_run": rare_min_run,
+        "homopoly_min": homopoly_min, "use_vienna_dG": use_vienna_dG, "motifs": tuple(motifs),
+    }
+    if N == 0:
+        return {"n": 0, "params": params}
+    idx = encode_codon_matrix(seqs)
+    nt = encode_nucleotides(seqs)
+    L = idx.shape[1]
+    bad = np.zeros(N, dtype=bool) if L else np.ones(N, dtype=bool)
+    if L:
+        bad |= (nt.shape[1] % 3 != 0) | (idx < 0).any(axis=1) | (idx[:, 0] != _START_IDX)
+        bad |= _STOP_MASK[np.where(idx < 0, 0, idx)].any(axis=1)
+    if bad.any():
+        i = int(np.argmax(bad))
+        ok, msg = validate_cds(seqs[i])
+        raise ValueError(f"Invalid CDS at index {i}: {msg}")
+
+    M = nt.shape[1]
+    starts = np.arange(0, max(1, M-window+1), step)
+    starts = starts[starts + window <= M]
+    gc_windows = np.zeros((N, 0))
+    if starts.size:
+        csum = np.zeros((N, M+1), dtype=np.int64)
+        np.cumsum((nt == 1) | (nt == 2), axis=1, out=csum[:, 1:])
+        gc_windows = (csum[:, starts+window] - csum[:, starts]) / window
+
+    _dG = np.full(N, np.nan)
+    if use_vienna_dG and any(_vienna_backends()):
+        # ΔG only depends on the 5' window; fold each distinct window once
+        dG_memo: Dict[str, Optional[float]] = {}
+        for i, s in enumerate(seqs):
+            head = s[:48]
+            if head not in dG_memo:
+                dG_memo[head] = five_prime_dG_vienna(head)
+            if dG_memo[head] is not None:
+                _dG[i] = dG_memo[head]
+
+    _cpb = np.zeros(N)
+    if ctx.cpb is not None and L > 1:
+        pair_val, pair_mask = ctx.pair_tables
+        pairs = idx[:, :-1].astype(np.int64)*64 + idx[:, 1:]
+        n_pairs = pair_mask[pairs].sum(axis=1)
+        _cpb = np.where(n_pairs > 0, pair_val[pairs].sum(axis=1) / np.maximum(1, n_pairs), 0.0)
+
+    rows = np.repeat(np.arange(N), L)
+    return {
+        "n": N,
+        "params": params,
+        "len_nt": np.full(N, float(M)),
+        "cai": np.exp(ctx.log_w[idx].sum(axis=1) / L),
+        "tai": np.exp(ctx.log_trna[idx].sum(axis=1) / L) if ctx.trna_w is not None else np.zeros(N),
+        "gc": _CODON_GC[idx].sum(axis=1) / float(M),
+        "gc_windows": gc_windows,
+        "struct5_proxy": _struct5_proxy_batch(nt),
+        "dG_vienna": _dG,
+        "forbidden_hits": compile_motifs(motifs).count_batch(nt) if motifs else np.zeros(N, dtype=np.int64),
+        "rare_run_len": _run_length_totals(ctx.rare_mask(rare_quantile)[idx], rare_min_run, only_true=True),
+        "homopoly_len": _run_length_totals(nt, homopoly_min),
+        "cpb": _cpb,
+        "codon_counts": np.bincount(rows * 64 + idx.ravel(), minlength=N * 64).reshape(N, 64),
+    }
+
+def rules_score_batch(
+    seqs: Sequence[str],
+    usage: Optional[Dict[str,float]] = None,
+    lm_features: Optional[Union[dict, Sequence[Optional[dict]]]] = None,
+    extra_features: Optional[Union[dict, Sequence[Optional[dict]]]] = None,
+    trna_w: Optional[Dict[str,float]] = None,
+    cpb: Optional[Dict[str,float]] = None,
+    motifs: Optional[List[str]] = None,
+    weights: Optional[Dict[str,float]] = None,
+    gc_target: Tuple[float,float] = (0.35, 0.65),
+    window_gc: Tuple[int,float,float] = (50, 0.30, 0.70),
+    rare_quantile: float = 0.2,
+    rare_min_run: int = 3,
+    homopoly_min: int = 6,
+    use_vienna_dG: bool = True,
+    dG_threshold: float = -5.0,
+    dG_range: float = 10.0,
+    diversity_refs: Optional[List[str]] = None,
+    diversity_max_identity: float = 0.98,
+    context: Optional[ScoringContext] = None,
+    metrics: Optional[Dict[str, np.ndarray]] = None,
+) -> Dict[str, np.ndarray]:
+    """
+    Vectorized rules_score over N equal-length candidates (e.g. all designs for one protein).
+
+    Sequences are encoded once into an (N, L) codon-index matrix and every sequence-wide term is
+    computed as an array operation. Returns the same keys as rules_score, each an array of length N.
+    lm_features / extra_features may be a single shared dict or one dict per candidate.
+    The 5' structure terms only look at the first codons and are evaluated once per distinct 5' window.
+    Pass a sequence_metrics_batch record as `metrics` to reuse metrics already computed for these
+    sequences (e.g. while building surrogate features); the window/run arguments are then ignored.
+    """
+    if weights is None:
+        weights = DEFAULT_RULE_WEIGHTS
+    win, wlo, whi = window_gc
+    if metrics is None:
+        metrics = sequence_metrics_batch(
+            seqs, usage, trna_w, cpb, motifs, window=win, step=max(10, win//5),
+            rare_quantile=rare_quantile, rare_min_run=rare_min_run, homopoly_min=homopoly_min,
+            use_vienna_dG=use_vienna_dG, context=context,
+        )
+    N = metrics["n"]
+    if N == 0:
+        return {k: np.zeros(0) for k in RULE_SCORE_KEYS}
+
+    _cai, _tai, _gc = metrics["cai"], metrics["tai"], metrics["gc"]
+    gc_lo, gc_hi = gc_target
+    gc_excess = np.where(_gc < gc_lo, (gc_lo - _gc)/gc_lo, (_gc - gc_hi)/(1.0-gc_hi))
+    gc_term = np.clip(1.0 - np.maximum(0.0, gc_excess), 0.0, 1.0)
+
+    win_gcs = metrics["gc_windows"]
+    _win_gc = np.ones(N)
+    if win_gcs.shape[1]:
+        _win_gc = 1.0 - ((win_gcs < wlo) | (win_gcs > whi)).sum(axis=1) / win_gcs.shape[1]
+
+    _struct5 = metrics["struct5_proxy"]
+    _dG = metrics["dG_vienna"]
+    hits = metrics["forbidden_hits"]
+    _rare = metrics["rare_run_len"]
+    _hpoly = metrics["homopoly_len"]
+    _cpb = metrics["cpb"]
+
+    lm_cols = {k: np.empty(N) for k in RULE_SCORE_KEYS[:6]}
+    for i, lm in enumerate(broadcast_per_candidate(lm_features, N)):
+        for k, v in lm_feature_terms(lm or {}).items():
+            lm_cols[k][i] = v
+    feat_struct = np.array([
+        extra_feature_terms(ex or {}).get("feat_struct_term", 0.0)
+        for ex in broadcast_per_candidate(extra_features, N)
+    ], dtype=float)
+
+    div_term = np.zeros(N)
+    if diversity_refs:
+        nt = encode_nucleotides(list(seqs))
+        M = nt.shape[1]
+        min_id = np.full(N, np.inf)
+        for ref in diversity_refs:
+            r = _encode_ref(ref)
+            n = min(M, r.size)
+            ident = (nt[:, :n] == r[:n]).sum(axis=1) / float(n) if n else np.zeros(N)
+            min_id = np.minimum(min_id, ident)
+        over = min_id > diversity_max_identity
+        div_term = np.where(over, -(min_id - diversity_max_identity) / max(1e-6, 1.0 - diversity_max_identity), 0.0)
+
+    struct_norm = 1.0 / (1.0 + np.exp(-_struct5/3.0))
+    dG_term = np.where(
+        np.isnan(_dG), 0.0,
+        np.where(_dG >= dG_threshold, 1.0, np.maximum(0.0, 1.0 - (dG_threshold - _dG)/max(1e-6, dG_range))),
+    )
+    out = {
+        **lm_cols,
+        "cai": _cai,
+        "tai": _tai,
+        "gc": _gc,
+        "gc_term": gc_term,
+        "win_gc_term": _win_gc,
+        "struct5_proxy": _struct5,
+        "dG_vienna": _dG,
+        "dG_term": dG_term,
+        "forbidden_hits": hits,
+        "rare_run_len": _rare,
+        "homopoly_len": _hpoly,
+        "cpb": _cpb,
+        "feat_struct_term": feat_struct,
+        "diversity_term": div_term,
+    }
+    out["total_rules"] = weighted_rule_total(weights, out, struct_norm)
+    return out
@@ -0,0 +1,217 @@
+"""
+Compiled multi-motif scanner for forbidden sites.
+
+All forbidden motifs (restriction sites, homology arms, ...) are compiled into a
+single Aho-Corasick automaton over the ACGT alphabet, so one pass over a
+sequence finds every hit regardless of how many motifs are screened.
+
+- IUPAC degenerate bases (e.g. "GCNGC", "GGTCTCN") are expanded at compile time.
+- Both strands are covered by also compiling the reverse complement of every
+  expanded pattern; reverse-strand hits are reported in forward coordinates.
+- Automata are cached per motif set via compile_motifs().
+
+The fully resolved transition table is exposed per nucleotide (`delta`) and per
+codon (`codon_table`) so that decoders can track the automaton state
+incrementally instead of rescanning the growing prefix.
+"""
+from __future__ import annotations
+
+from collections import deque
+from functools import cached_property, lru_cache
+from itertools import product
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .codon_utils import CODONS, NUCLEOTIDES
+
+IUPAC_CODES: Dict[str, str] = {
+    "A": "A", "C": "C", "G": "G", "T": "T", "U": "T",
+    "R": "AG", "Y": "CT", "S": "CG", "W": "AT", "K": "GT", "M": "AC",
+    "B": "CGT", "D": "AGT", "H": "ACT", "V": "ACG", "N": "ACGT",
+}
+
+_COMPLEMENT = str.maketrans("ACGT", "TGCA")
+# byte -> nucleotide id (A=0, C=1, G=2, T/U=3); anything else -> 4, which resets the automaton
+_BYTE_TO_NT = bytes(
+    {ord("A"): 0, ord("C"): 1, ord("G"): 2, ord("T"): 3, ord("U"): 3,
+     ord("a"): 0, ord("c"): 1, ord("g"): 2, ord("t"): 3, ord("u"): 3}.get(i, 4)
+    for i in range(256)
+)
+
+
+def normalize_motif(motif: str) -> str:
+    return motif.strip().upper().replace("U", "T")
+
+
+def expand_iupac(motif: str) -> List[str]:
+    """All concrete ACGT strings matched by an IUPAC motif."""
+    m = normalize_motif(motif)
+    try:
+        choices = [IUPAC_CODES[b] for b in m]
+    except KeyError as e:
+        raise ValueError(f"Unsupported character {e.args[0]!r} in motif {motif!r}") from None
+    return ["".join(p) for p in product(*choices)]
+
+
+def reverse_complement(seq: str) -> str:
+    return seq.upper().replace("U", "T").translate(_COMPLEMENT)[::-1]
+
+
+class MotifScanner:
+    """
+    Aho-Corasick automaton for a set of (IUPAC) motifs.
+    - delta[state*5 + nt] is the next state (nt=4 for non-ACGT characters resets to the root)
+    - out[state] lists (motif_id, pattern_length) for every pattern ending in that state
+    - motifs[motif_id] is the normalised motif as given by the caller (hits are labelled with it)
+    """
+
+    def __init__(self, motifs: Sequence[str], both_strands: bool = True):
+        self.motifs: Tuple[str, ...] = tuple(normalize_motif(m) for m in motifs if m and m.strip())
+        self.both_strands = both_strands
+
+        # pattern -> motif ids (a pattern shared by several motifs reports each of them)
+        patterns: Dict[str, List[int]] = {}
+        for mid, m in enumerate(self.motifs):
+            expanded = set(expand_iupac(m))
+            if both_strands:
+                expanded |= {reverse_complement(p) for p in expanded}
+            for p in expanded:
+                ids = patterns.setdefault(p, [])
+                if mid not in ids:
+                    ids.append(mid)
+        self.n_patterns = len(patterns)
+        self.max_len = max((len(p) for p in patterns), default=0)
+
+        goto: List[List[int]] = [[-1]*4]
+        out: List[List[Tuple[int, int]]] = [[]]
+        for p, ids in patterns.items():
+            s = 0
+            for ch in p:
+                b = NUCLEOTIDES.index(ch)
+                if goto[s][b] == -1:
+                    goto[s][b] = len(goto)
+                    goto.append([-1]*4)
+                    out.append([])
+                s = goto[s][b]
+            out[s].extend((mid, len(p)) for mid in ids)
+
+        # BFS to resolve failure links into a complete DFA
+        fail = [0]*len(goto)
+        queue = deque()
+        for b in range(4):
+            nxt = goto[0][b]
+            if nxt == -1:
+                goto[0][b] = 0
+            else:
+                queue.append(nxt)
+        while queue:
+            s = queue.popleft()
+            out[s].extend(out[fail[s]])
+            for b in range(4):
+                nxt = goto[s][b]
+                if nxt == -1:
+                    goto[s][b] = goto[fail[s]][b]
+                else:
+                    fail[nxt] = goto[fail[s]][b]
+                    queue.append(nxt)
+
+        self.n_states = len(goto)
+        self.delta: List[int] = []
+        for row in goto:
+            self.delta.extend(row)
+            self.delta.append(0)
+        self.out: List[Tuple[Tuple[int, int], ...]] = [tuple(o) for o in out]
+        self.accepting: List[bool] = [bool(o) for o in out]
+
+    def __bool__(self) -> bool:
+        return self.n_patterns > 0
+
+    def advance(self, state: int, seq: str) -> Tuple[int, int]:
+        """Feed `seq` from `state`; return (new_state, number of hits ending inside seq)."""
+        delta, out = self.delta, self.out
+        hits = 0
+        for nt in seq.encode("ascii", errors="replace").translate(_BYTE_TO_NT):
+            state = delta[state*5 + nt]
+            if out[state]:
+                hits += len(out[state])
+        return state, hits
+
+    def find_all(self, seq: str) -> List[Tuple[str, int]]:
+        """All (motif, start) hits in forward coordinates, ordered by end position."""
+        delta, out, motifs = self.delta, self.out, self.motifs
+        hits: List[Tuple[str, int]] = []
+        state = 0
+        for i, nt in enumerate(seq.encode("ascii", errors="replace").translate(_BYTE_TO_NT)):
+            state = delta[state*5 + nt]
+            if out[state]:
+                for mid, plen in out[state]:
+                    hits.append((motifs[mid], i - plen + 1))
+        return hits
+
+    def count(self, seq: str) -> int:
+        return self.advance(0, seq)[1]
+
+    def has_match(self, seq: str) -> bool:
+        delta, acc = self.delta, self.accepting
+        state = 0
+        for nt in seq.encode("ascii", errors="replace").translate(_BYTE_TO_NT):
+            state = delta[state*5 + nt]
+            if acc[state]:
+                return True
+        return False
+
+    @cached_property
+    def _delta_array(self) -> np.ndarray:
+        return np.array(self.delta, dtype=np.int32).reshape(self.n_states, 5)
+
+    @cached_property
+    def _hits_array(self) -> np.ndarray:
+        return np.array([len(o) for o in self.out], dtype=np.int64)
+
+    def count_batch(self, nt: np.ndarray) -> np.ndarray:
+        """Hit counts for every row of an (N, M) nucleotide matrix (codon_utils.encode_nucleotides)."""
+        nt = np.minimum(nt, 4)
+        delta, hits_per_state = self._delta_array, self._hits_array
+        state = np.zeros(nt.shape[0], dtype=np.int32)
+        counts = np.zeros(nt.shape[0], dtype=np.int64)
+        for j in range(nt.shape[1]):
+            state = delta[state, nt[:, j]]
+            counts += hits_per_state[state]
+        return counts
+
+    @cached_property
+    def codon_table(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (next_state, hits) arrays of shape (n_states, 64): the state after appending codon CODONS[j]
+        and the number of hits completed inside those three bases.
+        """
+        delta, hits_per_state = self._delta_array, self._hits_array
+        nxt = np.zeros((self.n_states, 64), dtype=np.int32)
+        hits = np.zeros((self.n_states, 64), dtype=np.int64)
+        states = np.arange(self.n_states)
+        for j, codon in enumerate(CODONS):
+            s = states
+            h = np.zeros(self.n_states, dtype=np.int64)
+            for ch in codon:
+                s = delta[s, NUCLEOTIDES.index(ch)]
+                h += hits_per_state[s]
+            nxt[:, j] = s
+            hits[:, j] = h
+        return nxt, hits
+
+    @cached_property
+    def codon_lists(self) -> Tuple[List[List[int]], List[List[int]]]:
+        """codon_table as nested lists, for fast scalar lookups in Python decoding loops."""
+        nxt, hits = self.codon_table
+        return nxt.tolist(), hits.tolist()
+
+
+@lru_cache(maxsize=64)
+def _compile(motifs: Tuple[str, ...], both_strands: bool) -> MotifScanner:
+    return MotifScanner(motifs, both_strands=both_strands)
+
+
+def compile_motifs(motifs: Optional[Sequence[str]], both_strands: bool = True) -> MotifScanner:
+    """Cached MotifScanner for a motif set (order-sensitive only in hit labelling)."""
+    return _compile(tuple(normalize_motif(m) for m in motifs or ()), both_strands)
@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+"""
+Fused featurize -> score stage for candidate batches.
+
+score_candidates() measures every candidate once (metrics.sequence_metrics_batch) and derives both
+the surrogate feature matrix (surrogate.feature_matrix_from_metrics) and the rule terms
+(metrics.rules_score_batch) from that record. Calling load_and_predict and then combine_reward per
+candidate computes CAI/tAI, GC windows, rare runs, homopolymers, the 5' proxy and forbidden-site
+scans twice.
+"""
+
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+import numpy as np
+
+from .context import ScoringContext
+from .metrics import RULE_SCORE_KEYS, rules_score_batch, sequence_metrics_batch, broadcast_per_candidate
+from .surrogate import SurrogateModel, feature_matrix_from_metrics
+
+
+def score_candidates(
+    seqs: Sequence[str],
+    context: ScoringContext,
+    lm_features: Optional[Union[dict, Sequence[Optional[dict]]]] = None,
+    extra_features: Optional[Union[dict, Sequence[Optional[dict]]]] = None,
+    surrogate: Optional[SurrogateModel] = None,
+    weights_rules: Optional[Dict[str, float]] = None,
+    w_surrogate: float = 1.0,
+    w_rules: float = 1.0,
+    lambda_uncertainty: float = 1.0,
+    enforce_hard_constraints: bool = True,
+    max_forbidden_hits: int = 0,
+) -> List[Dict[str, Any]]:
+    """
+    combine_reward for a batch of candidates, in input order, with the same result keys.
+    - lm_features / extra_features: one shared dict or one dict per candidate. The surrogate rows see
+      extra_features; the rules see extra_features merged with lm_features, as in combine_reward.
+    - surrogate: a loaded SurrogateModel, called once per group of equal-length candidates
+      (mu = sigma = 0 without one).
+    Forbidden motifs come from context.motifs.
+    """
+    seqs = list(seqs)
+    N = len(seqs)
+    lms = broadcast_per_candidate(lm_features, N)
+    extras = broadcast_per_candidate(extra_features, N)
+    merged = []
+    for lm, ex in zip(lms, extras):
+        m = dict(ex or {})
+        for k, v in (lm or {}).items():
+            m.setdefault(k, v)
+        merged.append(m)
+
+    groups: Dict[int, List[int]] = defaultdict(list)
+    for i, dna in enumerate(seqs):
+        groups[len(dna)].append(i)
+
+    out: List[Optional[Dict[str, Any]]] = [None] * N
+    for idx in groups.values():
+        sub = [seqs[i] for i in idx]
+        metrics = sequence_metrics_batch(sub, context=context)
+        if surrogate is not None:
+            X, _ = feature_matrix_from_metrics(
+                metrics, [extras[i] for i in idx], feature_keys=surrogate.feature_keys,
+            )
+            mu, sigma = surrogate.predict_mu_sigma(X)
+        else:
+            mu = sigma = np.zeros(len(idx))
+        rs = rules_score_batch(
+            sub, lm_features=[lms[i] for i in idx], extra_features=[merged[i] for i in idx],
+            weights=weights_rules, context=context, metrics=metrics,
+        )
+        reward = w_surrogate * (mu - lambda_uncertainty * sigma) + w_rules * rs["total_rules"]
+        for j, i in enumerate(idx):
+            res: Dict[str, Any] = {
+                "reward": float(reward[j]),
+                "surrogate_mu": float(mu[j]),
+                "surrogate_sigma": float(sigma[j]),
+                "valid": True,
+            }
+            if enforce_hard_constraints and context.motifs and rs["forbidden_hits"][j] > max_forbidden_hits:
+                res.update(valid=False, violation_reason="forbidden_motif", reward=float("-inf"))
+            for k in RULE_SCORE_KEYS:
+                res[k] = int(rs[k][j]) if k == "forbidden_hits" else float(rs[k][j])
+            if lms[i]:
+                res.setdefault("lm_features", lms[i])
+            if extras[i]:
+                res.setdefault("extra_features", merged[i])
+            out[i] = res
+    return out
@@ -1,94 +1,260 @@
 from __future__ import annotations
-from typing import Dict, List, Tuple, Optional
-import math, random, copy
+from collections.abc import Mapping, MutableMapping
+from typing import Dict, Iterator, List, Tuple, Optional, Sequence, Union
+import math, random
 
-from .codon_utils import AA_TO_CODONS
+import numpy as np
+
+from .codon_utils import (
+    AA_TO_CODONS, CODONS, CODON_INDEX, CODON_FAMILY, FAMILY_CODONS, FAMILY_MASK,
+    SENSE_AAS, encode_protein,
+)
+from .motifs import compile_motifs
+from .decoding import automaton_decode
+
+_FAMILY_INDEX = {aa: f for f, aa in enumerate(SENSE_AAS)}
+
+
+class _FamilyLogits(MutableMapping):
+    """params[host][aa] view: codon -> logit, backed by the policy's logit array."""
+
+    def __init__(self, row: np.ndarray, aa: str):
+        self._row, self._codons = row, AA_TO_CODONS[aa]
+
+    def __getitem__(self, codon: str) -> float:
+        if codon not in self._codons:
+            raise KeyError(codon)
+        return float(self._row[CODON_INDEX[codon]])
+
+    def __setitem__(self, codon: str, value: float) -> None:
+        if codon not in self._codons:
+            raise KeyError(codon)
+        self._row[CODON_INDEX[codon]] = value
+
+    def __delitem__(self, codon: str) -> None:
+        raise TypeError("Codon logits cannot be deleted.")
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._codons)
+
+    def __len__(self) -> int:
+        return len(self._codons)
+
+
+class _HostLogits(Mapping):
+    def __init__(self, row: np.ndarray):
+        self._row = row
+
+    def __getitem__(self, aa: str) -> _FamilyLogits:
+        if aa not in _FAMILY_INDEX:
+            raise KeyError(aa)
+        return _FamilyLogits(self._row, aa)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(SENSE_AAS)
+
+    def __len__(self) -> int:
+        return len(SENSE_AAS)
+
+
+class _PolicyParams(Mapping):
+    def __init__(self, policy: "HostConditionalCodonPolicy"):
+        self._policy = policy
+
+    def __getitem__(self, host: str) -> _HostLogits:
+        return _HostLogits(self._policy.logits[self._policy.host_index[host]])
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._policy.hosts)
+
+    def __len__(self) -> int:
+        return len(self._policy.hosts)
 
 
 class HostConditionalCodonPolicy:
     """
     A simple host-conditional codon policy with per-AA categorical logits.
-    - Parameters are stored as: params[host][amino_acid][codon] = logit
-    - Sampling uses softmax(logits / temperature)
+    - Parameters are stored as a (hosts x 64) logit array indexed like codon_utils.CODONS;
+      codon_utils.FAMILY_MASK restricts each softmax to one synonymous family (stop columns unused)
+    - params[host][amino_acid][codon] is a live dict-style view onto the same array
+    - Sampling uses softmax(logits / temperature); sample_group draws G sequences at once
     - Reference parameters can be used to regularize updates (KL proxy via L2 on logits)
     This is a lightweight scaffold to support GRPO-style training.
     """
 
     def __init__(self, hosts: List[str], init_usage: Dict[str, float]):
-        self.hosts = hosts
-        self.params: Dict[str, Dict[str, Dict[str, float]]]= {}
+        self.hosts = list(hosts)
+        self.host_index = {h: i for i, h in enumerate(self.hosts)}
         # initialize logits from usage frequencies (shared across hosts by default)
         eps = 1e-6
-        for h in hosts:
-            self.params[h] = {}
-            for aa, codons in AA_TO_CODONS.items():
-                if aa == "*":
-                    continue
-                logits = {}
-                for c in codons:
-                    p = max(eps, init_usage.get(c, eps))
-                    logits[c] = math.log(p)
-                self.params[h][aa] = logits
+        row = np.array([
+            math.log(max(eps, init_usage.get(c, eps))) if CODON_FAMILY[j] >= 0 else 0.0
+            for j, c in enumerate(CODONS)
+        ])
+        self.logits = np.tile(row, (len(self.hosts), 1))
 
-    def clone(self) -> "HostConditionalCodonPolicy":
-        cp = HostConditionalCodonPolicy(self.hosts, {})
-        cp.params = copy.deepcopy(self.params)
+    @property
+    def params(self) -> _PolicyParams:
+        return _PolicyParams(self)
+
+    @classmethod
+    def from_logits(cls, hosts: List[str], logits: np.ndarray) -> "HostConditionalCodonPolicy":
+        """Policy over `hosts` with the given (hosts x 64) logit array (copied)."""
+        logits = np.array(logits, dtype=float)
+        if logits.shape != (len(hosts), 64):
+            raise ValueError(f"Expected logits of shape ({len(hosts)}, 64), got {logits.shape}.")
+        cp = cls.__new__(cls)
+        cp.hosts = list(hosts)
+        cp.host_index = {h: i for i, h in enumerate(cp.hosts)}
+        cp.logits = logits
         return cp
 
-    def _softmax_probs(self, logits: Dict[str, float], temperature: float) -> List[Tuple[str, float]]:
-        z = [ (c, l/ max(1e-6, temperature)) for c,l in logits.items() ]
-        m = max(l for _,l in z)
-        exps = [ (c, math.exp(l - m)) for c,l in z ]
-        s = sum(v for _,v in exps) or 1.0
-        return [ (c, v/s) for c,v in exps ]
+    def clone(self) -> "HostConditionalCodonPolicy":
+        return HostConditionalCodonPolicy.from_logits(self.hosts, self.logits)
+
+    def codon_probs(self, host: str, temperature: float = 1.0) -> np.ndarray:
+        """Per-codon probabilities within each synonymous family (64 entries; stops are 0)."""
+        z = self.logits[self.host_index[host]] / max(1e-6, temperature)
+        z = np.where(FAMILY_MASK, z[None, :], -np.inf)
+        z = np.exp(z - z.max(axis=1, keepdims=True))
+        return (z / z.sum(axis=1, keepdims=True)).sum(axis=0)
 
     def sample_codon(self, aa: str, host: str, temperature: float = 1.0) -> Tuple[str, float]:
-        logits = self.params[host][aa]
-        probs = self._softmax_probs(logits, temperature)
-        r = random.random(); cum=0.0
-        for c,p in probs:
-            cum += p
-            if r <= cum:
-                return c, math.log(max(1e-12, p))
-        c, p = probs[-1]
-        return c, math.log(max(1e-12, p))
-
-    def sample_sequence(self, aa_seq: str, host: str, motifs_forbidden: Optional[List[str]] = None, temperature: float = 1.0, max_attempts_per_pos: int = 5) -> Tuple[str, float]:
-        dna_chunks: List[str] = []
-        logp_sum = 0.0
-        for i, aa in enumerate(aa_seq.strip().upper()):
-            attempts = 0
-            chosen = None
-            chosen_logp = 0.0
-            while attempts < max_attempts_per_pos:
-                attempts += 1
-                if i == 0 and aa == "M":
-                    cand = "ATG"; logp = 0.0  # treat as fixed start codon
-                else:
-                    cand, logp = self.sample_codon(aa, host, temperature=temperature)
-                trial = "".join(dna_chunks) + cand
-                if not motifs_forbidden:
-                    chosen, chosen_logp = cand, logp; break
-                bad = False
-                mmtrial = trial.upper().replace("U","T")
-                for m in motifs_forbidden:
-                    mm = m.upper().replace("U","T")
-                    if mm in mmtrial:
-                        bad = True; break
-                if not bad:
-                    chosen, chosen_logp = cand, logp; break
-            if chosen is None:
-                chosen, chosen_logp = self.sample_codon(aa, host, temperature=temperature)
-            dna_chunks.append(chosen)
-            logp_sum += chosen_logp
-        return "".join(dna_chunks), logp_sum
+        return self.sample_codon_from(aa, host, AA_TO_CODONS[aa], temperature=temperature)
+
+    def sample_codon_from(self, aa: str, host: str, allowed: List[str], temperature: float = 1.0) -> Tuple[str, float]:
+        """Sample among `allowed` codons (renormalised); logp is under the unrestricted distribution."""
+        return self._proposer(host, temperature)(0, aa, allowed)
+
+    def _proposer(self, host: str, temperature: float, rng: Optional[np.random.Generator] = None):
+        probs = self.codon_probs(host, temperature).tolist()
+        draw = rng.random if rng is not None else random.random
+
+        def propose(i: int, aa: str, allowed: List[str]) -> Tuple[str, float]:
+            family = AA_TO_CODONS[aa] if aa in _FAMILY_INDEX else []
+            cands = [(c, probs[CODON_INDEX[c]]) for c in allowed if c in family] or \
+                [(c, probs[CODON_INDEX[c]]) for c in family]
+            if not cands:
+                raise KeyError(aa)
+            s = sum(p for _, p in cands) or 1.0
+            r = draw()*s; cum = 0.0
+            for c, p in cands:
+                cum += p
+                if r <= cum:
+                    return c, math.log(max(1e-12, p))
+            c, p = cands[-1]
+            return c, math.log(max(1e-12, p))
+        return propose
+
+    def sample_sequence(
+        self,
+        aa_seq: str,
+        host: str,
+        motifs_forbidden: Optional[List[str]] = None,
+        temperature: float = 1.0,
+        max_attempts_per_pos: int = 5,
+        max_backtrack: int = 4,
+        return_result: bool = False,
+    ):
+        """
+        Sample a CDS avoiding forbidden motifs via the incremental automaton decoder.
+        Returns (dna, logp_sum), or a decoding.DecodeResult when return_result=True.
+        The start codon for a leading 'M' is fixed (logp 0).
+        """
+        propose = self._proposer(host, temperature)
+        res = automaton_decode(aa_seq, propose, compile_motifs(motifs_forbidden), max_backtrack=max_backtrack)
+        return res if return_result else (res.dna, res.logp)
+
+    def sample_group(
+        self,
+        aa_seq: str,
+        host: str,
+        n: int,
+        motifs_forbidden: Optional[List[str]] = None,
+        temperature: float = 1.0,
+        max_backtrack: int = 4,
+        rng: Optional[np.random.Generator] = None,
+        return_indices: bool = False,
+    ):
+        """
+        Draw n sequences for one protein in a single vectorized pass.
+        Returns (dnas, logps) and, with return_indices=True, the (n, L) codon-index matrix as well.
+        With motifs_forbidden, rows track their motif-automaton state and only sample codons that
+        complete no hit and leave a legal codon for the next residue (the one-step backtrack of
+        sample_sequence); rows that still reach a dead end are redrawn with the automaton decoder.
+        rng defaults to a Generator seeded from the `random` module, so random.seed() stays effective.
+        """
+        if rng is None:
+            rng = np.random.default_rng(random.getrandbits(64))
+        fam = encode_protein(aa_seq)
+        if (fam < 0).any():
+            i = int(np.argmax(fam < 0))
+            raise ValueError(f"Cannot sample residue {aa_seq.strip()[i]!r} at position {i}.")
+        probs = self.codon_probs(host, temperature)
+        table = FAMILY_CODONS[fam]                                   # (L, 6) codon ids, -1 padded
+        p = np.where(table >= 0, probs[table], 0.0)
+        L = len(fam)
+        scanner = compile_motifs(motifs_forbidden)
+        failed = np.zeros(n, dtype=bool)
+        if scanner:
+            # step through positions, offering each row only codons that complete no motif hit;
+            # legality depends only on (automaton state, position), so weights are tabulated per block
+            state = np.zeros(n, dtype=np.int64)
+            idx = np.zeros((n, L), dtype=np.int64)
+            n_valid = (table >= 0).sum(axis=1)
+            block = max(1, (1 << 18) // (scanner.n_states * table.shape[1]))
+            for i0 in range(0, L, block):
+                i1 = min(L, i0 + block)
+                cum, nxt_t = self._legal_tables(scanner, table, p, i0, i1)
+                for i in range(i0, i1):
+                    c = cum[state, i - i0]
+                    failed |= c[:, -1] <= 0
+                    u = rng.random((n, 1)) * c[:, -1:]
+                    choice = np.minimum((u > c).sum(axis=1), n_valid[i] - 1)
+                    idx[:, i] = table[i, choice]
+                    state = nxt_t[state, i - i0, choice]
+        else:
+            cum = np.cumsum(p, axis=1)
+            u = rng.random((n, L, 1)) * cum[None, :, -1:]
+            choice = np.minimum((u > cum[None]).sum(axis=2), (table >= 0).sum(axis=1) - 1)
+            idx = table[np.arange(L)[None, :], choice]               # (n, L)
+        logps = np.log(np.maximum(1e-12, probs[idx])).sum(axis=1)
+        if failed.any():
+            # dead ends need backtracking: redraw those rows with the automaton decoder
+            propose = self._proposer(host, temperature, rng)
+            for r in np.nonzero(failed)[0]:
+                res = automaton_decode(aa_seq, propose, scanner, max_backtrack=max_backtrack)
+                idx[r] = [CODON_INDEX[res.dna[k:k+3]] for k in range(0, len(res.dna), 3)]
+                logps[r] = res.logp
+        dnas = ["".join(row) for row in np.array(CODONS)[idx]]
+        return (dnas, logps, idx) if return_indices else (dnas, logps)
+
+    @staticmethod
+    def _legal_tables(scanner, table: np.ndarray, p: np.ndarray, i0: int, i1: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Per automaton state, cumulative sampling weights (S, i1-i0, 6) over the codons of positions
+        i0..i1-1 that complete no motif hit and, where possible, leave a legal codon for the next
+        residue (one-step lookahead), plus the matching next states.
+        """
+        nxt, hits = scanner.codon_table
+        j1 = min(len(table), i1 + 1)
+        tab = np.where(table[i0:j1] >= 0, table[i0:j1], 0)
+        legal = (hits[:, tab] == 0) & (table[i0:j1] >= 0)[None]     # (S, j1-i0, 6)
+        nxt_t = nxt[:, tab]
+        w = p[None, i0:j1] * legal
+        dead = ~legal.any(axis=2)                                    # (S, j1-i0)
+        k = j1 - i0 - 1                                              # positions that have a successor
+        safe = w[:, :k] * ~dead[nxt_t[:, :k], np.arange(1, k + 1)[None, :, None]]
+        w[:, :k] = np.where((safe > 0).any(axis=2, keepdims=True), safe, w[:, :k])
+        m = i1 - i0
+        return np.cumsum(w[:, :m], axis=2), nxt_t[:, :m]
 
     def update_from_samples(
         self,
         host: str,
         aa_seqs: List[str],
-        chosen_codons: List[List[str]],
-        advantages: List[float],
+        chosen_codons: Union[List[List[str]], np.ndarray],
+        advantages: Sequence[float],
         ref_policy: Optional["HostConditionalCodonPolicy"] = None,
         lr: float = 0.1,
         beta_ref: float = 0.01,
@@ -97,17 +263,39 @@ class HostConditionalCodonPolicy:
         Apply a simple per-token logit update:
           logit[c] += lr * (adv - beta_ref*(logit[c] - ref_logit[c])) for chosen token c
         This acts like policy gradient with an L2 pull to reference logits (KL proxy).
-        aa_seqs and chosen_codons are aligned per sample.
-        """
-        for aa_seq, codons, adv in zip(aa_seqs, chosen_codons, advantages):
-            for aa, c in zip(aa_seq.strip().upper(), codons):
-                if aa == "*":
-                    continue
-                if aa not in self.params[host]:
-                    continue
-                ref_logit = 0.0
-                if ref_policy is not None:
-                    ref_logit = ref_policy.params[host].get(aa, {}).get(c, 0.0)
-                self.params[host][aa][c] = self.params[host][aa].get(c, 0.0) + lr * (adv - beta_ref * (self.params[host][aa].get(c, 0.0) - ref_logit))
-
+        aa_seqs and chosen_codons are aligned per sample; chosen_codons may be codon lists or
+        an (N, L) codon-index matrix as returned by sample_group(return_indices=True).
 
+        Tokens are applied in sample order, exactly as a sequential loop would, but in closed form:
+        with q = 1 - lr*beta_ref and n_c tokens of codon c, the k-th of them contributes
+        lr*adv_k*q^(n_c-1-k), the old logit decays by q^n_c and the reference fills (1 - q^n_c).
+        """
+        h = self.host_index[host]
+        tokens, advs = [], []
+        for s, (aa_seq, adv) in enumerate(zip(aa_seqs, advantages)):
+            cods = chosen_codons[s]
+            if isinstance(cods, np.ndarray):
+                cidx = cods.astype(np.int64)
+            else:
+                cidx = np.array([CODON_INDEX.get(c, -1) for c in cods], dtype=np.int64)
+            fam = encode_protein(aa_seq)
+            m = min(len(fam), len(cidx))
+            cidx, fam = cidx[:m], fam[:m]
+            ok = (cidx >= 0) & (fam >= 0)
+            ok[ok] &= CODON_FAMILY[cidx[ok]] == fam[ok]
+            tokens.append(cidx[ok])
+            advs.append(np.full(int(ok.sum()), float(adv)))
+        if not tokens:
+            return
+        t = np.concatenate(tokens)
+        a = np.concatenate(advs)
+        n_c = np.bincount(t, minlength=64)
+        order = np.argsort(t, kind="stable")
+        starts = np.cumsum(n_c) - n_c
+        rank = np.empty_like(t)
+        rank[order] = np.arange(len(t)) - starts[t[order]]
+        q = 1.0 - lr * beta_ref
+        gain = np.bincount(t, weights=a * q ** (n_c[t] - 1 - rank), minlength=64)
+        decay = q ** n_c
+        ref = ref_policy.logits[ref_policy.host_index[host]] if ref_policy is not None else 0.0
+        self.logits[h] = decay * self.logits[h] + lr * gain + (1.0 - decay) * ref
@@ -0,0 +1,321 @@
+from __future__ import annotations
+
+"""
+Bounded-memory ranking of streamed candidate records.
+
+Scored candidates (dicts such as those returned by pipeline.score_candidates) are pushed one at a
+time; only the best K by a key, an optional Pareto archive over chosen objectives and, when asked,
+a spill file with every full record are kept, so ranking N candidates uses memory proportional to K
+(plus the archive size) rather than N.
+
+- TopK: min-heap of the best K records by a numeric key (NaN ranks last, ties keep arrival order)
+- ParetoArchive: non-dominated records over objectives such as {"cai": "max", "surrogate_sigma": "min"},
+  optionally truncated to max_size by crowding distance
+- pareto_rank: vectorized non-dominated sorting and per-front crowding distance over the columns of an
+  already-scored candidate set, so trade-offs can be re-ranked without re-scoring
+- RecordSpill: streams full records to .jsonl, or .csv with columns taken from the first record
+- StreamingRanker: the three combined behind add()/extend()
+"""
+
+import csv
+import heapq
+import json
+import math
+from dataclasses import dataclass
+from itertools import count
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+Objectives = Union[Mapping[str, str], Sequence[str]]
+
+
+def _sort_value(v: Any) -> float:
+    v = float(v)
+    return -math.inf if math.isnan(v) else v
+
+
+class TopK:
+    """Keep the K records with the largest `key`; items() returns them best first."""
+
+    def __init__(self, k: int, key: str = "reward"):
+        if k < 1:
+            raise ValueError("TopK needs k >= 1.")
+        self.k = k
+        self.key = key
+        self._heap: List[Tuple[float, int, Dict[str, Any]]] = []
+        self._seq = count()
+
+    def push(self, record: Dict[str, Any]) -> bool:
+        """Offer a record; True if it is (currently) among the best K."""
+        # -arrival breaks ties so that, among equal keys, the earliest record is kept
+        item = (_sort_value(record[self.key]), -next(self._seq), record)
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, item)
+            return True
+        if item[:2] > self._heap[0][:2]:
+            heapq.heapreplace(self._heap, item)
+            return True
+        return False
+
+    def items(self) -> List[Dict[str, Any]]:
+        return [rec for _, _, rec in sorted(self._heap, key=lambda t: t[:2], reverse=True)]
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+
+def objective_matrix(data: Union[Sequence[Mapping[str, Any]], Mapping[str, Any]], objectives: Objectives) -> Tuple[np.ndarray, List[str]]:
+    """
+    (N, M) matrix of objective values oriented for maximisation ("min" objectives are negated,
+    NaN becomes -inf), plus the objective names. `data` is a list of records (combine_reward /
+    score_candidates results) or a dict of columns (rules_score_batch output). A plain list of
+    objective names means all "max".
+    """
+    obj = normalize_objectives(objectives)
+    names = list(obj)
+    sign = np.array([1.0 if obj[k] == "max" else -1.0 for k in names])
+    if isinstance(data, Mapping):
+        F = np.column_stack([np.asarray(data[k], dtype=float).ravel() for k in names])
+    else:
+        F = np.array([[float(r[k]) for k in names] for r in data], dtype=float).reshape(len(data), len(names))
+    F = F * sign
+    F[np.isnan(F)] = -np.inf
+    return F, names
+
+
+def normalize_objectives(objectives: Objectives) -> Dict[str, str]:
+    obj = dict(objectives) if isinstance(objectives, Mapping) else {k: "max" for k in objectives}
+    for k, d in obj.items():
+        if d not in ("max", "min"):
+            raise ValueError(f"Objective {k!r} must be 'max' or 'min', got {d!r}.")
+    if not obj:
+        raise ValueError("At least one objective is required.")
+    return obj
+
+
+def dominance_matrix(F: np.ndarray, block_cells: int = 1 << 24) -> np.ndarray:
+    """(N, N) boolean matrix with D[i, j] = row i dominates row j (maximisation), built in row blocks."""
+    N, M = F.shape
+    D = np.zeros((N, N), dtype=bool)
+    step = max(1, block_cells // max(1, N))
+    for s in range(0, N, step):
+        A = F[s:s+step]
+        ge = np.ones((len(A), N), dtype=bool)
+        gt = np.zeros((len(A), N), dtype=bool)
+        for m in range(M):
+            a, b = A[:, m, None], F[None, :, m]
+            ge &= a >= b
+            gt |= a > b
+        D[s:s+step] = ge & gt
+    return D
+
+
+def non_dominated_sort(F: np.ndarray, n_select: Optional[int] = None) -> np.ndarray:
+    """
+    Front index of every row of an (N, M) objective matrix (0 = non-dominated), peeling whole fronts
+    with array operations on the dominance matrix (O(N^2) memory). With n_select, peeling stops once
+    at least that many rows are ranked; the rest share the next front index.
+    """
+    N = F.shape[0]
+    front = np.full(N, -1, dtype=np.int64)
+    if N == 0:
+        return front
+    D = dominance_matrix(F)
+    remaining = D.sum(axis=0)
+    current = np.flatnonzero(remaining == 0)
+    r = 0
+    ranked = 0
+    while current.size:
+        front[current] = r
+        ranked += current.size
+        r += 1
+        if n_select is not None and ranked >= n_select:
+            break
+        remaining -= D[current].sum(axis=0)
+        remaining[current] = -1
+        current = np.flatnonzero(remaining == 0)
+    front[front < 0] = r
+    return front
+
+
+def crowding_distance(F: np.ndarray, front: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    NSGA-II crowding distance of each row of an (N, M) objective matrix, computed within each front
+    (all rows form one front if `front` is None). Boundary rows of a front get inf.
+    """
+    N, M = F.shape
+    front = np.zeros(N, dtype=np.int64) if front is None else np.asarray(front)
+    dist = np.zeros(N)
+    if N == 0:
+        return dist
+    for m in range(M):
+        order = np.lexsort((F[:, m], front))
+        fr, col = front[order], F[order, m]
+        first = np.r_[True, fr[1:] != fr[:-1]]
+        last = np.r_[fr[1:] != fr[:-1], True]
+        seg = np.cumsum(first) - 1
+        span = (col[last] - col[first])[seg]
+        prev = np.r_[col[0], col[:-1]]
+        nxt = np.r_[col[1:], col[-1]]
+        ok = ~first & ~last & np.isfinite(span) & (span > 0)
+        contrib = np.zeros(N)
+        contrib[ok] = (nxt[ok] - prev[ok]) / span[ok]
+        dist[order] += contrib
+        dist[order[first | last]] = np.inf
+    return dist
+
+
+@dataclass
+class ParetoRanking:
+    """
+    NSGA-II ordering of a candidate set: `front` per row (0 = non-dominated), `crowding` within the
+    front and `order`, the row indices sorted by (front, descending crowding, index).
+    """
+    objectives: Dict[str, str]
+    front: np.ndarray
+    crowding: np.ndarray
+    order: np.ndarray
+
+    def select(self, n: int) -> np.ndarray:
+        """Indices of the n best rows."""
+        return self.order[:n]
+
+    def first_front(self) -> np.ndarray:
+        return np.flatnonzero(self.front == 0)
+
+
+def pareto_rank(
+    data: Union[Sequence[Mapping[str, Any]], Mapping[str, Any]],
+    objectives: Objectives,
+    n_select: Optional[int] = None,
+) -> ParetoRanking:
+    """
+    Rank already-scored candidates by non-dominated front and crowding distance over the given
+    columns, e.g. pareto_rank(results, {"cai": "max", "dG_vienna": "max", "surrogate_mu": "max",
+    "surrogate_sigma": "min"}). Changing objectives only re-ranks the existing columns; nothing is
+    re-scored. With n_select, fronts beyond the first n_select rows are not separated.
+    """
+    obj = normalize_objectives(objectives)
+    F, _ = objective_matrix(data, obj)
+    front = non_dominated_sort(F, n_select)
+    crowd = crowding_distance(F, front)
+    order = np.lexsort((np.arange(len(front)), -crowd, front))
+    return ParetoRanking(obj, front, crowd, order)
+
+
+class ParetoArchive:
+    """
+    Non-dominated set of streamed records over `objectives` (all maximised after orientation).
+    A record is dropped if an archived record is at least as good on every objective and better on
+    one; archived records it dominates are removed. With max_size, the most crowded member is evicted
+    when the archive overflows.
+    """
+
+    def __init__(self, objectives: Objectives, max_size: Optional[int] = None):
+        self.objectives = normalize_objectives(objectives)
+        self.max_size = max_size
+        self._names = list(self.objectives)
+        self._sign = [1.0 if self.objectives[k] == "max" else -1.0 for k in self._names]
+        self._F = np.zeros((0, len(self.objectives)))
+        self._records: List[Dict[str, Any]] = []
+
+    def push(self, record: Dict[str, Any]) -> bool:
+        """Offer a record; True if it entered the archive."""
+        f = np.array([float(record[k]) * sg for k, sg in zip(self._names, self._sign)])
+        f[np.isnan(f)] = -np.inf
+        F = self._F
+        if len(F) and ((F >= f).all(axis=1) & (F > f).any(axis=1)).any():
+            return False
+        keep = ~((f >= F).all(axis=1) & (f > F).any(axis=1))
+        self._F = np.vstack([F[keep], f])
+        self._records = [r for r, k in zip(self._records, keep) if k] + [record]
+        if self.max_size is not None and len(self._records) > self.max_size:
+            drop = int(np.argmin(crowding_distance(self._F)))
+            self._F = np.delete(self._F, drop, axis=0)
+            del self._records[drop]
+            return drop != len(self._records)
+        return True
+
+    def items(self) -> List[Dict[str, Any]]:
+        return list(self._records)
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+
+class RecordSpill:
+    """Append full records to a .jsonl file, or to a .csv file with the first record's columns."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fh = open(path, "w", encoding="utf-8", newline="")
+        self._csv = path.lower().endswith(".csv")
+        self._writer: Optional[csv.DictWriter] = None
+        self.count = 0
+
+    def write(self, record: Mapping[str, Any]) -> None:
+        if self._csv:
+            if self._writer is None:
+                self._writer = csv.DictWriter(self._fh, fieldnames=list(record), extrasaction="ignore")
+                self._writer.writeheader()
+            self._writer.writerow({k: _csv_value(v) for k, v in record.items()})
+        else:
+            self._fh.write(json.dumps(record) + "\n")
+        self.count += 1
+
+    def close(self) -> None:
+        if not self._fh.closed:
+            self._fh.close()
+
+
+def _csv_value(v: Any) -> Any:
+    return json.dumps(v) if isinstance(v, (dict, list, tuple)) else v
+
+
+class StreamingRanker:
+    """
+    Top-K by `key`, an optional Pareto archive and an optional spill file, fed one record at a time.
+    Usable as a context manager (closes the spill file).
+    """
+
+    def __init__(
+        self,
+        k: int,
+        key: str = "reward",
+        objectives: Optional[Objectives] = None,
+        pareto_max_size: Optional[int] = None,
+        spill_path: Optional[str] = None,
+    ):
+        self.topk = TopK(k, key)
+        self.pareto = ParetoArchive(objectives, pareto_max_size) if objectives else None
+        self.spill = RecordSpill(spill_path) if spill_path else None
+        self.seen = 0
+
+    def add(self, record: Dict[str, Any]) -> None:
+        self.seen += 1
+        if self.spill is not None:
+            self.spill.write(record)
+        self.topk.push(record)
+        if self.pareto is not None:
+            self.pareto.push(record)
+
+    def extend(self, records: Iterable[Dict[str, Any]]) -> None:
+        for r in records:
+            self.add(r)
+
+    def top(self) -> List[Dict[str, Any]]:
+        return self.topk.items()
+
+    def front(self) -> List[Dict[str, Any]]:
+        return self.pareto.items() if self.pareto is not None else []
+
+    def close(self) -> None:
+        if self.spill is not None:
+            self.spill.close()
+
+    def __enter__(self) -> "StreamingRanker":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -1,10 +1,14 @@
 
-from typing import Dict, Optional, List
-from .metrics import rules_score, find_forbidden_sites
+import hashlib, json
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, List
+from .metrics import DEFAULT_RULE_WEIGHTS, rules_score, find_forbidden_sites
+from .context import ScoringContext
+from .codon_utils import sequence_key
 
 def combine_reward(
     dna: str,
-    usage: Dict[str,float],
+    usage: Optional[Dict[str,float]] = None,
     surrogate_mu: Optional[float] = None,
     surrogate_sigma: Optional[float] = None,
     trna_w: Optional[Dict[str,float]] = None,
@@ -18,10 +22,14 @@ def combine_reward(
     lambda_uncertainty: float = 1.0,
     enforce_hard_constraints: bool = True,
     max_forbidden_hits: int = 0,
+    context: Optional[ScoringContext] = None,
 ) -> Dict[str,float]:
     """
     R = w_surrogate * (mu - lambda * sigma) + w_rules * total_rules
+    `context` supplies precomputed host tables (and the motif list when motifs is None).
     """
+    if motifs is None and context is not None:
+        motifs = list(context.motifs)
     extra_for_rules = dict(extra_features or {})
     if lm_features:
         # expose LM features to downstream consumers (e.g., surrogate training)
@@ -33,7 +41,7 @@ def combine_reward(
         dna, usage,
         lm_features=lm_features,
         extra_features=extra_for_rules,
-        trna_w=trna_w, cpb=cpb, motifs=motifs, weights=weights_rules
+        trna_w=trna_w, cpb=cpb, motifs=motifs, weights=weights_rules, context=context
     )
     mu = surrogate_mu if surrogate_mu is not None else 0.0
     sig = surrogate_sigma if surrogate_sigma is not None else 0.0
@@ -55,3 +63,89 @@ def combine_reward(
     if extra_features:
         out.setdefault("extra_features", extra_for_rules)
     return out
+
+
+def reward_fingerprint(
+    context: Optional[ScoringContext] = None,
+    motifs: Optional[List[str]] = None,
+    weights_rules: Optional[Dict[str,float]] = None,
+    surrogate_version: Optional[str] = None,
+    **params: Any,
+) -> str:
+    """
+    Short digest of everything besides the sequence that determines a reward: host, rule weights,
+    motif set, surrogate version and any extra scalar parameters (w_surrogate, lambda, ...).
+    """
+    if motifs is None and context is not None:
+        motifs = list(context.motifs)
+    payload = {
+        "host": context.host if context is not None else None,
+        "weights": weights_rules or DEFAULT_RULE_WEIGHTS,
+        "motifs": sorted(m.upper() for m in motifs or []),
+        "surrogate": surrogate_version,
+        "params": params,
+    }
+    blob = json.dumps(payload, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.blake2b(blob, digest_size=8).hexdigest()
+
+
+_MISSING = object()
+
+
+class RewardCache:
+    """
+    Bounded LRU cache for reward computations.
+    Keys are (fingerprint, codon_utils.sequence_key(dna)): a 16-byte digest of the 2-bit packed
+    sequence plus the scoring fingerprint from reward_fingerprint, so one cache can be shared by
+    several scoring configurations. hits / misses / evictions are cumulative counters.
+    """
+
+    def __init__(self, maxsize: int = 100_000):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[tuple, Any]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, dna: str, fingerprint: str = "", default: Any = None) -> Any:
+        """Cached value (counted as a hit) or `default` (counted as a miss)."""
+        key = (fingerprint, sequence_key(dna))
+        if key in self._data:
+            self.hits += 1
+            self._data.move_to_end(key)
+            return self._data[key]
+        self.misses += 1
+        return default
+
+    def put(self, dna: str, value: Any, fingerprint: str = "") -> None:
+        if self.maxsize <= 0:
+            return
+        key = (fingerprint, sequence_key(dna))
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def get_or_compute(self, dna: str, compute: Callable[[], Any], fingerprint: str = "") -> Any:
+        value = self.get(dna, fingerprint, _MISSING)
+        if value is _MISSING:
+            value = compute()
+            self.put(dna, value, fingerprint)
+        return value
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self._data),
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def clear(self) -> None:
+        self._data.clear()
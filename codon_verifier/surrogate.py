@@ -1,6 +1,7 @@
 
 from __future__ import annotations
-import os, json, math, warnings
+import os, json, math, warnings, threading
+from collections import OrderedDict
 from typing import Dict, List, Optional, Any, Tuple
 from dataclasses import dataclass
 import numpy as np
@@ -22,7 +23,9 @@ from .metrics import (
     gc_content, sliding_gc, rules_score, cai, tai,
     five_prime_structure_proxy, rare_codon_runs, homopolymers, codon_pair_bias_score
 )
-from .codon_utils import chunk_codons, CODON_TO_AA, AA_TO_CODONS, relative_adaptiveness_from_usage
+from .codon_utils import chunk_codons, CODON_TO_AA, AA_TO_CODONS, CODONS, relative_adaptiveness_from_usage
+from .context import ScoringContext, resolve_context
+from .tree_inference import CompiledSurrogate, compile_surrogate
 
 ##############################
 # Feature engineering helpers
@@ -56,31 +59,35 @@ def aggregate_window_gc(seq: str, window: int = 50, step: int = 10) -> Dict[str,
         "gcw_max": float(arr.max()),
     }
 
+EXTRA_FEATURE_KEYS = [
+    "plDDT_mean","plDDT_min","esm_emb_dim","esm_emb_l2","msa_depth",
+    "conservation_mean","length","kd_hydropathy_mean"
+]
+LM_FEATURE_KEYS = [
+    "lm_host_score","lm_host_geom","lm_host_perplexity",
+    "lm_cond_score","lm_cond_geom","lm_cond_perplexity"
+]
+
 def extra_feature_defaults(extra: Optional[dict]) -> Dict[str, float]:
     extra = extra or {}
-    keys = [
-        "plDDT_mean","plDDT_min","esm_emb_dim","esm_emb_l2","msa_depth",
-        "conservation_mean","length","kd_hydropathy_mean"
-    ]
-    out = {k: float(extra.get(k, 0.0) or 0.0) for k in keys}
+    out = {k: float(extra.get(k, 0.0) or 0.0) for k in EXTRA_FEATURE_KEYS}
     # Pass through LM-derived features
     for k, v in extra.items():
         if isinstance(v, (int, float)) and k.startswith("lm_"):
             out[k] = float(v)
-    for k in [
-        "lm_host_score","lm_host_geom","lm_host_perplexity",
-        "lm_cond_score","lm_cond_geom","lm_cond_perplexity"
-    ]:
+    for k in LM_FEATURE_KEYS:
         out.setdefault(k, 0.0)
     return out
 
 def build_feature_vector(
     dna: str,
-    usage: Dict[str,float],
+    usage: Optional[Dict[str,float]] = None,
     trna_w: Optional[Dict[str,float]] = None,
     cpb: Optional[Dict[str,float]] = None,
-    extra_features: Optional[dict] = None
+    extra_features: Optional[dict] = None,
+    context: Optional[ScoringContext] = None,
 ) -> Tuple[np.ndarray, List[str]]:
+    ctx = resolve_context(context, usage, trna_w, cpb)
     # scalar metrics
     f = {}
     f["len_nt"] = len(dna)
@@ -88,22 +95,22 @@ def build_feature_vector(
     win = aggregate_window_gc(dna, window=50, step=10)
     f.update(win)
     try:
-        f["cai"] = cai(dna, usage)
+        f["cai"] = cai(dna, context=ctx)
     except Exception:
         f["cai"] = 0.0
-    if trna_w is not None:
+    if ctx.trna_w is not None:
         try:
-            f["tai"] = tai(dna, trna_w)
+            f["tai"] = tai(dna, context=ctx)
         except Exception:
             f["tai"] = 0.0
     else:
         f["tai"] = 0.0
     f["struct5_proxy"] = five_prime_structure_proxy(dna, window_nt=45)
-    runs = rare_codon_runs(dna, usage, quantile=0.2, min_run=3)
+    runs = rare_codon_runs(dna, quantile=0.2, min_run=3, context=ctx)
     f["rare_run_len"] = float(sum(L for _,L in runs))
     homos = homopolymers(dna, min_len=6)
     f["homopoly_len"] = float(sum(L for _,_,L in homos))
-    f["cpb"] = codon_pair_bias_score(dna, cpb) if cpb is not None else 0.0
+    f["cpb"] = codon_pair_bias_score(dna, context=ctx) if ctx.cpb is not None else 0.0
 
     # codon histogram (61 dims including ATG/TGG families)
     hist = codon_histogram(dna)
@@ -117,6 +124,281 @@ def build_feature_vector(
     vec = np.array([f[k] for k in keys], dtype=float)
     return vec, keys
 
+##############################
+# Vectorized featurizer
+##############################
+
+# Version of the feature schema and of how its columns are computed; bump it whenever either changes
+# (cached feature matrices are keyed by it).
+FEATURIZER_VERSION = 1
+
+# Storage dtype of training and cached feature matrices (halves their memory). Features built for
+# inference stay float64, so every scoring entry point feeds the model the same values.
+TRAINING_FEATURE_DTYPE = np.float32
+
+SEQUENCE_FEATURE_KEYS = [
+    "len_nt", "gc", "gcw_mean", "gcw_std", "gcw_min", "gcw_max", "cai", "tai",
+    "struct5_proxy", "rare_run_len", "homopoly_len", "cpb",
+] + [f"codon_{c}" for c in CODONS]
+# Column order of build_feature_vector for records without additional lm_* features
+FEATURE_KEYS = sorted(SEQUENCE_FEATURE_KEYS + EXTRA_FEATURE_KEYS + LM_FEATURE_KEYS)
+
+# Rows are featurized in chunks of about this many nucleotides to bound temporary arrays
+_CHUNK_NT = 1 << 22
+
+# Upper-case with U -> T (as the scalar metrics see a sequence), then A/C/G/T -> 0..3, other -> 255
+_FOLD = np.arange(256, dtype=np.uint8)
+_FOLD[ord("a"):ord("z")+1] -= 32
+_FOLD[ord("U")] = _FOLD[ord("u")] = ord("T")
+_NT_CODE = np.full(256, 255, dtype=np.uint8)
+for _i, _b in enumerate("ACGT"):
+    _NT_CODE[ord(_b)] = _i
+_STOP_CODON = np.array([CODON_TO_AA[c] == "*" for c in CODONS])
+_ATG = CODONS.index("ATG")
+
+
+def _ragged_positions(lens: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Row id, offset within the row and first flat index of each row for ragged rows of the given lengths."""
+    first = np.zeros(len(lens), dtype=np.int64)
+    np.cumsum(lens[:-1], out=first[1:])
+    row = np.repeat(np.arange(len(lens)), lens)
+    return row, np.arange(row.size) - first[row], first
+
+
+def _ragged_run_totals(values: np.ndarray, row: np.ndarray, n_rows: int, min_len: int,
+                       only_true: bool = False) -> np.ndarray:
+    """Per row, the summed length of maximal runs of equal values (>= min_len) in a flat ragged array."""
+    if values.size == 0:
+        return np.zeros(n_rows)
+    start = np.ones(values.size, dtype=bool)
+    start[1:] = (values[1:] != values[:-1]) | (row[1:] != row[:-1])
+    idx = np.flatnonzero(start)
+    lengths = np.diff(np.append(idx, values.size))
+    keep = lengths >= min_len
+    if only_true:
+        keep &= values[idx].astype(bool)
+    return np.bincount(row[idx[keep]], weights=lengths[keep], minlength=n_rows)
+
+
+def _struct5_ragged(nt: np.ndarray, starts: np.ndarray, lens: np.ndarray, window_nt: int = 45) -> np.ndarray:
+    """
+    five_prime_structure_proxy for ragged ACGT rows: a k-mer of the window s[3:3+window_nt] scores if its
+    reverse complement occurs in the window. Rows with non-ACGT characters there are NaN (caller falls back).
+    """
+    N = len(lens)
+    m = np.clip(lens - 3, 0, window_nt)
+    inwin = np.arange(window_nt)[None, :] < m[:, None]
+    pos = np.where(inwin, starts[:, None] + 3 + np.arange(window_nt)[None, :], 0)
+    w = np.where(inwin, nt[pos] if nt.size else 0, 0).astype(np.int64)
+    score = np.zeros(N)
+    bad = (inwin & (w > 3)).any(axis=1)
+    rows = np.arange(N)[:, None]
+    for k in (5, 4, 3):
+        P = window_nt - k + 1
+        fwd = np.zeros((N, P), dtype=np.int64)
+        rc = np.zeros((N, P), dtype=np.int64)
+        for j in range(k):
+            fwd = fwd*4 + w[:, j:j+P]
+            rc = rc*4 + (3 - w[:, k-1-j:k-1-j+P])
+        valid = (np.arange(P)[None, :] < (m - k + 1)[:, None]) & ~bad[:, None]
+        keys = (rows * 4**k + fwd)[valid]
+        hit = np.isin((rows * 4**k + rc)[valid], keys)
+        score += (6-k) * np.bincount(np.broadcast_to(rows, valid.shape)[valid][hit], minlength=N)
+    score = -score
+    score[bad] = np.nan
+    return score
+
+
+def _sequence_feature_block(seqs: List[str], ctx: ScoringContext) -> np.ndarray:
+    """
+    (N, len(SEQUENCE_FEATURE_KEYS)) float64 block of the sequence-derived build_feature_vector features for
+    sequences of any lengths, computed over the concatenated sequences: GC and window GC from one prefix sum,
+    codon histograms, CAI/tAI and codon-pair bias from bincounts over flat codon ids, runs from boundary flags.
+    """
+    N = len(seqs)
+    out = np.zeros((N, len(SEQUENCE_FEATURE_KEYS)))
+    if N == 0:
+        return out
+    col = {k: j for j, k in enumerate(SEQUENCE_FEATURE_KEYS)}
+    lens = np.fromiter(map(len, seqs), dtype=np.int64, count=N)
+    text = _FOLD[np.frombuffer("".join(seqs).encode("ascii", errors="replace"), dtype=np.uint8)]
+    nt = _NT_CODE[text]
+    nt_row, _, starts = _ragged_positions(lens)
+    out[:, col["len_nt"]] = lens
+
+    # GC content and 50 nt / step 10 window GC from one prefix sum
+    csum = np.zeros(nt.size + 1, dtype=np.int64)
+    np.cumsum((nt == 1) | (nt == 2), out=csum[1:])
+    out[:, col["gc"]] = np.where(lens > 0, (csum[starts + lens] - csum[starts]) / np.maximum(1, lens), 0.0)
+    n_win = np.where(lens >= 50, (lens - 50) // 10 + 1, 0)
+    w_row, w_off, w_first = _ragged_positions(n_win)
+    w_start = starts[w_row] + 10*w_off
+    wgc = (csum[w_start + 50] - csum[w_start]) / 50
+    has = n_win > 0
+    mean = np.bincount(w_row, weights=wgc, minlength=N) / np.maximum(1, n_win)
+    out[:, col["gcw_mean"]] = mean
+    out[:, col["gcw_std"]] = np.sqrt(np.bincount(w_row, weights=(wgc - mean[w_row])**2, minlength=N) / np.maximum(1, n_win))
+    if has.any():
+        out[has, col["gcw_min"]] = np.minimum.reduceat(wgc, w_first[has])
+        out[has, col["gcw_max"]] = np.maximum.reduceat(wgc, w_first[has])
+
+    # Flat codon ids (-1 for codons with non-ACGT characters; trailing partial codons dropped)
+    n_cod = lens // 3
+    c_row, c_off, c_first = _ragged_positions(n_cod)
+    c_pos = starts[c_row] + 3*c_off
+    b = [nt[c_pos + t].astype(np.int64) for t in range(3)]
+    c_ok = (b[0] < 4) & (b[1] < 4) & (b[2] < 4)
+    cidx = np.where(c_ok, 16*b[0] + 4*b[1] + b[2], -1)
+    safe = np.where(c_ok, cidx, 0)
+
+    counts = np.bincount(c_row[c_ok]*64 + cidx[c_ok], minlength=N*64).reshape(N, 64)
+    totals = counts.sum(axis=1, keepdims=True)
+    out[:, col["codon_" + CODONS[0]]:col["codon_" + CODONS[0]] + 64] = np.where(totals > 0, counts / np.maximum(1, totals), 0.0)
+
+    # CAI / tAI are 0 for sequences that are not valid CDS (validate_cds), as in build_feature_vector
+    valid = (lens > 0) & (lens % 3 == 0)
+    valid &= np.bincount(nt_row, weights=nt > 3, minlength=N) == 0
+    valid &= np.bincount(c_row, weights=_STOP_CODON[safe] & c_ok, minlength=N) == 0
+    first_codon = np.full(N, -1, dtype=np.int64)
+    first_codon[n_cod > 0] = cidx[c_first[n_cod > 0]]
+    valid &= first_codon == _ATG
+    per = np.maximum(1, n_cod)
+    out[:, col["cai"]] = np.where(valid, np.exp(np.bincount(c_row, weights=ctx.log_w[safe], minlength=N) / per), 0.0)
+    if ctx.trna_w is not None:
+        out[:, col["tai"]] = np.where(valid, np.exp(np.bincount(c_row, weights=ctx.log_trna[safe], minlength=N) / per), 0.0)
+
+    struct = _struct5_ragged(nt, starts, lens)
+    for i in np.flatnonzero(np.isnan(struct)):
+        struct[i] = five_prime_structure_proxy(seqs[i], window_nt=45)
+    out[:, col["struct5_proxy"]] = struct
+
+    rare = ctx.rare_mask(0.2)[safe] & c_ok
+    out[:, col["rare_run_len"]] = _ragged_run_totals(rare, c_row, N, 3, only_true=True)
+    out[:, col["homopoly_len"]] = _ragged_run_totals(text, nt_row, N, 6)
+
+    if ctx.cpb is not None and cidx.size > 1:
+        pair_val, pair_mask = ctx.pair_tables
+        same = c_row[1:] == c_row[:-1]
+        pk = safe[:-1]*64 + safe[1:]
+        use = same & c_ok[:-1] & c_ok[1:] & pair_mask[pk]
+        n_pairs = np.bincount(c_row[:-1][use], minlength=N)
+        s = np.bincount(c_row[:-1][use], weights=pair_val[pk][use], minlength=N)
+        out[:, col["cpb"]] = np.where(n_pairs > 0, s / np.maximum(1, n_pairs), 0.0)
+    return out
+
+
+def feature_keys_for(extra_features: Optional[Any] = None) -> List[str]:
+    """
+    Columns build_feature_matrix produces for these extra features: FEATURE_KEYS plus any additional
+    numeric lm_* features, in sorted order (the keys build_feature_vector returns).
+    """
+    extras = extra_features if isinstance(extra_features, (list, tuple)) else [extra_features]
+    lm = {k for ex in extras if ex for k, v in ex.items() if k.startswith("lm_") and isinstance(v, (int, float))}
+    return sorted(set(FEATURE_KEYS) | lm)
+
+
+def fill_feature_matrix(
+    out: np.ndarray,
+    feature_keys: List[str],
+    seqs: List[str],
+    context: ScoringContext,
+    extra_features: Optional[Any] = None,
+    rows: Optional[np.ndarray] = None,
+) -> None:
+    """
+    Write build_feature_vector features of `seqs` into `out` (an (N, D) array or memmap whose columns are
+    feature_keys), at `rows` (default: rows 0..len(seqs)-1). Features missing for a record are 0.
+    extra_features is one dict shared by all sequences or a per-sequence list.
+    """
+    ctx = context
+    seqs = list(seqs)
+    N = len(seqs)
+    rows = np.arange(N) if rows is None else np.asarray(rows)
+    extras = extra_features if isinstance(extra_features, (list, tuple)) else [extra_features]*N
+    key_col = {k: j for j, k in enumerate(feature_keys)}
+    src = [j for j, k in enumerate(SEQUENCE_FEATURE_KEYS) if k in key_col]
+    dst = [key_col[SEQUENCE_FEATURE_KEYS[j]] for j in src]
+
+    bounds = np.cumsum(np.fromiter(map(len, seqs), dtype=np.int64, count=N))
+    lo = 0
+    while lo < N:
+        hi = max(lo + 1, int(np.searchsorted(bounds, (bounds[lo-1] if lo else 0) + _CHUNK_NT, side="right")))
+        block = _sequence_feature_block(seqs[lo:hi], ctx)
+        out[np.ix_(rows[lo:hi], dst)] = block[:, src]
+        lo = hi
+
+    other = [k for k in feature_keys if k not in SEQUENCE_FEATURE_KEYS]
+    if other and N:
+        if all(ex is extras[0] for ex in extras):
+            f = extra_feature_defaults(extras[0])
+            out[np.ix_(rows, [key_col[k] for k in other])] = [f.get(k, 0.0) for k in other]
+        else:
+            table = [extra_feature_defaults(ex) for ex in extras]
+            for k in other:
+                out[rows, key_col[k]] = np.fromiter((f.get(k, 0.0) for f in table), dtype=float, count=N)
+
+
+def build_feature_matrix(
+    seqs: List[str],
+    usage: Optional[Dict[str,float]] = None,
+    trna_w: Optional[Dict[str,float]] = None,
+    cpb: Optional[Dict[str,float]] = None,
+    extra_features: Optional[Any] = None,
+    context: Optional[ScoringContext] = None,
+    feature_keys: Optional[List[str]] = None,
+    dtype: Any = np.float64,
+) -> Tuple[np.ndarray, List[str]]:
+    """
+    build_feature_vector rows for many sequences (of any lengths) as one preallocated (N, D) matrix,
+    computed in vectorized chunks rather than per sequence (float64, like build_feature_vector).
+    extra_features is either one dict shared by all rows or a per-sequence list.
+    Columns are feature_keys_for(extra_features) (FEATURE_KEYS for plain records); with feature_keys
+    (e.g. SurrogateModel.feature_keys) columns follow that order and features missing for a row are 0.
+    """
+    ctx = resolve_context(context, usage, trna_w, cpb)
+    keys = list(feature_keys) if feature_keys else feature_keys_for(extra_features)
+    X = np.zeros((len(seqs), len(keys)), dtype=dtype)
+    fill_feature_matrix(X, keys, seqs, ctx, extra_features=extra_features)
+    return X, keys
+
+def feature_matrix_from_metrics(
+    metrics: Dict[str, Any],
+    extra_features: Optional[Any] = None,
+    feature_keys: Optional[List[str]] = None,
+) -> Tuple[np.ndarray, List[str]]:
+    """
+    build_feature_matrix rows derived from a metrics.sequence_metrics_batch record, so candidates
+    already measured for rule scoring are not measured again. The record must use the featurizer's
+    settings (50 nt GC windows every 10 nt, rare runs at quantile 0.2 / min 3, homopolymers >= 6).
+    extra_features and feature_keys behave as in build_feature_matrix.
+    """
+    p = metrics["params"]
+    if (p["window"], p["step"], p["rare_quantile"], p["rare_min_run"], p["homopoly_min"]) != (50, 10, 0.2, 3, 6):
+        raise ValueError("Metric record was computed with settings that differ from the surrogate featurizer.")
+    N = metrics["n"]
+    cols: Dict[str, np.ndarray] = {}
+    if N:
+        win = metrics["gc_windows"]
+        has_win = win.shape[1] > 0
+        for name, fn in (("gcw_mean", np.mean), ("gcw_std", np.std), ("gcw_min", np.min), ("gcw_max", np.max)):
+            cols[name] = fn(win, axis=1) if has_win else np.zeros(N)
+        for k in ("len_nt", "gc", "cai", "tai", "struct5_proxy", "rare_run_len", "homopoly_len", "cpb"):
+            cols[k] = np.asarray(metrics[k], dtype=float)
+        counts = metrics["codon_counts"]
+        totals = counts.sum(axis=1, keepdims=True)
+        freqs = np.where(totals > 0, counts / np.maximum(1, totals), 0.0)
+        for j, c in enumerate(CODONS):
+            cols[f"codon_{c}"] = freqs[:, j]
+    extras = extra_features if isinstance(extra_features, (list, tuple)) else [extra_features]*N
+    extra_rows = [extra_feature_defaults(ex) for ex in extras]
+    for k in sorted(set().union(*extra_rows)) if extra_rows else []:
+        cols[k] = np.array([row.get(k, 0.0) for row in extra_rows], dtype=float)
+    keys = list(feature_keys) if feature_keys else sorted(cols)
+    if N == 0:
+        return np.zeros((0, len(keys))), keys
+    X = np.column_stack([cols[k] if k in cols else np.zeros(N) for k in keys])
+    return X, keys
+
 ########################
 # Surrogate model
 ########################
@@ -148,6 +430,13 @@ class SurrogateModel:
         self.mu_model = None
         self.hi_model = None
         self.scaler = StandardScaler()
+        self._compiled = None
+
+    def __getstate__(self):
+        # the compiled form is derived from the fitted models; rebuild it after loading
+        state = dict(self.__dict__)
+        state["_compiled"] = None
+        return state
 
     def _make_lgb(self, alpha: float):
         params = dict(
@@ -181,6 +470,7 @@ class SurrogateModel:
             y_transformed = y
             self._y_is_log = False
         
+        self._compiled = None
         # standardize features
         Xs = self.scaler.fit_transform(X)
         if _HAS_LGB:
@@ -219,10 +509,35 @@ class SurrogateModel:
         }
         return metrics
 
-    def predict_mu_sigma(self, X: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
-        Xs = self.scaler.transform(X)
-        mu = self.mu_model.predict(Xs)
-        hi = self.hi_model.predict(Xs)
+    def compiled(self) -> Optional["CompiledSurrogate"]:
+        """Flat-array form of the fitted ensembles (tree_inference), built on first use; None if unsupported."""
+        if getattr(self, "_compiled", None) is None:
+            try:
+                self._compiled = compile_surrogate(self)
+            except (ValueError, AttributeError, KeyError) as e:
+                warnings.warn(f"Surrogate ensembles cannot be compiled, using the regular path: {e}")
+                self._compiled = False
+        return self._compiled or None
+
+    def predict_mu_sigma(self, X: np.ndarray, compiled: bool = True) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (mu, sigma) per row. By default mu and q_hi come from one pass over the compiled ensembles
+        (bit-identical to the scaler + model.predict path, which is used for non-finite inputs or
+        with compiled=False).
+        """
+        raw = None
+        if compiled and self.compiled() is not None:
+            try:
+                raw = self._compiled.predict_raw(X)
+            except Exception as e:
+                warnings.warn(f"Compiled surrogate inference failed, using the regular path: {e}")
+                self._compiled = False
+        if raw is not None:
+            mu, hi = raw
+        else:
+            Xs = self.scaler.transform(X)
+            mu = self.mu_model.predict(Xs)
+            hi = self.hi_model.predict(Xs)
         
         # Inverse transform if log was applied during training
         if hasattr(self, '_y_is_log') and self._y_is_log:
@@ -253,6 +568,76 @@ class SurrogateModel:
         m._y_is_log = obj.get("_y_is_log", False)
         return m
 
+class SurrogateRegistry:
+    """
+    Thread-safe, process-wide cache of loaded SurrogateModels.
+    Models are loaded on first use and keyed by (real path, mtime, size), so a retrained .pkl is
+    picked up on the next get() and its stale entry dropped. When the summed on-disk size of the
+    loaded models exceeds max_bytes, least recently used models are evicted (the newest is kept).
+    Concurrent get() calls for the same file load it once.
+    """
+    def __init__(self, max_bytes: int = 1 << 30):
+        self.max_bytes = max_bytes
+        self._models: "OrderedDict[Tuple[str, int, int], SurrogateModel]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._loading: Dict[Tuple[str, int, int], threading.Lock] = {}
+        self.hits = 0
+        self.loads = 0
+
+    @staticmethod
+    def _key(path: str) -> Tuple[str, int, int]:
+        real = os.path.realpath(path)
+        st = os.stat(real)
+        return real, st.st_mtime_ns, st.st_size
+
+    def get(self, path: str) -> SurrogateModel:
+        key = self._key(path)
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                self.hits += 1
+                return self._models[key]
+            load_lock = self._loading.setdefault(key, threading.Lock())
+        with load_lock:
+            try:
+                with self._lock:
+                    if key in self._models:
+                        self._models.move_to_end(key)
+                        self.hits += 1
+                        return self._models[key]
+                model = SurrogateModel.load(key[0])
+                with self._lock:
+                    for old in [k for k in self._models if k[0] == key[0]]:
+                        del self._models[old]
+                    self._models[key] = model
+                    self.loads += 1
+                    while len(self._models) > 1 and sum(k[2] for k in self._models) > self.max_bytes:
+                        self._models.popitem(last=False)
+            finally:
+                # also on a failed load, so the per-key lock does not outlive the attempt
+                with self._lock:
+                    if self._loading.get(key) is load_lock:
+                        del self._loading[key]
+        return model
+
+    def clear(self) -> None:
+        with self._lock:
+            self._models.clear()
+            self._loading.clear()
+
+    def __len__(self) -> int:
+        return len(self._models)
+
+
+_REGISTRY = SurrogateRegistry(int(float(os.environ.get("CODON_VERIFIER_SURROGATE_CACHE_MB", "1024")) * (1 << 20)))
+
+def get_surrogate(path: str) -> SurrogateModel:
+    """The SurrogateModel at `path` from the process-wide SurrogateRegistry (loaded on first use)."""
+    return _REGISTRY.get(path)
+
+def surrogate_registry() -> SurrogateRegistry:
+    return _REGISTRY
+
 ########################
 # Data IO & end-to-end
 ########################
@@ -267,19 +652,16 @@ def read_jsonl(path: str) -> List[dict]:
     return out
 
 def build_dataset(records: List[dict], usage: Dict[str,float], trna_w: Optional[Dict[str,float]]=None) -> Tuple[np.ndarray, np.ndarray, List[str]]:
-    X = []
-    y = []
-    feat_keys = None
-    for r in records:
-        dna = r["sequence"]
-        extra = r.get("extra_features")
-        vec, keys = build_feature_vector(dna, usage, trna_w=trna_w, extra_features=extra)
-        X.append(vec)
-        if feat_keys is None:
-            feat_keys = keys
-        y.append(float(r["expression"]["value"] if isinstance(r.get("expression"), dict) else r["expression"]))
-    X = np.vstack(X)
-    y = np.array(y, dtype=float)
+    ctx = ScoringContext(usage, trna_w)
+    X, feat_keys = build_feature_matrix(
+        [r["sequence"] for r in records],
+        extra_features=[r.get("extra_features") for r in records],
+        context=ctx,
+    )
+    y = np.array([
+        float(r["expression"]["value"] if isinstance(r.get("expression"), dict) else r["expression"])
+        for r in records
+    ], dtype=float)
     return X, y, feat_keys
 
 def train_and_save(jsonl_path: str, usage: Dict[str,float], trna_w: Optional[Dict[str,float]], out_model_path: str) -> Dict[str, Any]:
@@ -292,13 +674,9 @@ def train_and_save(jsonl_path: str, usage: Dict[str,float], trna_w: Optional[Dic
     metrics["n_samples"] = int(len(y))
     return metrics
 
-def load_and_predict(model_path: str, seqs: List[str], usage: Dict[str,float], trna_w: Optional[Dict[str,float]]=None, extra: Optional[dict]=None) -> List[Dict[str,float]]:
-    m = SurrogateModel.load(model_path)
-    X = []
-    for dna in seqs:
-        vec, _ = build_feature_vector(dna, usage, trna_w=trna_w, extra_features=extra)
-        X.append(vec)
-    X = np.vstack(X)
+def load_and_predict(model_path: str, seqs: List[str], usage: Optional[Dict[str,float]], trna_w: Optional[Dict[str,float]]=None, extra: Optional[dict]=None, context: Optional[ScoringContext]=None) -> List[Dict[str,float]]:
+    m = get_surrogate(model_path)
+    X, _ = build_feature_matrix(seqs, usage, trna_w, extra_features=extra, context=context, feature_keys=m.feature_keys)
     mu, sigma = m.predict_mu_sigma(X)
     out = []
     for i in range(len(seqs)):
@@ -10,61 +10,124 @@ This script extends the basic surrogate training to:
 import argparse
 import json
 import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
 import numpy as np
 import logging
 
 from codon_verifier.surrogate import (
-    build_feature_vector,
+    feature_keys_for,
+    fill_feature_matrix,
+    TRAINING_FEATURE_DTYPE,
     SurrogateModel,
     SurrogateConfig,
 )
 from codon_verifier.hosts.tables import get_host_tables, HOST_TABLES
+from codon_verifier.context import ScoringContext
 from codon_verifier.data_loader import DataLoader, DataConfig, create_train_val_split
+from codon_verifier.feature_cache import FeatureCache, FeatureSet, dataset_key
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 
+# Records per featurization shard when build_dataset_multihost runs with workers > 1
+SHARD_SIZE = 2048
+
+# Per-process state of featurization workers: host contexts built once per process and the
+# memory-mapped output matrix that shards write into
+_WORKER: Dict[str, Any] = {}
+
+
+def _init_featurize_worker(host_tables: Dict[str, tuple], out_path: str, shape: Tuple[int, int], feat_keys: List[str]) -> None:
+    _WORKER["contexts"] = {
+        h: ScoringContext(usage, trna_w, host=h) for h, (usage, trna_w) in host_tables.items()
+    }
+    _WORKER["out"] = np.memmap(out_path, dtype=TRAINING_FEATURE_DTYPE, mode="r+", shape=shape)
+    _WORKER["feat_keys"] = feat_keys
+
+
+def _featurize_rows(
+    out: np.ndarray,
+    feat_keys: List[str],
+    contexts: Dict[str, ScoringContext],
+    rows: List[int],
+    seqs: List[str],
+    extras: List[Optional[dict]],
+    hosts: List[str],
+) -> List[Tuple[int, str]]:
+    """
+    Write features of the given records into `rows` of `out`, one vectorized call per host.
+    Returns (row, error) for records that could not be featurized.
+    """
+    failed = []
+    by_host: Dict[str, List[int]] = {}
+    for j, host in enumerate(hosts):
+        by_host.setdefault(host, []).append(j)
+    for host, js in by_host.items():
+        try:
+            fill_feature_matrix(
+                out, feat_keys, [seqs[j] for j in js], contexts[host],
+                extra_features=[extras[j] for j in js], rows=np.array([rows[j] for j in js]),
+            )
+        except Exception:
+            # Isolate the offending records so the rest of the group is kept
+            for j in js:
+                try:
+                    fill_feature_matrix(
+                        out, feat_keys, [seqs[j]], contexts[host],
+                        extra_features=[extras[j]], rows=np.array([rows[j]]),
+                    )
+                except Exception as e:
+                    failed.append((rows[j], str(e)))
+    return failed
+
+
+def _featurize_shard(shard: tuple) -> List[Tuple[int, str]]:
+    rows, seqs, extras, hosts = shard
+    failed = _featurize_rows(_WORKER["out"], _WORKER["feat_keys"], _WORKER["contexts"], rows, seqs, extras, hosts)
+    _WORKER["out"].flush()
+    return failed
+
+
 def build_dataset_multihost(
     records: List[dict],
-    host_tables: Dict[str, tuple]
-) -> tuple[np.ndarray, np.ndarray, List[str]]:
+    host_tables: Dict[str, tuple],
+    workers: int = 1,
+    return_hosts: bool = False,
+) -> tuple:
     """
     Build dataset with proper host-specific codon usage tables.
     
     Args:
         records: List of data records
         host_tables: Dictionary mapping host names to (usage, trna) tuples
+        workers: Featurization processes; with more than one, records are split into
+            SHARD_SIZE shards that workers (holding preloaded host contexts) write
+            straight into a shared memory-mapped matrix
+        return_hosts: Also return the host label of every row
     
     Returns:
-        Tuple of (X, y, feature_keys)
+        Tuple of (X, y, feature_keys), plus the row host labels with return_hosts
     """
-    X = []
-    y = []
-    feat_keys = None
-    
+    seqs, extras, hosts, y, rec_idx, labels = [], [], [], [], [], []
     for i, record in enumerate(records):
         try:
             dna = record["sequence"]
+            if not isinstance(dna, str):
+                raise TypeError(f"sequence must be a string, got {type(dna).__name__}")
             host = record.get("host", "E_coli")
             extra = record.get("extra_features")
+            if extra is not None and not isinstance(extra, dict):
+                raise TypeError(f"extra_features must be a dict, got {type(extra).__name__}")
             
             # Get host-specific tables
             if host not in host_tables:
                 logger.warning(f"Unknown host {host} in record {i}, using E_coli")
                 host = "E_coli"
             
-            usage, trna_w = host_tables[host]
-            
-            # Build features
-            vec, keys = build_feature_vector(dna, usage, trna_w=trna_w, extra_features=extra)
-            X.append(vec)
-            
-            if feat_keys is None:
-                feat_keys = keys
-            
             # Extract expression value
             expr = record.get("expression", {})
             if isinstance(expr, dict):
@@ -72,30 +135,120 @@ def build_dataset_multihost(
             else:
                 y_val = float(expr)
             
-            y.append(y_val)
-            
         except Exception as e:
             logger.error(f"Error processing record {i}: {e}")
             continue
-    
-    if not X:
+        seqs.append(dna)
+        extras.append(extra)
+        hosts.append(host)
+        y.append(y_val)
+        rec_idx.append(i)
+        labels.append(record.get("host", "unknown"))
+    
+    if not seqs:
         raise ValueError("No valid records processed")
     
-    X = np.vstack(X)
+    # One preallocated matrix with a fixed schema, filled in vectorized per-host chunks
+    feat_keys = feature_keys_for(extras)
+    shape = (len(seqs), len(feat_keys))
+    if workers > 1:
+        with tempfile.TemporaryDirectory() as tmp:
+            out_path = os.path.join(tmp, "features.f32")
+            X = np.memmap(out_path, dtype=TRAINING_FEATURE_DTYPE, mode="w+", shape=shape)
+            shards = [
+                (list(range(s, min(s + SHARD_SIZE, len(seqs)))),
+                 seqs[s:s + SHARD_SIZE], extras[s:s + SHARD_SIZE], hosts[s:s + SHARD_SIZE])
+                for s in range(0, len(seqs), SHARD_SIZE)
+            ]
+            logger.info(f"Featurizing {len(seqs)} records in {len(shards)} shards on {workers} workers")
+            with ProcessPoolExecutor(
+                max_workers=workers, initializer=_init_featurize_worker,
+                initargs=(host_tables, out_path, shape, feat_keys),
+            ) as pool:
+                failed = [f for part in pool.map(_featurize_shard, shards) for f in part]
+            X = np.array(X)
+    else:
+        # Usage-derived tables are built once per host, not once per record
+        contexts = {
+            h: ScoringContext(usage, trna_w, host=h) for h, (usage, trna_w) in host_tables.items()
+        }
+        X = np.zeros(shape, dtype=TRAINING_FEATURE_DTYPE)
+        failed = _featurize_rows(X, feat_keys, contexts, list(range(len(seqs))), seqs, extras, hosts)
     y = np.array(y, dtype=float)
+    labels = np.array(labels, dtype=str)
+    
+    if failed:
+        for row, err in sorted(failed):
+            logger.error(f"Error processing record {rec_idx[row]}: {err}")
+        keep = np.ones(len(seqs), dtype=bool)
+        keep[[row for row, _ in failed]] = False
+        if not keep.any():
+            raise ValueError("No valid records processed")
+        X, y, labels = X[keep], y[keep], labels[keep]
     
     logger.info(f"Built dataset: X shape {X.shape}, y shape {y.shape}")
     
+    if return_hosts:
+        return X, y, feat_keys, labels
     return X, y, feat_keys
 
 
+def build_unified_features(
+    data_paths: List[str],
+    data_config: Optional[DataConfig] = None,
+    target_hosts: Optional[List[str]] = None,
+    max_samples: Optional[int] = None,
+    workers: int = 1,
+    cache_dir: Optional[str] = None
+) -> FeatureSet:
+    """
+    Load, mix and featurize records from all hosts (load_and_mix + build_dataset_multihost).
+    
+    With cache_dir, the result is stored in a FeatureCache keyed by the data files' content,
+    data_config, the record selection and the featurizer version; later calls with the same
+    inputs memory-map it instead of loading and featurizing the data again.
+    """
+    cache = FeatureCache(cache_dir) if cache_dir else None
+    key = None
+    if cache is not None:
+        key = dataset_key(
+            data_paths, data_config or DataConfig(),
+            mode="unified", target_hosts=sorted(target_hosts or []), max_samples=max_samples,
+        )
+        cached = cache.load(key)
+        if cached is not None:
+            return cached["all"]
+    
+    # Load and mix data
+    logger.info("Loading and mixing multi-host data...")
+    loader = DataLoader(data_config)
+    
+    target_host_set = set(target_hosts) if target_hosts else None
+    records = loader.load_and_mix(data_paths, target_hosts=target_host_set, total_samples=max_samples)
+    
+    if not records:
+        raise ValueError("No records loaded")
+    
+    logger.info(f"Loaded {len(records)} records")
+    
+    # Build dataset
+    logger.info("Building feature dataset...")
+    X, y, feat_keys, hosts = build_dataset_multihost(records, HOST_TABLES, workers=workers, return_hosts=True)
+    features = FeatureSet(X, y, hosts, feat_keys)
+    if cache is not None:
+        cache.save(key, {"all": features}, info={"data_paths": list(data_paths)})
+    return features
+
+
 def train_unified_model(
     data_paths: List[str],
     output_model_path: str,
     data_config: Optional[DataConfig] = None,
     surrogate_config: Optional[SurrogateConfig] = None,
     target_hosts: Optional[List[str]] = None,
-    max_samples: Optional[int] = None
+    max_samples: Optional[int] = None,
+    workers: int = 1,
+    cache_dir: Optional[str] = None
 ) -> Dict[str, Any]:
     """
     Train a unified model across multiple hosts.
@@ -107,28 +260,17 @@ def train_unified_model(
         surrogate_config: Configuration for surrogate model
         target_hosts: Optional list of hosts to include
         max_samples: Optional maximum number of samples
+        workers: Featurization processes
+        cache_dir: Optional feature cache directory (see build_unified_features)
     
     Returns:
         Training metrics
     """
-    # Load and mix data
-    logger.info("Loading and mixing multi-host data...")
-    loader = DataLoader(data_config)
-    
-    target_host_set = set(target_hosts) if target_hosts else None
-    records = loader.load_and_mix(data_paths, target_hosts=target_host_set, total_samples=max_samples)
-    
-    if not records:
-        raise ValueError("No records loaded")
-    
-    logger.info(f"Loaded {len(records)} records")
-    
-    # Prepare host tables
-    host_tables = HOST_TABLES
-    
-    # Build dataset
-    logger.info("Building feature dataset...")
-    X, y, feat_keys = build_dataset_multihost(records, host_tables)
+    features = build_unified_features(
+        data_paths, data_config=data_config, target_hosts=target_hosts,
+        max_samples=max_samples, workers=workers, cache_dir=cache_dir,
+    )
+    X, y, feat_keys = features.X, features.y, features.feature_keys
     
     # Train model
     logger.info("Training surrogate model...")
@@ -146,18 +288,74 @@ def train_unified_model(
     
     # Host distribution
     from collections import Counter
-    host_dist = Counter(r.get("host", "unknown") for r in records)
+    host_dist = Counter(features.hosts.tolist())
     metrics["host_distribution"] = dict(host_dist)
     
     return metrics
 
 
+def build_host_features(
+    data_paths: List[str],
+    data_config: Optional[DataConfig] = None,
+    target_hosts: Optional[List[str]] = None,
+    workers: int = 1,
+    cache_dir: Optional[str] = None
+) -> Dict[str, FeatureSet]:
+    """
+    Load records grouped by host (load_multi_host) and featurize each host with its own tables.
+    Hosts without codon tables, or whose records all fail, are skipped.
+    
+    With cache_dir, the per-host features are cached as in build_unified_features.
+    """
+    cache = FeatureCache(cache_dir) if cache_dir else None
+    key = None
+    if cache is not None:
+        key = dataset_key(
+            data_paths, data_config or DataConfig(),
+            mode="host-specific", target_hosts=sorted(target_hosts or []),
+        )
+        cached = cache.load(key)
+        if cached is not None:
+            return cached
+    
+    # Load data
+    logger.info("Loading multi-host data...")
+    loader = DataLoader(data_config)
+    
+    target_host_set = set(target_hosts) if target_hosts else None
+    host_data = loader.load_multi_host(data_paths, target_hosts=target_host_set)
+    
+    if not host_data:
+        raise ValueError("No data loaded")
+    
+    features = {}
+    for host, records in host_data.items():
+        # Get host-specific tables
+        if host not in HOST_TABLES:
+            logger.warning(f"No codon table for {host}, skipping")
+            continue
+        try:
+            X, y, feat_keys, hosts = build_dataset_multihost(
+                records, {host: HOST_TABLES[host]}, workers=workers, return_hosts=True,
+            )
+        except Exception as e:
+            logger.error(f"Failed to build dataset for {host}: {e}")
+            continue
+        features[host] = FeatureSet(X, y, hosts, feat_keys)
+    
+    if cache is not None:
+        cache.save(key, features, info={"data_paths": list(data_paths)})
+    return features
+
+
 def train_host_specific_models(
     data_paths: List[str],
     output_dir: str,
     data_config: Optional[DataConfig] = None,
     surrogate_config: Optional[SurrogateConfig] = None,
-    target_hosts: Optional[List[str]] = None
+    target_hosts: Optional[List[str]] = None,
+    workers: int = 1,
+    cache_dir: Optional[str] = None
 ) -> Dict[str, Dict[str, Any]]:
     """
     Train separate models for each host organism.
@@ -168,62 +366,31 @@ def train_host_specific_models(
         data_config: Configuration for data loading
         surrogate_config: Configuration for surrogate model
         target_hosts: Optional list of hosts to train models for
+        workers: Featurization processes
+        cache_dir: Optional feature cache directory (see build_host_features)
     
     Returns:
         Dictionary mapping host to training metrics
     """
     os.makedirs(output_dir, exist_ok=True)
     
-    # Load data
-    logger.info("Loading multi-host data...")
-    loader = DataLoader(data_config)
-    
-    target_host_set = set(target_hosts) if target_hosts else None
-    host_data = loader.load_multi_host(data_paths, target_hosts=target_host_set)
-    
-    if not host_data:
-        raise ValueError("No data loaded")
+    host_features = build_host_features(
+        data_paths, data_config=data_config, target_hosts=target_hosts,
+        workers=workers, cache_dir=cache_dir,
+    )
     
     # Train model for each host
     all_metrics = {}
-    host_tables = HOST_TABLES
     
-    for host, records in host_data.items():
+    for host, features in host_features.items():
         logger.info(f"\n{'='*60}")
-        logger.info(f"Training model for {host} ({len(records)} samples)")
+        logger.info(f"Training model for {host} ({len(features.y)} samples)")
         logger.info(f"{'='*60}")
         
         try:
-            # Get host-specific tables
-            if host not in host_tables:
-                logger.warning(f"No codon table for {host}, skipping")
-                continue
-            
-            usage, trna_w = host_tables[host]
-            
-            # Build dataset
-            X = []
-            y = []
-            feat_keys = None
-            
-            for record in records:
-                dna = record["sequence"]
-                extra = record.get("extra_features")
-                vec, keys = build_feature_vector(dna, usage, trna_w=trna_w, extra_features=extra)
-                X.append(vec)
-                if feat_keys is None:
-                    feat_keys = keys
-                
-                expr = record.get("expression", {})
-                y_val = float(expr.get("value", 0) if isinstance(expr, dict) else expr)
-                y.append(y_val)
-            
-            X = np.vstack(X)
-            y = np.array(y, dtype=float)
-            
             # Train model
-            model = SurrogateModel(feature_keys=feat_keys, cfg=surrogate_config)
-            metrics = model.fit(X, y)
+            model = SurrogateModel(feature_keys=features.feature_keys, cfg=surrogate_config)
+            metrics = model.fit(np.asarray(features.X), features.y)
             
             # Save model
             output_path = os.path.join(output_dir, f"{host}_surrogate.pkl")
@@ -231,7 +398,7 @@ def train_host_specific_models(
             
             # Record metrics
             metrics["model_path"] = output_path
-            metrics["n_samples"] = int(len(y))
+            metrics["n_samples"] = int(len(features.y))
             metrics["host"] = host
             all_metrics[host] = metrics
             
@@ -329,6 +496,19 @@ def main():
         help="Test set fraction"
     )
     
+    # Featurization
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Processes used to featurize records (default: 1)"
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=None,
+        help="Reuse featurized datasets cached in this directory (keyed by data, filters and featurizer version)"
+    )
+    
     args = parser.parse_args()
     
     # Build configurations
@@ -354,7 +534,9 @@ def main():
             data_config=data_config,
             surrogate_config=surrogate_config,
             target_hosts=args.hosts,
-            max_samples=args.max_samples
+            max_samples=args.max_samples,
+            workers=args.workers,
+            cache_dir=args.cache_dir
         )
         print("\n" + "="*60)
         print("TRAINING COMPLETE")
@@ -368,7 +550,9 @@ def main():
             args.out,
             data_config=data_config,
             surrogate_config=surrogate_config,
-            target_hosts=args.hosts
+            target_hosts=args.hosts,
+            workers=args.workers,
+            cache_dir=args.cache_dir
         )
         print("\n" + "="*60)
         print("TRAINING COMPLETE")
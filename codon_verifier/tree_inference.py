@@ -0,0 +1,250 @@
+from __future__ import annotations
+
+"""
+Flat-array inference for SurrogateModel's pair of quantile tree ensembles.
+
+compile_surrogate() exports the mu and q_hi ensembles (LightGBM or sklearn GradientBoostingRegressor)
+into one set of NumPy node arrays and evaluates both in a single vectorized pass over all trees, so a
+prediction costs no scaler call and no per-model Python -> LightGBM / sklearn round trip.
+
+The StandardScaler is folded into the split thresholds. A split tests "scaled x <= t"; since scaling is
+monotone, that holds exactly for raw x <= T', where T' is the largest value of the input dtype whose
+scaled value is still <= t. T' is found by bisection over the ordered bit patterns of the dtype,
+evaluating the fitted scaler itself (and the float32 cast sklearn trees apply) on the candidates.
+Leaf values are accumulated in the order LightGBM and sklearn use, so results are bit-identical to
+scaler.transform + model.predict for every finite input; inputs with NaN/inf are left to that path.
+"""
+
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Rows evaluated per block (bounds the (rows, trees) node-index matrix)
+_BLOCK_ROWS = 4096
+
+# LightGBM objectives whose raw score is the prediction
+_IDENTITY_OBJECTIVES = {"quantile", "regression", "regression_l1", "huber", "fair"}
+
+_UINT = {np.dtype(np.float64): np.uint64, np.dtype(np.float32): np.uint32}
+
+
+@dataclass
+class _Ensemble:
+    """Trees of one model as flat node arrays (leaves point to themselves and carry the value added)."""
+    feature: np.ndarray
+    threshold: np.ndarray
+    left: np.ndarray
+    right: np.ndarray
+    value: np.ndarray
+    roots: np.ndarray
+    depth: int
+    base: float
+    float32_input: bool
+
+
+class _Builder:
+    def __init__(self):
+        self.feature: List[int] = []
+        self.threshold: List[float] = []
+        self.left: List[int] = []
+        self.right: List[int] = []
+        self.value: List[float] = []
+
+    def node(self) -> int:
+        for col, v in ((self.feature, 0), (self.threshold, np.inf), (self.left, -1), (self.right, -1), (self.value, 0.0)):
+            col.append(v)
+        return len(self.feature) - 1
+
+    def leaf(self, i: int, value: float) -> None:
+        self.left[i] = self.right[i] = i
+        self.value[i] = value
+
+    def ensemble(self, roots: List[int], depth: int, base: float, float32_input: bool) -> _Ensemble:
+        return _Ensemble(
+            np.array(self.feature, dtype=np.int64), np.array(self.threshold, dtype=np.float64),
+            np.array(self.left, dtype=np.int64), np.array(self.right, dtype=np.int64),
+            np.array(self.value, dtype=np.float64), np.array(roots, dtype=np.int64),
+            depth, base, float32_input,
+        )
+
+
+def _export_lightgbm(model: Any) -> _Ensemble:
+    booster = model.booster_
+    dump = booster.dump_model()
+    objective = str(dump.get("objective", "")).split()
+    if dump.get("num_tree_per_iteration", 1) != 1 or dump.get("average_output") \
+            or not objective or objective[0] not in _IDENTITY_OBJECTIVES or "sqrt" in objective:
+        raise ValueError("Only single-output LightGBM regressors with an identity output can be compiled.")
+    trees = dump["tree_info"]
+    if booster.best_iteration > 0:
+        trees = trees[:booster.best_iteration]
+    b = _Builder()
+    roots, depth = [], 0
+    for tree in trees:
+        stack = [(tree["tree_structure"], b.node(), 0)]
+        roots.append(stack[0][1])
+        while stack:
+            nd, i, d = stack.pop()
+            depth = max(depth, d)
+            if "leaf_value" in nd:
+                if "leaf_coeff" in nd:
+                    raise ValueError("Linear-tree LightGBM models cannot be compiled.")
+                b.leaf(i, float(nd["leaf_value"]))
+                continue
+            if nd["decision_type"] != "<=" or nd["missing_type"] == "Zero":
+                raise ValueError("Only numerical '<=' splits without zero-as-missing can be compiled.")
+            b.feature[i] = int(nd["split_feature"])
+            b.threshold[i] = float(nd["threshold"])
+            b.left[i], b.right[i] = b.node(), b.node()
+            stack += [(nd["left_child"], b.left[i], d + 1), (nd["right_child"], b.right[i], d + 1)]
+    return b.ensemble(roots, depth, 0.0, float32_input=False)
+
+
+def _export_sklearn_gbr(model: Any) -> _Ensemble:
+    if model.estimators_.shape[1] != 1:
+        raise ValueError("Only single-output GradientBoostingRegressor models can be compiled.")
+    base = float(np.asarray(model._raw_predict_init(np.zeros((1, model.n_features_in_))))[0, 0])
+    b = _Builder()
+    roots, depth = [], 0
+    for est in model.estimators_[:, 0]:
+        t = est.tree_
+        off = len(b.feature)
+        roots.append(off)
+        depth = max(depth, int(t.max_depth))
+        leaf = t.children_left < 0
+        b.feature += np.where(leaf, 0, t.feature).tolist()
+        b.threshold += np.where(leaf, np.inf, t.threshold).tolist()
+        own = np.arange(off, off + t.node_count)
+        b.left += np.where(leaf, own, t.children_left + off).tolist()
+        b.right += np.where(leaf, own, t.children_right + off).tolist()
+        # predict_stages adds learning_rate * value for each stage
+        b.value += np.where(leaf, model.learning_rate * t.value[:, 0, 0], 0.0).tolist()
+    return b.ensemble(roots, depth, base, float32_input=True)
+
+
+def _export(model: Any) -> _Ensemble:
+    if hasattr(model, "booster_"):
+        return _export_lightgbm(model)
+    if hasattr(model, "estimators_") and hasattr(model, "_raw_predict_init"):
+        return _export_sklearn_gbr(model)
+    raise ValueError(f"Cannot compile model of type {type(model).__name__}.")
+
+
+def _to_key(x: np.ndarray, utype: Any) -> np.ndarray:
+    """Order-preserving map of floats to unsigned integers."""
+    bits = x.view(utype)
+    sign = utype(1) << utype(8 * x.itemsize - 1)
+    return np.where(bits & sign, ~bits, bits | sign)
+
+
+def _from_key(k: np.ndarray, dtype: np.dtype, utype: Any) -> np.ndarray:
+    sign = utype(1) << utype(8 * dtype.itemsize - 1)
+    return np.where(k & sign, k ^ sign, ~k).astype(utype).view(dtype)
+
+
+class CompiledSurrogate:
+    """
+    mu and q_hi ensembles of a fitted SurrogateModel with its scaler folded into raw-feature thresholds.
+    predict_raw(X) returns (mu, q_hi) before any inverse target transform, or None when X is not finite
+    or has the wrong width (the caller then uses the regular path).
+    """
+
+    def __init__(self, scaler: Any, mu_model: Any, hi_model: Any):
+        self.scaler = scaler
+        self.n_features = int(scaler.n_features_in_)
+        parts = [_export(mu_model), _export(hi_model)]
+        offsets = np.cumsum([0] + [len(p.feature) for p in parts])[:-1]
+        self.feature = np.concatenate([p.feature for p in parts])
+        self.threshold = np.concatenate([p.threshold for p in parts])
+        self.left = np.concatenate([p.left + o for p, o in zip(parts, offsets)])
+        self.right = np.concatenate([p.right + o for p, o in zip(parts, offsets)])
+        self.value = np.concatenate([p.value for p in parts])
+        self.roots = np.concatenate([p.roots + o for p, o in zip(parts, offsets)])
+        self.float32_input = np.concatenate([np.full(len(p.feature), p.float32_input) for p in parts])
+        self.n_mu = len(parts[0].roots)
+        self.base = (parts[0].base, parts[1].base)
+        self.depth = max(p.depth for p in parts)
+        self._split = np.flatnonzero(self.left != np.arange(len(self.left)))
+        self._folded: Dict[np.dtype, np.ndarray] = {}
+
+    def _scaled(self, x: np.ndarray, feat: np.ndarray, float32_input: np.ndarray) -> np.ndarray:
+        """What each split sees for raw value x[i] of feature feat[i]: the scaler output, cast as the trees cast it."""
+        C = np.zeros((len(x), self.n_features), dtype=x.dtype)
+        rows = np.arange(len(x))
+        C[rows, feat] = x
+        # probes near +-max overflow in the scaler and in the cast; they then compare as +-inf
+        with np.errstate(over="ignore", invalid="ignore"):
+            s = np.asarray(self.scaler.transform(C))[rows, feat]
+            return np.where(float32_input, s.astype(np.float32).astype(np.float64), s.astype(np.float64))
+
+    def folded_thresholds(self, dtype: Any) -> np.ndarray:
+        """Per-node raw-feature thresholds for inputs of `dtype` (float64 or float32)."""
+        dtype = np.dtype(dtype)
+        if dtype in self._folded:
+            return self._folded[dtype]
+        if self._split.size == 0:
+            # stump-only ensembles: nothing to fold (and the scaler rejects zero-row probes)
+            self._folded[dtype] = np.full(len(self.feature), np.inf, dtype=dtype)
+            return self._folded[dtype]
+        utype = _UINT[dtype]
+        # distinct (feature, threshold, cast) splits are folded once
+        keys = np.column_stack([self.feature[self._split], self.threshold[self._split], self.float32_input[self._split]])
+        uniq, inv = np.unique(keys, axis=0, return_inverse=True)
+        feat, t, f32 = uniq[:, 0].astype(np.int64), uniq[:, 1], uniq[:, 2].astype(bool)
+
+        def left(k: np.ndarray) -> np.ndarray:
+            return self._scaled(_from_key(k, dtype, utype), feat, f32) <= t
+
+        fmax = np.finfo(dtype).max
+        lo = np.full(len(t), _to_key(np.array([-fmax], dtype=dtype), utype)[0], dtype=utype)
+        hi = np.full(len(t), _to_key(np.array([fmax], dtype=dtype), utype)[0], dtype=utype)
+        none_left, all_left = ~left(lo), left(hi)
+        # invariant for the rest: lo goes left, hi goes right; find the last key that goes left
+        todo = ~none_left & ~all_left
+        while True:
+            active = todo & (hi - lo > 1)
+            if not active.any():
+                break
+            mid = lo + (hi - lo) // utype(2)
+            go = left(mid)
+            lo = np.where(active & go, mid, lo)
+            hi = np.where(active & ~go, mid, hi)
+        T = _from_key(lo, dtype, utype).copy()
+        T[none_left] = -np.inf
+        T[all_left] = np.inf
+        out = np.full(len(self.feature), np.inf, dtype=dtype)
+        out[self._split] = T[inv.ravel()]
+        self._folded[dtype] = out
+        return out
+
+    def predict_raw(self, X: np.ndarray) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        X = np.asarray(X)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            return None
+        if X.dtype not in _UINT:
+            X = X.astype(np.float64)
+        if not np.isfinite(X).all():
+            return None
+        thr = self.folded_thresholds(X.dtype)
+        mu = np.empty(len(X))
+        hi = np.empty(len(X))
+        for s in range(0, len(X), _BLOCK_ROWS):
+            Xb = X[s:s + _BLOCK_ROWS]
+            rows = np.arange(len(Xb))[:, None]
+            cur = np.broadcast_to(self.roots, (len(Xb), len(self.roots)))
+            for _ in range(self.depth):
+                cur = np.where(Xb[rows, self.feature[cur]] <= thr[cur], self.left[cur], self.right[cur])
+            vals = self.value[cur]
+            # sequential accumulation from the base value, as LightGBM / predict_stages add trees
+            for out, base, cols in ((mu, self.base[0], vals[:, :self.n_mu]), (hi, self.base[1], vals[:, self.n_mu:])):
+                acc = np.concatenate([np.full((len(Xb), 1), base), cols], axis=1)
+                out[s:s + len(Xb)] = np.cumsum(acc, axis=1)[:, -1]
+        return mu, hi
+
+
+def compile_surrogate(model: Any) -> CompiledSurrogate:
+    """Compile a fitted SurrogateModel (raises ValueError for ensembles that cannot be compiled)."""
+    if model.mu_model is None or model.hi_model is None:
+        raise ValueError("SurrogateModel is not fitted.")
+    return CompiledSurrogate(model.scaler, model.mu_model, model.hi_model)
@@ -9,39 +9,37 @@ import json
 import sys
 import numpy as np
 from pathlib import Path
-from collections import defaultdict
 from sklearn.metrics import r2_score, mean_absolute_error, mean_squared_error
 
 # 添加项目路径
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from codon_verifier.surrogate import SurrogateModel, build_feature_vector
+from codon_verifier.surrogate import get_surrogate
 from codon_verifier.hosts.tables import HOST_TABLES
-from codon_verifier.data_loader import DataLoader, DataConfig
+from codon_verifier.data_loader import DataConfig
+from codon_verifier.train_surrogate_multihost import build_unified_features
 
 
-def diagnose_model(model_path: str, data_path: str, output_path: str = None):
+def diagnose_model(model_path: str, data_path: str, output_path: str = None, cache_dir: str = None):
     """
-    诊断模型在各宿主上的性能
+    诊断模型在各宿主上的性能（传入 cache_dir 时复用缓存的特征矩阵）
     """
     print(f"加载模型: {model_path}")
-    model = SurrogateModel.load(model_path)
+    model = get_surrogate(model_path)
     
     print(f"加载数据: {data_path}")
-    loader = DataLoader(DataConfig())
-    records = loader.load_and_mix([data_path], target_hosts=None, total_samples=None)
+    features = build_unified_features([data_path], DataConfig(), cache_dir=cache_dir)
     
-    print(f"总样本数: {len(records)}")
+    print(f"总样本数: {len(features.y)}")
     
-    # 按宿主分组
-    host_records = defaultdict(list)
-    for r in records:
-        host = r.get('host', 'unknown')
-        host_records[host].append(r)
+    # 按宿主分组（特征列按模型的 feature_keys 对齐）
+    hosts, counts = np.unique(features.hosts, return_counts=True)
+    host_counts = dict(zip(hosts.tolist(), counts.tolist()))
+    col = {k: j for j, k in enumerate(features.feature_keys)}
     
     print(f"\n宿主分布:")
-    for host, recs in sorted(host_records.items(), key=lambda x: -len(x[1])):
-        print(f"  {host:20s}: {len(recs):6d} 样本")
+    for host, n in sorted(host_counts.items(), key=lambda x: -x[1]):
+        print(f"  {host:20s}: {n:6d} 样本")
     
     # 分宿主评估
     results = {}
@@ -49,13 +47,13 @@ def diagnose_model(model_path: str, data_path: str, output_path: str = None):
     print("分宿主性能评估")
     print(f"{'='*70}")
     
-    for host in sorted(host_records.keys()):
-        recs = host_records[host]
-        if len(recs) < 10:
-            print(f"\n{host}: 样本太少 ({len(recs)}), 跳过")
+    for host in sorted(host_counts.keys()):
+        n = host_counts[host]
+        if n < 10:
+            print(f"\n{host}: 样本太少 ({n}), 跳过")
             continue
         
-        print(f"\n{host} ({len(recs)} 样本)")
+        print(f"\n{host} ({n} 样本)")
         print("-" * 70)
         
         # 获取宿主表
@@ -63,30 +61,15 @@ def diagnose_model(model_path: str, data_path: str, output_path: str = None):
             print(f"  ⚠️  无宿主表，跳过")
             continue
         
-        usage, trna_w = HOST_TABLES[host]
-        
-        # 构建特征和目标
-        X = []
-        y_true = []
-        for r in recs:
-            try:
-                dna = r['sequence']
-                extra = r.get('extra_features')
-                vec, _ = build_feature_vector(dna, usage, trna_w=trna_w, extra_features=extra)
-                X.append(vec)
-                
-                expr = r.get('expression', {})
-                y_val = float(expr.get('value', 0) if isinstance(expr, dict) else expr)
-                y_true.append(y_val)
-            except Exception as e:
-                continue
-        
-        if len(y_true) < 10:
-            print(f"  ⚠️  有效样本太少 ({len(y_true)}), 跳过")
-            continue
-        
-        X = np.vstack(X)
-        y_true = np.array(y_true)
+        # 特征和目标
+        rows = features.hosts == host
+        X_host = features.X[rows]
+        # 缓存中的训练特征为 float32；推理统一使用 float64
+        X = np.zeros((len(X_host), len(model.feature_keys)), dtype=np.float64)
+        for j, k in enumerate(model.feature_keys):
+            if k in col:
+                X[:, j] = X_host[:, col[k]]
+        y_true = features.y[rows]
         
         # 预测
         mu_pred, sigma_pred = model.predict_mu_sigma(X)
@@ -158,11 +141,12 @@ def main():
     parser.add_argument('--model', required=True, help='训练好的模型路径 (.pkl)')
     parser.add_argument('--data', required=True, help='数据文件路径 (.jsonl)')
     parser.add_argument('--output', help='输出结果JSON路径（可选）')
+    parser.add_argument('--cache-dir', help='特征缓存目录（可选；数据、过滤条件与特征版本不变时直接内存映射特征矩阵）')
     
     args = parser.parse_args()
     
     try:
-        diagnose_model(args.model, args.data, args.output)
+        diagnose_model(args.model, args.data, args.output, cache_dir=args.cache_dir)
     except Exception as e:
         print(f"\n❌ 错误: {e}", file=sys.stderr)
         import traceback
@@ -66,6 +66,9 @@ def process_training_task(task_data: Dict[str, Any]) -> Dict[str, Any]:
         # Training parameters
         target_hosts = config.get('target_hosts')
         max_samples = config.get('max_samples')
+        workers = config.get('workers', 1)
+        # Featurized datasets are reused across tasks with the same data, filters and featurizer version
+        cache_dir = config.get('feature_cache_dir', '/data/cache/features')
         
         # Validate data paths
         for path in data_paths:
@@ -81,7 +84,9 @@ def process_training_task(task_data: Dict[str, Any]) -> Dict[str, Any]:
                 data_config=data_config,
                 surrogate_config=surrogate_config,
                 target_hosts=target_hosts,
-                max_samples=max_samples
+                max_samples=max_samples,
+                workers=workers,
+                cache_dir=cache_dir
             )
         elif mode == 'host-specific':
             logger.info("Training host-specific models...")
@@ -91,7 +96,9 @@ def process_training_task(task_data: Dict[str, Any]) -> Dict[str, Any]:
                 output_dir=output_dir,
                 data_config=data_config,
                 surrogate_config=surrogate_config,
-                target_hosts=target_hosts
+                target_hosts=target_hosts,
+                workers=workers,
+                cache_dir=cache_dir
             )
         else:
             raise ValueError(f"Unknown training mode: {mode}")
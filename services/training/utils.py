@@ -52,7 +52,9 @@ def create_default_config() -> Dict[str, Any]:
                 "test_size": 0.15
             },
             "target_hosts": None,
-            "max_samples": None
+            "max_samples": None,
+            "workers": 1,
+            "feature_cache_dir": "/data/cache/features"
         },
         "metadata": {
             "request_id": "training_001",
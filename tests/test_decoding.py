@@ -0,0 +1,48 @@
+import math
+
+import pytest
+
+from codon_verifier.codon_utils import AA_TO_CODONS, CODON_TO_AA, chunk_codons
+from codon_verifier.codontransformer_adapter import generate_sequences
+from codon_verifier.context import ScoringContext
+from codon_verifier.decoding import beam_decode
+from codon_verifier.hosts.tables import E_COLI_USAGE
+from codon_verifier.metrics import cai, codon_pair_bias_score, gc_content, gc_target_term
+
+AA = "MKTAYIAKQRQISFVKSHFSRQLEERLGLIEVQ"
+CPB = {"AAA-ACC": 0.4, "CTG-GAA": -0.3, "CAG-TAA": 0.2, "GAA-CGT": 0.1}
+
+
+def _log_p(codon: str) -> float:
+    family = AA_TO_CODONS[CODON_TO_AA[codon]]
+    u = {c: max(1e-9, E_COLI_USAGE.get(c, 1e-9)) for c in family}
+    return math.log(u[codon] / sum(u.values()))
+
+
+def _objective(dna: str, ctx: ScoringContext) -> float:
+    """beam_decode's J with unit weights, recomputed from metrics (terminal stop excluded from CAI)."""
+    codons = chunk_codons(dna)
+    sense = "".join(c for c in codons if CODON_TO_AA[c] != "*")
+    return (
+        sum(_log_p(c) for c in codons)
+        + math.log(cai(sense, context=ctx))
+        + codon_pair_bias_score(dna, context=ctx)
+        + gc_target_term(gc_content(dna))
+    )
+
+
+@pytest.mark.parametrize("aa", [AA, AA + "*"])
+def test_beam_score_matches_metrics(aa):
+    ctx = ScoringContext(E_COLI_USAGE, cpb=CPB)
+    results = beam_decode(aa, context=ctx, beam_width=16, n=4)
+    assert len(results) == 4
+    for r in results:
+        assert len(r.dna) == 3 * len(aa)
+        assert r.score == pytest.approx(_objective(r.dna, ctx), abs=1e-9)
+    assert [r.score for r in results] == sorted((r.score for r in results), reverse=True)
+
+
+def test_beam_accepts_trailing_stop():
+    seqs = generate_sequences(AA + "*", "E_coli", 3, method="BEAM")
+    assert len(seqs) == 3
+    assert all(CODON_TO_AA[s[-3:]] == "*" for s in seqs)
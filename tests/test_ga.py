@@ -0,0 +1,10 @@
+from codon_verifier.ga import GAConfig, run_ga
+
+AA = "MKTAYIAKQRQISFVKSHFSRQLEERLGLIEVQ"
+
+
+def test_in_process_scorer_follows_config():
+    small = dict(islands=1, population=8, seed=0)
+    run_ga(AA, GAConfig(w_rules=1.0, **small), max_generations=2)
+    res = run_ga(AA, GAConfig(w_rules=0.0, **small), max_generations=2)
+    assert res.best_reward == 0.0
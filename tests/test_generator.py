@@ -0,0 +1,14 @@
+from codon_verifier.generator import generate_candidates
+
+AA = "MKTAYIAKQRQISFVKSHFSRQLEERLGLIEVQ"
+
+
+def test_dp_returns_n_distinct_candidates():
+    cands = generate_candidates(AA, "E_coli", 150, source="ct", method="DP", seed=0)
+    assert len(cands) == 150
+    assert len(set(cands)) == 150
+
+
+def test_beam_returns_n_distinct_candidates():
+    cands = generate_candidates(AA, "E_coli", 150, source="ct", method="BEAM", seed=0)
+    assert len(cands) == 150
@@ -0,0 +1,19 @@
+import math
+
+import pytest
+
+from codon_verifier.grpo_train import group_relative_advantages
+
+
+def test_finite_rewards_are_standardised():
+    advs = group_relative_advantages([1.0, 2.0, 3.0])
+    assert sum(advs) == pytest.approx(0.0)
+    assert advs[2] == pytest.approx(-advs[0]) == pytest.approx(math.sqrt(1.5))
+
+
+def test_non_finite_rewards_get_a_finite_advantage_below_the_group():
+    advs = group_relative_advantages([1.0, 2.0, float("-inf")])
+    assert all(math.isfinite(a) for a in advs)
+    assert advs[:2] == pytest.approx(group_relative_advantages([1.0, 2.0]))
+    assert advs[2] < min(advs[:2])
+    assert all(math.isfinite(a) for a in group_relative_advantages([float("-inf")] * 3))
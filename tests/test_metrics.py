@@ -0,0 +1,17 @@
+import pytest
+
+from codon_verifier.context import ScoringContext
+from codon_verifier.hosts.tables import E_COLI_TRNA, E_COLI_USAGE
+from codon_verifier.metrics import cai, rare_codon_runs, tai
+
+DNA = "ATGAGGAGGAGGCTAAAACTG"
+FLAT_USAGE = {c: 1.0 for c in E_COLI_USAGE}
+FLAT_TRNA = {c: 1.0 for c in E_COLI_TRNA}
+
+
+def test_explicit_tables_take_precedence_over_context():
+    ctx = ScoringContext(E_COLI_USAGE, E_COLI_TRNA)
+    assert cai(DNA, FLAT_USAGE, context=ctx) == pytest.approx(cai(DNA, FLAT_USAGE))
+    assert tai(DNA, FLAT_TRNA, context=ctx) == pytest.approx(tai(DNA, FLAT_TRNA))
+    assert rare_codon_runs(DNA, FLAT_USAGE, context=ctx) == rare_codon_runs(DNA, FLAT_USAGE)
+    assert cai(DNA, context=ctx) == pytest.approx(cai(DNA, E_COLI_USAGE))
@@ -0,0 +1,39 @@
+import warnings
+
+import numpy as np
+import pytest
+
+from codon_verifier.surrogate import SurrogateConfig, SurrogateModel
+
+
+def _fit(X, y, **cfg):
+    m = SurrogateModel(feature_keys=[f"f{j}" for j in range(X.shape[1])], cfg=SurrogateConfig(**cfg))
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        m.fit(X, y)
+    return m
+
+
+def test_stump_only_model_predicts_like_the_regular_path():
+    rng = np.random.default_rng(0)
+    X = rng.random((40, 6))
+    m = _fit(X, np.full(40, 175.0), n_estimators=20)
+    mu, sigma = m.predict_mu_sigma(X[:3])
+    ref_mu, ref_sigma = m.predict_mu_sigma(X[:3], compiled=False)
+    assert np.array_equal(mu, ref_mu) and np.array_equal(sigma, ref_sigma)
+    assert mu == pytest.approx([175.0] * 3)
+
+
+def test_compiled_and_plain_outputs_are_identical():
+    rng = np.random.default_rng(1)
+    X = rng.normal(size=(400, 8)) * rng.uniform(0.1, 50.0, size=8)
+    y = X[:, 0] - 0.3 * X[:, 1] ** 2 / 50.0 + rng.normal(size=400)
+    m = _fit(X, y, n_estimators=60)
+    assert m.compiled() is not None
+    # training points, points just either side of them and float32 inputs
+    probes = [X, np.nextafter(X, np.inf), np.nextafter(X, -np.inf), X.astype(np.float32)]
+    for P in probes:
+        mu, sigma = m.predict_mu_sigma(P)
+        ref_mu, ref_sigma = m.predict_mu_sigma(P, compiled=False)
+        assert np.array_equal(mu, ref_mu)
+        assert np.array_equal(sigma, ref_sigma)